@@ -0,0 +1,299 @@
+"""Benchmark des endpoints chauds, comparé à une baseline.
+
+Pour chaque scénario (login, estimate, création de course, position chauffeur,
+courses chauffeur, nearby-drivers, stats superadmin, wallet): débit, p50/p95/p99 et
+nombre d'appels base par requête (lu dans l'en-tête Server-Timing).
+
+Par défaut le backend tourne dans ce process avec la base en mémoire
+(TAPTAPGO_FAKE_SUPABASE=1, benchmarks/seed.json) et sans rate limiting: aucun réseau,
+résultats reproductibles. --base-url vise un serveur déjà lancé avec le même seed.
+
+Exemples:
+    python benchmarks/endpoints.py                          # compare à benchmarks/baseline.json
+    python benchmarks/endpoints.py --db-latency-ms 5        # simule l'aller-retour PostgREST
+    python benchmarks/endpoints.py --only login,estimate --output /tmp/bench.json
+    python benchmarks/endpoints.py --update-baseline        # après une amélioration voulue
+
+Code de sortie 1 si un scénario régresse: p95 au-delà de --tolerance (et de plus de
+--noise-ms), plus d'appels base par requête, ou plus d'erreurs que la baseline.
+Les latences dépendent de la machine: comparer sur la même machine que la baseline.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import re
+import statistics
+import sys
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Union
+
+try:
+    import httpx
+except ImportError:
+    print("Pip install httpx d'abord: pip install httpx")
+    sys.exit(1)
+
+from login_storm import percentile
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+DEFAULT_BASELINE = Path(__file__).resolve().parent / "baseline.json"
+SEED_PASSWORD = "password123"
+PICKUP = (18.5392, -72.3364)  # Port-au-Prince
+DESTINATION = (18.5125, -72.2853)
+
+SERVER_TIMING_QUERIES = re.compile(r'desc="(\d+) queries"')
+
+Value = Union[Any, Callable[[Dict[str, Any], int], Any]]
+
+
+@dataclass
+class Scenario:
+    name: str
+    method: str
+    path: Value
+    role: Optional[str] = None  # compte dont le token est envoyé (passenger, driver, superadmin)
+    body: Value = None
+    params: Value = None
+
+
+def _resolve(value: Value, ctx: Dict[str, Any], i: int) -> Any:
+    return value(ctx, i) if callable(value) else value
+
+
+def _ride_body(ctx: Dict[str, Any], i: int) -> Dict[str, Any]:
+    return {
+        "pickup_lat": PICKUP[0], "pickup_lng": PICKUP[1], "pickup_address": "Champ de Mars",
+        "destination_lat": DESTINATION[0], "destination_lng": DESTINATION[1], "destination_address": "Pétion-Ville",
+        "vehicle_type": "moto", "estimated_distance": 6.2, "estimated_duration": 18, "estimated_price": 250,
+    }
+
+
+SCENARIOS = [
+    Scenario("login", "POST", "/api/auth/login", body=lambda ctx, i: {
+        "phone_or_email": f"passenger{i % 5 + 1}@taptapgo.test", "password": SEED_PASSWORD, "user_type": "passenger",
+    }),
+    Scenario("nearby_drivers", "GET", "/api/rides/nearby-drivers", params={
+        "lat": PICKUP[0], "lng": PICKUP[1], "vehicle_type": "moto", "city": "Port-au-Prince",
+    }),
+    Scenario("estimate", "POST", "/api/rides/estimate", role="passenger", body=_ride_body),
+    Scenario("create_ride", "POST", "/api/rides", role="passenger", body=_ride_body),
+    Scenario("driver_location", "PUT", lambda ctx, i: f"/api/drivers/{ctx['driver_id']}/location", role="driver",
+             body=lambda ctx, i: {"lat": PICKUP[0] + (i % 50) * 0.0001, "lng": PICKUP[1]}),
+    Scenario("driver_rides", "GET", "/api/rides", role="driver"),
+    Scenario("superadmin_stats", "GET", "/api/superadmin/stats", role="superadmin"),
+    Scenario("wallet", "GET", "/api/wallet", role="driver"),
+]
+
+
+def summarize_run(latencies: List[float], statuses: Dict[str, int], db_calls: List[int], elapsed: float) -> Dict[str, Any]:
+    errors = sum(n for code, n in statuses.items() if not code.startswith("2"))
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput_rps": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 50), 2),
+        "p95_ms": round(percentile(latencies, 95), 2),
+        "p99_ms": round(percentile(latencies, 99), 2),
+        "mean_ms": round(statistics.fmean(latencies), 2) if latencies else 0.0,
+        "db_calls_per_request": round(statistics.fmean(db_calls), 2) if db_calls else None,
+        "statuses": dict(sorted(statuses.items())),
+    }
+
+
+async def login(client: "httpx.AsyncClient", identifier: str, user_type: str) -> Dict[str, Any]:
+    r = await client.post("/api/auth/login", json={
+        "phone_or_email": identifier, "password": SEED_PASSWORD, "user_type": user_type,
+    })
+    r.raise_for_status()
+    return r.json()
+
+
+async def build_context(client: "httpx.AsyncClient") -> Dict[str, Any]:
+    passenger = await login(client, "passenger1@taptapgo.test", "passenger")
+    driver = await login(client, "driver1@taptapgo.test", "driver")
+    superadmin = await login(client, "superadmin@taptapgo.test", "superadmin")
+    return {
+        "tokens": {
+            "passenger": passenger["token"],
+            "driver": driver["token"],
+            "superadmin": superadmin["token"],
+        },
+        "driver_id": driver["user"]["id"],
+    }
+
+
+async def run_scenario(client: "httpx.AsyncClient", scenario: Scenario, ctx: Dict[str, Any], args: argparse.Namespace) -> Dict[str, Any]:
+    headers = {}
+    if scenario.role:
+        headers["Authorization"] = f"Bearer {ctx['tokens'][scenario.role]}"
+    latencies: List[float] = []
+    db_calls: List[int] = []
+    statuses: Dict[str, int] = {}
+    counter = iter(range(args.warmup + args.requests))
+    measured_from: List[float] = []  # début de la première requête mesurée (débit hors chauffe)
+
+    async def worker() -> None:
+        for i in counter:
+            start = time.perf_counter()
+            if i == args.warmup:
+                measured_from.append(start)
+            try:
+                r = await client.request(
+                    scenario.method,
+                    _resolve(scenario.path, ctx, i),
+                    json=_resolve(scenario.body, ctx, i),
+                    params=_resolve(scenario.params, ctx, i),
+                    headers=headers,
+                )
+                code = str(r.status_code)
+            except httpx.HTTPError as e:
+                r, code = None, type(e).__name__
+            if i < args.warmup:
+                continue
+            latencies.append((time.perf_counter() - start) * 1000)
+            statuses[code] = statuses.get(code, 0) + 1
+            match = SERVER_TIMING_QUERIES.search(r.headers.get("server-timing", "")) if r is not None else None
+            if match:
+                db_calls.append(int(match.group(1)))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    elapsed = time.perf_counter() - (measured_from[0] if measured_from else started)
+    return summarize_run(latencies, statuses, db_calls, elapsed)
+
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], tolerance: float, noise_ms: float) -> List[str]:
+    """Lignes de régression (vide = OK)."""
+    regressions = []
+    for name, current in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        limit = base["p95_ms"] * (1 + tolerance)
+        if current["p95_ms"] > limit and current["p95_ms"] - base["p95_ms"] > noise_ms:
+            regressions.append(f"{name}: p95 {current['p95_ms']}ms > baseline {base['p95_ms']}ms (+{tolerance:.0%})")
+        base_calls, calls = base.get("db_calls_per_request"), current.get("db_calls_per_request")
+        if base_calls is not None and calls is not None and calls > base_calls + 0.5:
+            regressions.append(f"{name}: {calls} appels base/requête > baseline {base_calls}")
+        if current["errors"] > base.get("errors", 0):
+            regressions.append(f"{name}: {current['errors']} erreurs > baseline {base.get('errors', 0)} ({current['statuses']})")
+    return regressions
+
+
+def print_table(results: Dict[str, Any], baseline: Dict[str, Any]) -> None:
+    print(f"\n{'scénario':<18}{'req/s':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'db/req':>8}{'err':>6}   baseline p95 / db")
+    for name, r in results.items():
+        base = baseline.get(name) or {}
+        ref = f"{base.get('p95_ms', '-')} / {base.get('db_calls_per_request', '-')}" if base else "-"
+        print(f"{name:<18}{r['throughput_rps']:>9}{r['p50_ms']:>9}{r['p95_ms']:>9}{r['p99_ms']:>9}"
+              f"{str(r['db_calls_per_request']):>8}{r['errors']:>6}   {ref}")
+
+
+def in_process_client(args: argparse.Namespace):
+    """Backend importé dans ce process, base en mémoire, sans rate limiting."""
+    os.environ["TAPTAPGO_FAKE_SUPABASE"] = "1"
+    os.environ["TAPTAPGO_FAKE_SUPABASE_LATENCY_MS"] = str(args.db_latency_ms)
+    os.environ["TAPTAPGO_RATE_LIMIT_ENABLED"] = "0"
+    os.environ.setdefault("JWT_SECRET", "benchmark-secret-not-for-production")
+    sys.path.insert(0, str(BACKEND_DIR))
+    os.chdir(BACKEND_DIR)
+    import server  # noqa: E402  (après la configuration de l'environnement)
+
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    transport = httpx.ASGITransport(app=server.app)
+    return server.app, httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=httpx.Timeout(60.0))
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    scenarios = [s for s in SCENARIOS if not args.only or s.name in args.only]
+    if args.base_url:
+        app = None
+        client = httpx.AsyncClient(
+            base_url=args.base_url, timeout=httpx.Timeout(60.0),
+            limits=httpx.Limits(max_connections=args.concurrency + 5),
+        )
+    else:
+        app, client = in_process_client(args)
+
+    results: Dict[str, Any] = {}
+    async with client:
+        lifespan = app.router.lifespan_context(app) if app is not None else None
+        if lifespan is not None:
+            await lifespan.__aenter__()
+        try:
+            ctx = await build_context(client)
+            for scenario in scenarios:
+                results[scenario.name] = await run_scenario(client, scenario, ctx, args)
+                print(f"  {scenario.name}: p95 {results[scenario.name]['p95_ms']}ms", flush=True)
+        finally:
+            if lifespan is not None:
+                await lifespan.__aexit__(None, None, None)
+
+    return {
+        "meta": {
+            "created_at": datetime.utcnow().isoformat(),
+            "target": args.base_url or "in-process",
+            "db_latency_ms": args.db_latency_ms if not args.base_url else None,
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+        },
+        "results": results,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark des endpoints chauds avec comparaison à une baseline")
+    parser.add_argument("--base-url", help="Serveur déjà lancé (défaut: backend dans ce process, base en mémoire)")
+    parser.add_argument("--db-latency-ms", type=float, default=0.0, help="Latence simulée par appel base (mode in-process)")
+    parser.add_argument("--requests", type=int, default=200, help="Requêtes mesurées par scénario")
+    parser.add_argument("--warmup", type=int, default=20, help="Requêtes de chauffe non mesurées")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--only", type=lambda s: [x.strip() for x in s.split(",") if x.strip()], help="Scénarios (séparés par des virgules)")
+    parser.add_argument("--output", type=Path, help="Fichier JSON des résultats")
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument("--update-baseline", action="store_true", help="Écrit les résultats dans la baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Hausse de p95 tolérée (0.25 = +25%%)")
+    parser.add_argument("--noise-ms", type=float, default=2.0, help="Écart de p95 ignoré en dessous (ms)")
+    args = parser.parse_args()
+    if args.only:
+        unknown = set(args.only) - {s.name for s in SCENARIOS}
+        if unknown:
+            parser.error(f"scénarios inconnus: {', '.join(sorted(unknown))}")
+
+    report = asyncio.run(run(args))
+    baseline = {}
+    if args.baseline.is_file():
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f).get("results", {})
+
+    print_table(report["results"], baseline)
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+        print(f"\nRésultats: {args.output}")
+
+    if args.update_baseline:
+        args.baseline.write_text(json.dumps(report, indent=2, ensure_ascii=False) + "\n", encoding="utf-8")
+        print(f"Baseline mise à jour: {args.baseline}")
+        return
+    if not baseline:
+        print(f"\nPas de baseline ({args.baseline}): relancer avec --update-baseline pour l'enregistrer")
+        return
+    regressions = compare(report["results"], baseline, args.tolerance, args.noise_ms)
+    if regressions:
+        print("\nRégressions:")
+        for line in regressions:
+            print(f"  - {line}")
+        sys.exit(1)
+    print("\nAucune régression par rapport à la baseline")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+"""Temps de démarrage du backend: import de server.py et lifespan, comparés à une baseline.
+
+Chaque mesure tourne dans un process neuf (python -X importtime), avec la base en mémoire
+(TAPTAPGO_FAKE_SUPABASE=1): pas de réseau, seul le coût du code est mesuré.
+
+Vérifie aussi que les sous-systèmes rarement utilisés ne sont pas chargés par
+"import server" (client supabase, SMTP, chaîne de build APK): ils doivent rester
+importés à la demande.
+
+Exemples:
+    python benchmarks/import_time.py                    # compare à benchmarks/import_baseline.json
+    python benchmarks/import_time.py --runs 10 --top 25
+    python benchmarks/import_time.py --update-baseline  # après une amélioration voulue
+
+Code de sortie 1 si l'import ou le démarrage dépasse la baseline de plus de --tolerance
+(et de plus de --noise-ms), ou si un module paresseux est chargé à l'import.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+DEFAULT_BASELINE = Path(__file__).resolve().parent / "import_baseline.json"
+
+# Modules qui ne doivent pas être chargés par "import server"
+LAZY_MODULES = (
+    "supabase",
+    "postgrest",
+    "smtplib",
+    "email.mime.multipart",
+    "services.build_service",
+)
+
+CHILD = r"""
+import asyncio, json, sys, time
+t0 = time.perf_counter()
+import server
+import_ms = (time.perf_counter() - t0) * 1000
+loaded = [m for m in LAZY if m in sys.modules]
+
+async def boot():
+    t = time.perf_counter()
+    async with server.app.router.lifespan_context(server.app):
+        return (time.perf_counter() - t) * 1000
+
+startup_ms = asyncio.run(boot())
+print("@@" + json.dumps({"import_ms": import_ms, "startup_ms": startup_ms, "lazy_loaded": loaded}))
+"""
+
+
+def run_once() -> Tuple[Dict[str, Any], str]:
+    env = {
+        **os.environ,
+        "TAPTAPGO_FAKE_SUPABASE": "1",
+        "TAPTAPGO_RATE_LIMIT_ENABLED": "0",
+    }
+    env.setdefault("JWT_SECRET", "import-benchmark-secret-not-for-production")
+    code = f"LAZY = {list(LAZY_MODULES)!r}\n{CHILD}"
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True, timeout=120,
+    )
+    line = next((l for l in proc.stdout.splitlines() if l.startswith("@@")), None)
+    if proc.returncode != 0 or line is None:
+        raise RuntimeError(f"Import failed (code {proc.returncode}):\n{proc.stderr[-2000:]}")
+    return json.loads(line[2:]), proc.stderr
+
+
+def parse_importtime(stderr: str) -> List[Tuple[str, int, int]]:
+    """Lignes "import time: self | cumulative | module" -> (module, self_us, cumulative_us)."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        try:
+            _, rest = line.split(":", 1)
+            self_us, cumulative_us, name = rest.split("|", 2)
+            rows.append((name.strip(), int(self_us), int(cumulative_us)))
+        except ValueError:
+            continue
+    return rows
+
+
+def measure(runs: int, top: int) -> Dict[str, Any]:
+    samples, stderr = [], ""
+    # Premier lancement: compile les .pyc, non compté
+    run_once()
+    for _ in range(runs):
+        result, stderr = run_once()
+        samples.append(result)
+    modules = parse_importtime(stderr)
+    top_self = sorted(modules, key=lambda m: m[1], reverse=True)[:top]
+    top_packages: Dict[str, int] = {}
+    for name, _, cumulative in modules:
+        # Coût cumulé des paquets de premier niveau (fastapi, jwt, pydantic...)
+        if "." not in name:
+            top_packages[name] = max(top_packages.get(name, 0), cumulative)
+    return {
+        "import_ms": round(statistics.median(s["import_ms"] for s in samples), 1),
+        "startup_ms": round(statistics.median(s["startup_ms"] for s in samples), 1),
+        "lazy_loaded": sorted({m for s in samples for m in s["lazy_loaded"]}),
+        "top_modules_self_ms": [{"module": n, "self_ms": round(s / 1000, 1)} for n, s, _ in top_self],
+        "top_packages_ms": {
+            n: round(c / 1000, 1) for n, c in sorted(top_packages.items(), key=lambda kv: kv[1], reverse=True)[:top]
+        },
+    }
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], tolerance: float, noise_ms: float) -> List[str]:
+    problems = [f"{m} chargé par import server (doit rester paresseux)" for m in current["lazy_loaded"]]
+    for key in ("import_ms", "startup_ms"):
+        base = baseline.get(key)
+        if base is None:
+            continue
+        limit = base * (1 + tolerance)
+        if current[key] > limit and current[key] - base > noise_ms:
+            problems.append(f"{key}: {current[key]}ms > baseline {base}ms (+{tolerance:.0%})")
+    return problems
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Temps d'import et de démarrage du backend")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15, help="Modules les plus lents affichés")
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument("--update-baseline", action="store_true", help="Écrit les résultats dans la baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Hausse tolérée (0.25 = +25%%)")
+    parser.add_argument("--noise-ms", type=float, default=30.0, help="Écart ignoré en dessous de ce seuil")
+    parser.add_argument("--output", type=Path, help="Fichier JSON des résultats")
+    args = parser.parse_args()
+
+    current = measure(args.runs, args.top)
+    baseline = {}
+    if args.baseline.is_file():
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f).get("results", {})
+
+    print(f"import server: {current['import_ms']} ms (baseline {baseline.get('import_ms', '-')})")
+    print(f"lifespan startup: {current['startup_ms']} ms (baseline {baseline.get('startup_ms', '-')})")
+    print("\nModules (temps propre):")
+    for m in current["top_modules_self_ms"]:
+        print(f"  {m['self_ms']:>8.1f} ms  {m['module']}")
+    print("\nPaquets (temps cumulé):")
+    for name, ms in current["top_packages_ms"].items():
+        print(f"  {ms:>8.1f} ms  {name}")
+
+    report = {
+        "generated_at": datetime.utcnow().isoformat() + "Z",
+        "machine": {"python": platform.python_version(), "platform": platform.platform()},
+        "config": {"runs": args.runs},
+        "results": current,
+    }
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2, ensure_ascii=False) + "\n", encoding="utf-8")
+    if args.update_baseline:
+        args.baseline.write_text(json.dumps(report, indent=2, ensure_ascii=False) + "\n", encoding="utf-8")
+        print(f"\nBaseline mise à jour: {args.baseline}")
+        return
+
+    problems = compare(current, baseline, args.tolerance, args.noise_ms)
+    if not baseline:
+        print(f"\nPas de baseline ({args.baseline}): relancer avec --update-baseline pour l'enregistrer")
+    if problems:
+        print("\nRégressions:")
+        for p in problems:
+            print(f"  - {p}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
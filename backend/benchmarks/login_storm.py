@@ -0,0 +1,152 @@
+"""Benchmark "login storm": latence des endpoints non liés pendant une rafale de logins.
+
+Lance N clients qui appellent POST /api/auth/login en boucle (bcrypt à chaque appel)
+pendant que des sondes appellent des endpoints légers (GET /api/health par défaut).
+Affiche p50/p95/p99 des sondes avant et pendant la rafale.
+
+Exemple:
+    python benchmarks/login_storm.py --base-url http://localhost:8000 \\
+        --identifier bench@example.com --password secret123 --user-type passenger
+
+Avec --register, un passager jetable est créé avant la rafale.
+"""
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+import uuid
+from typing import Dict, List
+
+try:
+    import httpx
+except ImportError:
+    print("Pip install httpx d'abord: pip install httpx")
+    sys.exit(1)
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * len(ordered) + 0.5)) - 1))
+    return ordered[k]
+
+
+def summarize(values: List[float]) -> Dict[str, float]:
+    return {
+        "count": len(values),
+        "p50_ms": round(percentile(values, 50), 2),
+        "p95_ms": round(percentile(values, 95), 2),
+        "p99_ms": round(percentile(values, 99), 2),
+        "max_ms": round(max(values), 2) if values else 0.0,
+        "mean_ms": round(statistics.fmean(values), 2) if values else 0.0,
+    }
+
+
+async def probe(client: "httpx.AsyncClient", paths: List[str], stop: asyncio.Event, out: List[float], interval: float):
+    i = 0
+    while not stop.is_set():
+        path = paths[i % len(paths)]
+        i += 1
+        start = time.perf_counter()
+        try:
+            await client.get(path)
+        except httpx.HTTPError:
+            pass
+        out.append((time.perf_counter() - start) * 1000)
+        await asyncio.sleep(interval)
+
+
+async def login_loop(client: "httpx.AsyncClient", payload: dict, stop: asyncio.Event, stats: Dict[str, int], latencies: List[float]):
+    while not stop.is_set():
+        start = time.perf_counter()
+        try:
+            r = await client.post("/api/auth/login", json=payload)
+            key = str(r.status_code)
+        except httpx.HTTPError as e:
+            key = type(e).__name__
+        latencies.append((time.perf_counter() - start) * 1000)
+        stats[key] = stats.get(key, 0) + 1
+
+
+async def register_passenger(client: "httpx.AsyncClient", password: str) -> str:
+    suffix = uuid.uuid4().hex[:10]
+    email = f"bench-{suffix}@example.com"
+    r = await client.post("/api/auth/register/passenger", json={
+        "full_name": "Bench Login Storm",
+        "phone": f"+509{int(suffix, 16) % 10**8:08d}",
+        "email": email,
+        "city": "Port-au-Prince",
+        "password": password,
+    })
+    r.raise_for_status()
+    return email
+
+
+async def run(args: argparse.Namespace) -> None:
+    timeout = httpx.Timeout(30.0)
+    limits = httpx.Limits(max_connections=args.concurrency + 10)
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=timeout, limits=limits) as client:
+        identifier = args.identifier
+        if args.register:
+            identifier = await register_passenger(client, args.password)
+            print(f"Passager de test: {identifier}")
+        if not identifier:
+            print("--identifier ou --register requis")
+            sys.exit(2)
+        payload = {"phone_or_email": identifier, "password": args.password, "user_type": args.user_type}
+
+        # 1) Référence: sondes seules
+        stop = asyncio.Event()
+        baseline: List[float] = []
+        task = asyncio.create_task(probe(client, args.probe, stop, baseline, args.probe_interval))
+        await asyncio.sleep(args.warmup)
+        stop.set()
+        await task
+
+        # 2) Rafale de logins + sondes
+        stop = asyncio.Event()
+        during: List[float] = []
+        login_latencies: List[float] = []
+        statuses: Dict[str, int] = {}
+        tasks = [asyncio.create_task(probe(client, args.probe, stop, during, args.probe_interval))]
+        tasks += [
+            asyncio.create_task(login_loop(client, payload, stop, statuses, login_latencies))
+            for _ in range(args.concurrency)
+        ]
+        started = time.perf_counter()
+        await asyncio.sleep(args.duration)
+        stop.set()
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - started
+
+    print(f"\nSondes {', '.join(args.probe)}")
+    print(f"  avant la rafale : {summarize(baseline)}")
+    print(f"  pendant         : {summarize(during)}")
+    total_logins = sum(statuses.values())
+    print(f"\nLogins ({args.concurrency} clients, {args.duration:.0f}s): {total_logins} appels, "
+          f"{total_logins / elapsed:.1f}/s, statuts {statuses}")
+    print(f"  latence login   : {summarize(login_latencies)}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Login storm: p99 des endpoints non liés pendant une rafale de logins")
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--identifier", help="Téléphone ou email d'un compte existant")
+    parser.add_argument("--password", default="BenchPass123!")
+    parser.add_argument("--user-type", default="passenger")
+    parser.add_argument("--register", action="store_true", help="Créer un passager jetable")
+    parser.add_argument("--concurrency", type=int, default=50, help="Clients login simultanés")
+    parser.add_argument("--duration", type=float, default=20.0, help="Durée de la rafale (s)")
+    parser.add_argument("--warmup", type=float, default=5.0, help="Durée de la mesure de référence (s)")
+    parser.add_argument("--probe", action="append", default=None, help="Endpoint sondé (répétable)")
+    parser.add_argument("--probe-interval", type=float, default=0.05)
+    args = parser.parse_args()
+    if not args.probe:
+        args.probe = ["/api/health", "/api/vehicles/brands"]
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,435 @@
+"""Simulateur d'heure de pointe: charge de dispatch avec des milliers de chauffeurs virtuels.
+
+Le backend tourne dans ce process sur la base en mémoire (TAPTAPGO_FAKE_SUPABASE=1),
+rate limiting coupé. Le simulateur ajoute --drivers chauffeurs en ligne et --passengers
+passagers autour du centre (Port-au-Prince par défaut), puis pendant --duration secondes:
+
+- chaque chauffeur envoie sa position (PUT /drivers/{id}/location) toutes les
+  --location-interval secondes et, libre, consulte GET /rides/pending-feed;
+- des passagers demandent des courses (POST /rides) selon un processus de Poisson
+  (--arrival-rate par seconde);
+- le chauffeur assigné (ou le plus proche via le feed) accepte, rejoint le passager,
+  puis arrived -> started -> completed. --time-scale accélère les trajets simulés
+  (30 = une minute de trajet dure 2 secondes).
+
+Rapport: latence de matching (demande -> course acceptée), distance de prise en charge,
+latences par endpoint, courses sans chauffeur, CPU / mémoire / lag de la boucle
+asyncio et appels base. Client et serveur partagent le process: les latences incluent
+le coût du simulateur, à comparer d'une version à l'autre sur la même machine.
+
+Exemples:
+    python benchmarks/rush_hour.py --drivers 2000 --passengers 1000 --arrival-rate 10 --duration 120
+    python benchmarks/rush_hour.py --db-latency-ms 5 --output /tmp/rush.json
+"""
+import argparse
+import asyncio
+import json
+import logging
+import math
+import os
+import random
+import statistics
+import sys
+import time
+import uuid
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    import httpx
+except ImportError:
+    print("Pip install httpx d'abord: pip install httpx")
+    sys.exit(1)
+
+try:
+    import resource  # absent sous Windows
+except ImportError:
+    resource = None
+
+from login_storm import percentile, summarize
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+CENTER = (18.5392, -72.3364)  # Port-au-Prince (Champ de Mars)
+CITY = "Port-au-Prince"
+SPEED_KMH = {"moto": 30.0, "car": 25.0}
+PICKUP_DISTANCE_BUCKETS = (0.5, 1.0, 2.0, 5.0, 10.0)
+
+
+def distance_km(a: Tuple[float, float], b: Tuple[float, float]) -> float:
+    lat1, lng1, lat2, lng2 = map(math.radians, (a[0], a[1], b[0], b[1]))
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    return 6371.0 * 2 * math.asin(math.sqrt(h))
+
+
+def random_point(center: Tuple[float, float], radius_km: float) -> Tuple[float, float]:
+    r = radius_km * math.sqrt(random.random())
+    theta = random.random() * 2 * math.pi
+    return (
+        center[0] + (r * math.cos(theta)) / 111.0,
+        center[1] + (r * math.sin(theta)) / (111.0 * math.cos(math.radians(center[0]))),
+    )
+
+
+@dataclass
+class VirtualDriver:
+    id: str
+    token: str
+    vehicle_type: str
+    position: Tuple[float, float]
+    busy: bool = False
+    inbox: "asyncio.Queue" = field(default_factory=asyncio.Queue)
+    feed_version: Optional[int] = None
+
+
+@dataclass
+class RideRequestInfo:
+    ride_id: str
+    passenger_id: str
+    pickup: Tuple[float, float]
+    destination: Tuple[float, float]
+    requested_at: float
+    auto_assigned: bool = False
+    assigned_driver: Optional[str] = None
+    accepted_at: Optional[float] = None
+    completed_at: Optional[float] = None
+    pickup_km: Optional[float] = None
+
+
+class Simulation:
+    def __init__(self, args: argparse.Namespace, server: Any, client: "httpx.AsyncClient"):
+        self.args = args
+        self.server = server
+        self.client = client
+        self.stop = asyncio.Event()
+        self.drivers: Dict[str, VirtualDriver] = {}
+        self.passengers: List[Tuple[str, str]] = []  # (id, token)
+        self.idle_passengers: List[Tuple[str, str]] = []
+        self.rides: Dict[str, RideRequestInfo] = {}
+        self.latencies: Dict[str, List[float]] = {}
+        self.statuses: Dict[str, Dict[str, int]] = {}
+        self.request_failures = 0
+        self.unmatched = 0
+        self.loop_lag: List[float] = []
+
+    # --- Données ---
+
+    def seed(self) -> None:
+        db = self.server.supabase._client
+        admin = db.rows("admins")[0]
+        drivers, passengers = [], []
+        for i in range(self.args.drivers):
+            vehicle_type = "moto" if random.random() < self.args.moto_share else "car"
+            lat, lng = random_point(CENTER, self.args.radius_km)
+            drivers.append({
+                "id": str(uuid.uuid4()), "full_name": f"Sim Chofè {i}", "phone": f"+5097{i:07d}",
+                "email": f"sim-driver-{i}@taptapgo.test", "city": CITY, "password_hash": "x",
+                "vehicle_type": vehicle_type, "vehicle_brand": "Sim", "vehicle_model": "Sim",
+                "plate_number": f"SIM-{i:06d}", "status": "approved", "is_online": True,
+                "is_verified": True, "is_active": True, "current_lat": lat, "current_lng": lng,
+                "rating": 5.0, "total_rides": 0, "wallet_balance": 0, "admin_id": admin["id"],
+            })
+        for i in range(self.args.passengers):
+            passengers.append({
+                "id": str(uuid.uuid4()), "full_name": f"Sim Pasaje {i}", "phone": f"+5098{i:07d}",
+                "email": f"sim-passenger-{i}@taptapgo.test", "city": CITY, "password_hash": "x",
+                "admin_id": admin["id"], "wallet_balance": 0, "is_verified": True, "is_active": True,
+            })
+        db.seed("drivers", drivers)
+        db.seed("passengers", passengers)
+        # Tokens émis directement (pas de bcrypt pour des milliers de comptes)
+        for row in drivers:
+            token = self.server.issue_token(row["id"], "driver", row["admin_id"], row=row)
+            self.drivers[row["id"]] = VirtualDriver(row["id"], token, row["vehicle_type"], (row["current_lat"], row["current_lng"]))
+        for row in passengers:
+            self.passengers.append((row["id"], self.server.issue_token(row["id"], "passenger", row["admin_id"], row=row)))
+        self.idle_passengers = list(self.passengers)
+
+    # --- HTTP ---
+
+    async def call(self, op: str, method: str, path: str, token: str, **kwargs) -> Optional["httpx.Response"]:
+        start = time.perf_counter()
+        try:
+            r = await self.client.request(method, path, headers={"Authorization": f"Bearer {token}"}, **kwargs)
+            code = str(r.status_code)
+        except httpx.HTTPError as e:
+            r, code = None, type(e).__name__
+        self.latencies.setdefault(op, []).append((time.perf_counter() - start) * 1000)
+        counts = self.statuses.setdefault(op, {})
+        counts[code] = counts.get(code, 0) + 1
+        if r is None or r.status_code >= 500:
+            self.request_failures += 1
+        return r
+
+    # --- Chauffeurs ---
+
+    async def send_location(self, driver: VirtualDriver) -> None:
+        await self.call("location", "PUT", f"/api/drivers/{driver.id}/location", driver.token,
+                        json={"lat": driver.position[0], "lng": driver.position[1]})
+
+    async def travel(self, driver: VirtualDriver, target: Tuple[float, float]) -> None:
+        """Déplace le chauffeur vers target en temps simulé, avec mises à jour de position."""
+        start = driver.position
+        total = distance_km(start, target)
+        duration = total / SPEED_KMH[driver.vehicle_type] * 3600 / self.args.time_scale
+        started = time.monotonic()
+        while not self.stop.is_set():
+            progress = min(1.0, (time.monotonic() - started) / duration) if duration > 0 else 1.0
+            driver.position = (start[0] + (target[0] - start[0]) * progress, start[1] + (target[1] - start[1]) * progress)
+            if progress >= 1.0:
+                return
+            await self.send_location(driver)
+            await asyncio.sleep(min(self.args.location_interval, max(0.05, duration * (1 - progress))))
+
+    async def play_ride(self, driver: VirtualDriver, ride_id: str) -> None:
+        info = self.rides.get(ride_id)
+        if info is None or info.accepted_at is not None:
+            return
+        r = await self.call("accept", "PUT", f"/api/rides/{ride_id}/accept", driver.token)
+        if r is None or r.status_code != 200:
+            return
+        driver.busy = True
+        try:
+            info.accepted_at = time.monotonic()
+            info.assigned_driver = driver.id
+            info.pickup_km = distance_km(driver.position, info.pickup)
+            await self.travel(driver, info.pickup)
+            for status in ("arrived", "started"):
+                await self.call("status", "PUT", f"/api/rides/{ride_id}/status", driver.token, json={"status": status})
+            await self.travel(driver, info.destination)
+            r = await self.call("status", "PUT", f"/api/rides/{ride_id}/status", driver.token, json={"status": "completed"})
+            if r is not None and r.status_code == 200:
+                info.completed_at = time.monotonic()
+        finally:
+            driver.busy = False
+            self.release_passenger(info.passenger_id)
+
+    async def poll_feed(self, driver: VirtualDriver) -> Optional[str]:
+        """Course ouverte la plus proche dans le feed du chauffeur (ou None)."""
+        params = {"since": driver.feed_version} if driver.feed_version is not None else None
+        r = await self.call("pending_feed", "GET", "/api/rides/pending-feed", driver.token, params=params)
+        if r is None or r.status_code != 200:
+            return None
+        body = r.json()
+        driver.feed_version = body.get("version")
+        best, best_km = None, self.args.max_pickup_km
+        for ride in body.get("rides") or []:
+            info = self.rides.get(ride.get("id"))
+            if info is None or info.accepted_at is not None:
+                continue
+            km = distance_km(driver.position, info.pickup)
+            if km <= best_km:
+                best, best_km = info.ride_id, km
+        return best
+
+    async def driver_loop(self, driver: VirtualDriver) -> None:
+        # Départs étalés pour ne pas synchroniser tous les chauffeurs
+        await asyncio.sleep(random.random() * self.args.location_interval)
+        next_location = 0.0
+        next_poll = time.monotonic() + random.random() * self.args.poll_interval
+        while not self.stop.is_set():
+            try:
+                ride_id = driver.inbox.get_nowait()
+            except asyncio.QueueEmpty:
+                ride_id = None
+            now = time.monotonic()
+            if ride_id is None and now >= next_poll:
+                next_poll = now + self.args.poll_interval
+                ride_id = await self.poll_feed(driver)
+            if ride_id is not None:
+                await self.play_ride(driver, ride_id)
+                continue
+            if now >= next_location:
+                next_location = now + self.args.location_interval
+                # Petite dérive autour de la position courante
+                driver.position = random_point(driver.position, 0.2)
+                await self.send_location(driver)
+            await asyncio.sleep(0.25)
+
+    # --- Passagers ---
+
+    def release_passenger(self, passenger_id: str) -> None:
+        for p in self.passengers:
+            if p[0] == passenger_id:
+                self.idle_passengers.append(p)
+                return
+
+    async def request_ride(self) -> None:
+        if not self.idle_passengers:
+            return
+        passenger = self.idle_passengers.pop(random.randrange(len(self.idle_passengers)))
+        pickup = random_point(CENTER, self.args.radius_km)
+        destination = random_point(pickup, self.args.trip_km)
+        vehicle_type = "moto" if random.random() < self.args.moto_share else "car"
+        trip_km = distance_km(pickup, destination)
+        requested_at = time.monotonic()
+        r = await self.call("create_ride", "POST", "/api/rides", passenger[1], json={
+            "pickup_lat": pickup[0], "pickup_lng": pickup[1], "pickup_address": "Sim pickup",
+            "destination_lat": destination[0], "destination_lng": destination[1], "destination_address": "Sim destination",
+            "vehicle_type": vehicle_type, "estimated_distance": round(trip_km, 2),
+            "estimated_duration": int(trip_km / SPEED_KMH[vehicle_type] * 60) + 1, "estimated_price": 100 + int(trip_km * 40),
+        })
+        if r is None or r.status_code != 200:
+            self.idle_passengers.append(passenger)
+            return
+        ride = r.json().get("ride") or {}
+        assigned = ride.get("driver_id")
+        info = RideRequestInfo(ride["id"], passenger[0], pickup, destination, requested_at, auto_assigned=bool(assigned))
+        self.rides[info.ride_id] = info
+        if assigned and assigned in self.drivers:
+            self.drivers[assigned].inbox.put_nowait(info.ride_id)
+        asyncio.create_task(self.watch_unmatched(info, passenger[1]))
+
+    async def watch_unmatched(self, info: RideRequestInfo, token: str) -> None:
+        """Sans chauffeur après --match-timeout, le passager annule."""
+        try:
+            await asyncio.wait_for(self.stop.wait(), timeout=self.args.match_timeout)
+            return
+        except asyncio.TimeoutError:
+            pass
+        if info.accepted_at is None:
+            r = await self.call("cancel", "PUT", f"/api/rides/{info.ride_id}/status", token,
+                                json={"status": "cancelled", "reason": "simulation: no driver"})
+            if r is not None and r.status_code == 200:
+                self.unmatched += 1
+                self.release_passenger(info.passenger_id)
+
+    async def arrivals(self) -> None:
+        end = time.monotonic() + self.args.duration
+        while time.monotonic() < end:
+            await asyncio.sleep(random.expovariate(self.args.arrival_rate))
+            asyncio.create_task(self.request_ride())
+
+    async def monitor_loop_lag(self) -> None:
+        while not self.stop.is_set():
+            start = time.perf_counter()
+            await asyncio.sleep(0.1)
+            self.loop_lag.append((time.perf_counter() - start - 0.1) * 1000)
+
+    # --- Exécution ---
+
+    async def run(self) -> Dict[str, Any]:
+        cpu_start, wall_start = time.process_time(), time.perf_counter()
+        db_stats_before = self.server.supabase.query_stats.stats()["tables"]
+        tasks = [asyncio.create_task(self.driver_loop(d)) for d in self.drivers.values()]
+        tasks.append(asyncio.create_task(self.monitor_loop_lag()))
+        await self.arrivals()
+        # Laisser finir les courses en cours
+        await asyncio.sleep(self.args.drain)
+        self.stop.set()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        wall = time.perf_counter() - wall_start
+        return self.report(wall, time.process_time() - cpu_start, db_stats_before)
+
+    def report(self, wall: float, cpu: float, db_before: Dict[str, Any]) -> Dict[str, Any]:
+        rides = list(self.rides.values())
+        accepted = [r for r in rides if r.accepted_at is not None]
+        matching_ms = [(r.accepted_at - r.requested_at) * 1000 for r in accepted]
+        pickup_km = [r.pickup_km for r in accepted if r.pickup_km is not None]
+        buckets: Dict[str, int] = {}
+        for km in pickup_km:
+            label = next((f"<={b}km" for b in PICKUP_DISTANCE_BUCKETS if km <= b), f">{PICKUP_DISTANCE_BUCKETS[-1]}km")
+            buckets[label] = buckets.get(label, 0) + 1
+        db_after = self.server.supabase.query_stats.stats()["tables"]
+        db_calls = sum(v["calls"] for v in db_after.values()) - sum(v["calls"] for v in db_before.values())
+        max_rss_mb = None
+        if resource is not None:
+            max_rss_mb = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+        return {
+            "config": {k: v for k, v in vars(self.args).items() if k != "output"},
+            "rides": {
+                "requested": len(rides),
+                "accepted": len(accepted),
+                "completed": sum(1 for r in rides if r.completed_at is not None),
+                "cancelled_unmatched": self.unmatched,
+                "auto_assigned": sum(1 for r in rides if r.auto_assigned),
+            },
+            "matching_latency_ms": summarize(matching_ms),
+            "pickup_distance_km": {
+                "p50": round(percentile(pickup_km, 50), 2),
+                "p95": round(percentile(pickup_km, 95), 2),
+                "mean": round(statistics.fmean(pickup_km), 2) if pickup_km else 0.0,
+                "histogram": dict(sorted(buckets.items())),
+            },
+            "endpoints": {op: {**summarize(v), "statuses": self.statuses.get(op, {})} for op, v in sorted(self.latencies.items())},
+            "server": {
+                "wall_seconds": round(wall, 1),
+                "cpu_seconds": round(cpu, 1),
+                "cpu_utilization": round(cpu / wall, 2) if wall else 0.0,
+                "max_rss_mb": max_rss_mb,
+                "loop_lag_ms": summarize(self.loop_lag),
+                "db_calls": db_calls,
+                "db_calls_per_second": round(db_calls / wall, 1) if wall else 0.0,
+                "failed_requests": self.request_failures,
+            },
+        }
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    rides, server = report["rides"], report["server"]
+    print(f"\nCourses: {rides['requested']} demandées, {rides['accepted']} acceptées, "
+          f"{rides['completed']} terminées, {rides['cancelled_unmatched']} sans chauffeur")
+    print(f"Matching (demande -> acceptée): {report['matching_latency_ms']}")
+    print(f"Distance de prise en charge: {report['pickup_distance_km']}")
+    print("\nEndpoints:")
+    for op, stats in report["endpoints"].items():
+        print(f"  {op:<14} n={stats['count']:<7} p50={stats['p50_ms']:<8} p95={stats['p95_ms']:<8} "
+              f"p99={stats['p99_ms']:<8} {stats['statuses']}")
+    print(f"\nProcess: {server['cpu_seconds']}s CPU sur {server['wall_seconds']}s "
+          f"({server['cpu_utilization']:.0%}), RSS max {server['max_rss_mb']} MB, "
+          f"{server['db_calls']} appels base ({server['db_calls_per_second']}/s), "
+          f"{server['failed_requests']} requêtes en erreur")
+    print(f"Lag boucle asyncio: {server['loop_lag_ms']}")
+
+
+async def main_async(args: argparse.Namespace) -> Dict[str, Any]:
+    os.environ["TAPTAPGO_FAKE_SUPABASE"] = "1"
+    os.environ["TAPTAPGO_FAKE_SUPABASE_LATENCY_MS"] = str(args.db_latency_ms)
+    os.environ["TAPTAPGO_RATE_LIMIT_ENABLED"] = "0"
+    os.environ.setdefault("JWT_SECRET", "simulation-secret-not-for-production")
+    sys.path.insert(0, str(BACKEND_DIR))
+    os.chdir(BACKEND_DIR)
+    import server  # noqa: E402  (après la configuration de l'environnement)
+
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://sim", timeout=httpx.Timeout(120.0)) as client:
+        async with server.app.router.lifespan_context(server.app):
+            sim = Simulation(args, server, client)
+            sim.seed()
+            print(f"{len(sim.drivers)} chauffeurs, {len(sim.passengers)} passagers, "
+                  f"{args.arrival_rate} demandes/s pendant {args.duration:.0f}s", flush=True)
+            return await sim.run()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Simulateur d'heure de pointe (dispatch)")
+    parser.add_argument("--drivers", type=int, default=500)
+    parser.add_argument("--passengers", type=int, default=300)
+    parser.add_argument("--arrival-rate", type=float, default=5.0, help="Demandes de course par seconde")
+    parser.add_argument("--duration", type=float, default=60.0, help="Durée des arrivées (s)")
+    parser.add_argument("--drain", type=float, default=15.0, help="Attente après les arrivées pour finir les courses (s)")
+    parser.add_argument("--time-scale", type=float, default=30.0, help="Accélération des trajets simulés")
+    parser.add_argument("--radius-km", type=float, default=6.0, help="Rayon de la zone autour du centre")
+    parser.add_argument("--trip-km", type=float, default=5.0, help="Distance max d'un trajet")
+    parser.add_argument("--moto-share", type=float, default=0.6, help="Part des motos (chauffeurs et demandes)")
+    parser.add_argument("--location-interval", type=float, default=5.0, help="Intervalle des positions chauffeur (s)")
+    parser.add_argument("--poll-interval", type=float, default=5.0, help="Intervalle du pending-feed (s)")
+    parser.add_argument("--max-pickup-km", type=float, default=10.0)
+    parser.add_argument("--match-timeout", type=float, default=30.0, help="Annulation sans chauffeur après (s)")
+    parser.add_argument("--db-latency-ms", type=float, default=0.0, help="Latence simulée par appel base")
+    parser.add_argument("--seed", type=int, default=None, help="Graine aléatoire (reproductibilité)")
+    parser.add_argument("--output", type=Path, help="Fichier JSON du rapport")
+    args = parser.parse_args()
+    if args.seed is not None:
+        random.seed(args.seed)
+
+    report = asyncio.run(main_async(args))
+    print_report(report)
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2, ensure_ascii=False, default=str), encoding="utf-8")
+        print(f"\nRapport: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
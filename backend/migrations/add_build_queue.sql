@@ -0,0 +1,13 @@
+-- Migration: file de builds persistante (plusieurs builds en parallèle)
+-- Run in Supabase SQL Editor if builds table already exists
+
+ALTER TABLE builds ADD COLUMN IF NOT EXISTS config JSONB;
+ALTER TABLE builds ADD COLUMN IF NOT EXISTS attempts INTEGER DEFAULT 0;
+ALTER TABLE builds ADD COLUMN IF NOT EXISTS lease_owner TEXT;
+ALTER TABLE builds ADD COLUMN IF NOT EXISTS lease_expires_at TIMESTAMP WITH TIME ZONE;
+ALTER TABLE builds ADD COLUMN IF NOT EXISTS cancel_requested BOOLEAN DEFAULT FALSE;
+ALTER TABLE builds ADD COLUMN IF NOT EXISTS started_at TIMESTAMP WITH TIME ZONE;
+
+CREATE INDEX IF NOT EXISTS idx_builds_queue ON builds(created_at) WHERE status = 'queued';
+-- Un seul build en file ou en cours par marque (deux demandes simultanées: la seconde reçoit 409)
+CREATE UNIQUE INDEX IF NOT EXISTS idx_builds_one_active_per_brand ON builds(brand_id) WHERE status IN ('queued', 'building');
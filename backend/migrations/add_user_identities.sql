@@ -0,0 +1,90 @@
+-- Annuaire des identifiants (téléphone / email) -> compte, pour login et réinitialisation
+-- du mot de passe en une seule requête indexée au lieu d'un or_() sur chaque table.
+-- Exécuter après database_setup.sql. Tenu à jour par triggers sur les 5 tables d'utilisateurs.
+
+CREATE TABLE IF NOT EXISTS user_identities (
+  identifier TEXT NOT NULL,          -- email en minuscules, téléphone sans espaces autour
+  kind VARCHAR(10) NOT NULL,         -- 'phone' | 'email'
+  user_type VARCHAR(20) NOT NULL,    -- passenger, driver, admin, subadmin, superadmin
+  user_table VARCHAR(20) NOT NULL,
+  user_id UUID NOT NULL,
+  updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+  PRIMARY KEY (user_type, identifier),
+  CONSTRAINT user_identities_kind_check CHECK (kind IN ('phone', 'email'))
+);
+
+CREATE INDEX IF NOT EXISTS idx_user_identities_identifier ON user_identities(identifier);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_user_identities_user_kind ON user_identities(user_type, user_id, kind);
+
+CREATE OR REPLACE FUNCTION sync_user_identities() RETURNS TRIGGER AS $$
+DECLARE
+  utype TEXT := TG_ARGV[0];
+BEGIN
+  IF TG_OP IN ('UPDATE', 'DELETE') THEN
+    DELETE FROM user_identities WHERE user_type = utype AND user_id = OLD.id;
+  END IF;
+  IF TG_OP IN ('INSERT', 'UPDATE') THEN
+    IF NEW.phone IS NOT NULL AND btrim(NEW.phone) <> '' THEN
+      INSERT INTO user_identities (identifier, kind, user_type, user_table, user_id)
+      VALUES (btrim(NEW.phone), 'phone', utype, TG_TABLE_NAME, NEW.id)
+      ON CONFLICT (user_type, identifier) DO UPDATE
+        SET kind = EXCLUDED.kind, user_table = EXCLUDED.user_table, user_id = EXCLUDED.user_id, updated_at = NOW();
+    END IF;
+    IF NEW.email IS NOT NULL AND btrim(NEW.email) <> '' THEN
+      INSERT INTO user_identities (identifier, kind, user_type, user_table, user_id)
+      VALUES (lower(btrim(NEW.email)), 'email', utype, TG_TABLE_NAME, NEW.id)
+      ON CONFLICT (user_type, identifier) DO UPDATE
+        SET kind = EXCLUDED.kind, user_table = EXCLUDED.user_table, user_id = EXCLUDED.user_id, updated_at = NOW();
+    END IF;
+  END IF;
+  RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_passengers_identities ON passengers;
+CREATE TRIGGER trg_passengers_identities
+  AFTER INSERT OR DELETE OR UPDATE OF phone, email ON passengers
+  FOR EACH ROW EXECUTE FUNCTION sync_user_identities('passenger');
+
+DROP TRIGGER IF EXISTS trg_drivers_identities ON drivers;
+CREATE TRIGGER trg_drivers_identities
+  AFTER INSERT OR DELETE OR UPDATE OF phone, email ON drivers
+  FOR EACH ROW EXECUTE FUNCTION sync_user_identities('driver');
+
+DROP TRIGGER IF EXISTS trg_admins_identities ON admins;
+CREATE TRIGGER trg_admins_identities
+  AFTER INSERT OR DELETE OR UPDATE OF phone, email ON admins
+  FOR EACH ROW EXECUTE FUNCTION sync_user_identities('admin');
+
+DROP TRIGGER IF EXISTS trg_subadmins_identities ON subadmins;
+CREATE TRIGGER trg_subadmins_identities
+  AFTER INSERT OR DELETE OR UPDATE OF phone, email ON subadmins
+  FOR EACH ROW EXECUTE FUNCTION sync_user_identities('subadmin');
+
+DROP TRIGGER IF EXISTS trg_superadmins_identities ON superadmins;
+CREATE TRIGGER trg_superadmins_identities
+  AFTER INSERT OR DELETE OR UPDATE OF phone, email ON superadmins
+  FOR EACH ROW EXECUTE FUNCTION sync_user_identities('superadmin');
+
+-- Remplissage initial avec les comptes existants
+INSERT INTO user_identities (identifier, kind, user_type, user_table, user_id)
+SELECT btrim(phone), 'phone', t.user_type, t.user_table, id FROM (
+  SELECT id, phone, 'passenger' AS user_type, 'passengers' AS user_table FROM passengers
+  UNION ALL SELECT id, phone, 'driver', 'drivers' FROM drivers
+  UNION ALL SELECT id, phone, 'admin', 'admins' FROM admins
+  UNION ALL SELECT id, phone, 'subadmin', 'subadmins' FROM subadmins
+  UNION ALL SELECT id, phone, 'superadmin', 'superadmins' FROM superadmins
+) t
+WHERE phone IS NOT NULL AND btrim(phone) <> ''
+ON CONFLICT (user_type, identifier) DO NOTHING;
+
+INSERT INTO user_identities (identifier, kind, user_type, user_table, user_id)
+SELECT lower(btrim(email)), 'email', t.user_type, t.user_table, id FROM (
+  SELECT id, email, 'passenger' AS user_type, 'passengers' AS user_table FROM passengers
+  UNION ALL SELECT id, email, 'driver', 'drivers' FROM drivers
+  UNION ALL SELECT id, email, 'admin', 'admins' FROM admins
+  UNION ALL SELECT id, email, 'subadmin', 'subadmins' FROM subadmins
+  UNION ALL SELECT id, email, 'superadmin', 'superadmins' FROM superadmins
+) t
+WHERE email IS NOT NULL AND btrim(email) <> ''
+ON CONFLICT (user_type, identifier) DO NOTHING;
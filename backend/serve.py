@@ -0,0 +1,325 @@
+"""Lanceur de production: app préchargée dans un master, N workers forkés qui partagent le socket.
+
+Le master importe server.py une seule fois (routes, pydantic, constantes), gèle le tas
+(gc.freeze) puis forke les workers: le code et les objets importés restent partagés en
+copie-sur-écriture au lieu d'être chargés N fois. Chaque worker recrée après le fork ce
+qui ne se partage pas (client Supabase, pool bcrypt, export des traces: voir
+server._reinit_after_fork) puis lance son lifespan et sa boucle uvicorn.
+
+Signaux du master:
+    SIGTERM / SIGINT  arrêt propre (les workers finissent leurs requêtes, --graceful-timeout)
+    SIGHUP            rechargement sans coupure: le nouveau code est vérifié, le master se
+                      ré-exécute en gardant le socket, démarre de nouveaux workers et n'arrête
+                      les anciens qu'une fois les nouveaux prêts
+
+Plusieurs workers exigent TAPTAPGO_REDIS_URL: les compteurs du rate limiting et les codes
+OTP doivent être partagés (sinon chaque worker applique sa propre limite et ne connaît que
+ses propres codes). Sans Redis, un seul worker est lancé.
+
+Exemples:
+    python serve.py                          # un worker par cœur disponible (avec Redis), port 8000
+    python serve.py --workers 4 --port 8080
+    kill -HUP <pid du master>                # après un déploiement
+
+Sans fork (Windows), lance un seul process uvicorn.
+"""
+import argparse
+import gc
+import logging
+import math
+import os
+import select
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Socket d'écoute et workers hérités de l'ancien master (rechargement SIGHUP)
+LISTEN_FD_ENV = "TAPTAPGO_LISTEN_FD"
+RETIRE_PIDS_ENV = "TAPTAPGO_RETIRE_PIDS"
+# Délai max pour qu'un worker termine son lifespan de démarrage
+READY_TIMEOUT = 60.0
+# Un worker mort avant ce délai est relancé avec un délai croissant (max RESPAWN_BACKOFF_MAX)
+MIN_UPTIME = 5.0
+RESPAWN_BACKOFF_MAX = 30.0
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger("serve")
+
+
+def available_cpus() -> int:
+    """Cœurs utilisables: affinité du process, bornée par le quota CPU du conteneur (cgroup v2)."""
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else (os.cpu_count() or 1)
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()[:2]
+        if quota != "max":
+            cpus = min(cpus, math.ceil(int(quota) / int(period)))
+    except (OSError, ValueError):
+        pass
+    return max(1, cpus)
+
+
+def listen_socket(host: str, port: int, backlog: int) -> socket.socket:
+    inherited = os.getenv(LISTEN_FD_ENV)
+    if inherited:
+        sock = socket.socket(fileno=int(inherited))
+    else:
+        family = socket.AF_INET6 if ":" in host else socket.AF_INET
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((host, port))
+        sock.listen(backlog)
+    # Gardé ouvert à travers execv (rechargement)
+    sock.set_inheritable(True)
+    return sock
+
+
+def run_worker(app, sock: socket.socket, ready_fd: int, args: argparse.Namespace) -> None:
+    import uvicorn
+
+    class WorkerServer(uvicorn.Server):
+        async def startup(self, sockets=None):
+            await super().startup(sockets=sockets)
+            # Lifespan terminé et socket servi: le master peut retirer les anciens workers
+            if not self.should_exit:
+                os.write(ready_fd, b"1")
+            os.close(ready_fd)
+
+    config = uvicorn.Config(
+        app,
+        lifespan="on",
+        proxy_headers=True,
+        forwarded_allow_ips=args.forwarded_allow_ips,
+        timeout_graceful_shutdown=args.graceful_timeout,
+        log_level=args.log_level,
+    )
+    WorkerServer(config).run(sockets=[sock])
+
+
+class Master:
+    def __init__(self, app, sock: socket.socket, args: argparse.Namespace):
+        self.app = app
+        self.sock = sock
+        self.args = args
+        self.workers: Dict[int, float] = {}  # pid -> démarré à
+        self.ready_pipes: Dict[int, int] = {}  # fd lecture -> pid
+        self.retiring: List[int] = []
+        self.signals: List[int] = []
+        self.failures = 0
+        self.stopping = False
+
+    def spawn(self) -> int:
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                os.close(read_fd)
+                for sig in (signal.SIGHUP, signal.SIGCHLD, signal.SIGTERM, signal.SIGINT):
+                    signal.signal(sig, signal.SIG_DFL)
+                run_worker(self.app, self.sock, write_fd, self.args)
+            except BaseException:
+                logger.exception("Worker crashed")
+                code = 1
+            finally:
+                os._exit(code)
+        os.close(write_fd)
+        self.workers[pid] = time.monotonic()
+        self.ready_pipes[read_fd] = pid
+        return pid
+
+    def wait_ready(self, timeout: float) -> bool:
+        """Attend l'octet "prêt" de chaque nouveau worker. False si l'un échoue ou dépasse le délai."""
+        deadline = time.monotonic() + timeout
+        ok = True
+        while self.ready_pipes and time.monotonic() < deadline:
+            readable, _, _ = select.select(list(self.ready_pipes), [], [], 0.5)
+            for fd in readable:
+                pid = self.ready_pipes.pop(fd)
+                if not os.read(fd, 1):
+                    logger.error(f"Worker {pid} exited during startup")
+                    ok = False
+                os.close(fd)
+        for fd, pid in list(self.ready_pipes.items()):
+            logger.error(f"Worker {pid} not ready after {timeout:.0f}s")
+            os.close(fd)
+            ok = False
+        self.ready_pipes.clear()
+        return ok
+
+    def _on_signal(self, signum: int, frame) -> None:
+        self.signals.append(signum)
+
+    def run(self) -> None:
+        for sig in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP):
+            signal.signal(sig, self._on_signal)
+        # Réveille time.sleep quand un worker meurt
+        signal.signal(signal.SIGCHLD, lambda *_: None)
+
+        for _ in range(self.args.workers):
+            self.spawn()
+        ready = self.wait_ready(READY_TIMEOUT)
+        logger.info(f"Master {os.getpid()} serving on {self.args.host}:{self.args.port} with {len(self.workers)} workers")
+        retire = [int(p) for p in os.environ.pop(RETIRE_PIDS_ENV, "").split(",") if p]
+        if retire:
+            if ready:
+                logger.info(f"Reload: stopping previous workers {retire}")
+            else:
+                logger.error("Reload: some new workers failed to start, stopping previous workers anyway")
+            self._terminate(retire)
+
+        while not self.stopping:
+            self._reap()
+            while self.signals:
+                signum = self.signals.pop(0)
+                if signum == signal.SIGHUP:
+                    self.reload()
+                else:
+                    self.stopping = True
+            if not self.stopping:
+                time.sleep(1.0)
+        self.shutdown()
+
+    def _terminate(self, pids: List[int]) -> None:
+        for pid in pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                continue
+            self.retiring.append(pid)
+            self.workers.pop(pid, None)
+
+    def _reap(self) -> None:
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            if pid in self.retiring:
+                self.retiring.remove(pid)
+                continue
+            started = self.workers.pop(pid, None)
+            if started is None or self.stopping:
+                continue
+            code = os.waitstatus_to_exitcode(status)
+            logger.warning(f"Worker {pid} exited ({code}), respawning")
+            self.failures = self.failures + 1 if time.monotonic() - started < MIN_UPTIME else 0
+            if self.failures:
+                time.sleep(min(RESPAWN_BACKOFF_MAX, 2 ** (self.failures - 1)))
+            self.spawn()
+            self.wait_ready(READY_TIMEOUT)
+
+    def reload(self) -> None:
+        """Ré-exécute le master (nouveau code) sans fermer le socket; les workers actuels restent
+        en service jusqu'à ce que les nouveaux soient prêts."""
+        check = subprocess.run([sys.executable, "-c", "import server"], cwd=BACKEND_DIR, capture_output=True, text=True)
+        if check.returncode != 0:
+            logger.error(f"Reload aborted, server.py does not import:\n{check.stderr[-2000:]}")
+            return
+        logger.info("Reloading")
+        os.environ[LISTEN_FD_ENV] = str(self.sock.fileno())
+        os.environ[RETIRE_PIDS_ENV] = ",".join(str(p) for p in list(self.workers) + self.retiring)
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os.execv(sys.executable, [sys.executable, os.path.abspath(__file__)] + sys.argv[1:])
+
+    def shutdown(self) -> None:
+        pids = list(self.workers) + self.retiring
+        logger.info(f"Stopping {len(pids)} workers")
+        for pid in pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        deadline = time.monotonic() + self.args.graceful_timeout + 5
+        remaining = set(pids)
+        while remaining and time.monotonic() < deadline:
+            for pid in list(remaining):
+                try:
+                    if os.waitpid(pid, os.WNOHANG)[0] == pid:
+                        remaining.discard(pid)
+                except ChildProcessError:
+                    remaining.discard(pid)
+            time.sleep(0.1)
+        for pid in remaining:
+            logger.warning(f"Worker {pid} did not stop in time, killing")
+            try:
+                os.kill(pid, signal.SIGKILL)
+                os.waitpid(pid, 0)
+            except (ProcessLookupError, ChildProcessError):
+                pass
+        self.sock.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Serveur de production TapTapGo (workers préforkés)")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    parser.add_argument(
+        "--workers", type=int, default=int(os.getenv("TAPTAPGO_WORKERS", "0")),
+        help="Nombre de workers (0 = un par cœur disponible avec Redis, 1 sans)",
+    )
+    parser.add_argument(
+        "--graceful-timeout", type=float, default=float(os.getenv("TAPTAPGO_GRACEFUL_TIMEOUT", "30")),
+        help="Secondes laissées aux requêtes en cours à l'arrêt",
+    )
+    parser.add_argument("--backlog", type=int, default=2048)
+    parser.add_argument("--forwarded-allow-ips", default=os.getenv("FORWARDED_ALLOW_IPS", "127.0.0.1"))
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args()
+    cpus = available_cpus()
+    sys.path.insert(0, BACKEND_DIR)
+    from services.redis_client import redis_available
+
+    if redis_available():
+        args.workers = args.workers or cpus
+    elif args.workers > 1:
+        parser.error(
+            f"--workers {args.workers} requires TAPTAPGO_REDIS_URL (and pip install redis): "
+            "rate limits and OTP codes are per process without it"
+        )
+    else:
+        if cpus > 1:
+            logger.info("TAPTAPGO_REDIS_URL not set: running a single worker")
+        args.workers = 1
+
+    if not hasattr(os, "fork"):
+        import uvicorn
+        logger.info("No fork on this platform: single process")
+        uvicorn.run("server:app", host=args.host, port=args.port, log_level=args.log_level)
+        return
+
+    # À fixer avant l'import de server: lus une fois par les services
+    run_dir = os.path.join(tempfile.gettempdir(), f"taptapgo-{os.getpid()}")
+    if args.workers > 1:
+        # /metrics additionne les snapshots des workers de ce master
+        os.environ.setdefault("TAPTAPGO_METRICS_DIR", os.path.join(run_dir, "metrics"))
+        # Invalidations de cache entre workers (sans Redis): un socket Unix par worker
+        os.environ.setdefault("TAPTAPGO_BUS_DIR", os.path.join(run_dir, "bus"))
+        # Les workers se partagent les cœurs: un pool bcrypt plus petit dans chacun
+        os.environ.setdefault("TAPTAPGO_BCRYPT_WORKERS", str(max(1, cpus // args.workers)))
+
+    sock = listen_socket(args.host, args.port, args.backlog)
+    import server
+
+    # Tout ce qui est chargé jusqu'ici est partagé par les workers: gc.freeze évite que
+    # les passes du GC dans les workers touchent ces objets et recopient leurs pages
+    gc.collect()
+    gc.freeze()
+    try:
+        Master(server.app, sock, args).run()
+    finally:
+        shutil.rmtree(run_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
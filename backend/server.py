@@ -1,6 +1,5 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, UploadFile, File, Query, Request
-from fastapi.responses import FileResponse, HTMLResponse
-from fastapi.staticfiles import StaticFiles
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, UploadFile, File, Query, Request, Response
+from fastapi.responses import FileResponse, HTMLResponse, PlainTextResponse, StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
@@ -13,15 +12,32 @@ import uuid
 from datetime import datetime, timedelta
 import random
 import jwt
-import bcrypt
 import base64
-from supabase import create_client, Client
 import json
 import math
-import smtplib
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-from services.build_service import BuildService
+import hmac
+import hashlib
+import asyncio
+import threading
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from functools import lru_cache
+from services.realtime import EventBroker, parse_last_event_id, stream_events
+from services.ride_board import PendingRideBoard, RIDE_BOARD_RESYNC_SECONDS
+from services.password_hasher import PasswordHasher, PasswordHasherBusy
+from services.token_cache import TokenCache
+from services.profile_claims import ProfileVersions, build_profile
+from services.rate_limit import RateLimiter, RateLimitMiddleware, RateLimitRule
+from services.otp_store import OTP_LOCKED, OTP_OK, OTPAuditSink, create_otp_store
+from services.identity_directory import IdentityDirectory, LOGIN_COLUMNS, USER_TABLES
+from services.metrics import METRICS_TOKEN, MetricsMiddleware, MetricsRegistry
+from services.db_instrumentation import InstrumentedClient, QueryTimingMiddleware
+from services.fake_supabase import FAKE_SUPABASE, create_fake_client_from_env
+from services.profiling import ProfilingMiddleware, RequestProfiler
+from services.loop_monitor import LoopMonitor
+from services.tracing import TracingMiddleware, tracer
+from services.invalidation import InvalidatedCache, create_invalidation_bus
+from services.landing_page import LandingPage
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
@@ -41,7 +57,8 @@ def _load_politik_content() -> str:
 SUPABASE_URL = os.environ.get('SUPABASE_URL')
 SUPABASE_KEY = os.environ.get('SUPABASE_KEY')
 JWT_SECRET = os.environ.get('JWT_SECRET')
-if not all([SUPABASE_URL, SUPABASE_KEY, JWT_SECRET]):
+# TAPTAPGO_FAKE_SUPABASE=1: base en mémoire (tests, benchmarks), SUPABASE_* non requis
+if not JWT_SECRET or not (FAKE_SUPABASE or (SUPABASE_URL and SUPABASE_KEY)):
     raise RuntimeError(
         "Variables d'environnement manquantes: SUPABASE_URL, SUPABASE_KEY, JWT_SECRET. "
         "Voir backend/.env.example et définir un fichier .env."
@@ -52,18 +69,123 @@ JWT_ALGORITHM = os.environ.get('JWT_ALGORITHM', 'HS256')
 _cors_raw = (os.environ.get('CORS_ORIGINS') or '*').strip()
 CORS_ORIGINS = ['*'] if _cors_raw == '*' else [o.strip() for o in _cors_raw.split(',') if o.strip()]
 
-# Initialize Supabase client
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
-
-# Initialize Build Service
-build_service = BuildService(supabase)
+def _create_supabase_client():
+    """Real Supabase client, or the in-memory fake (supabase is imported here, not at startup)."""
+    if FAKE_SUPABASE:
+        return create_fake_client_from_env()
+    from supabase import create_client
+    return create_client(SUPABASE_URL, SUPABASE_KEY)
+
+# Client Supabase construit au démarrage de l'app (lifespan) ou au premier appel;
+# chaque appel table/rpc est chronométré, voir QueryTimingMiddleware
+supabase = InstrumentedClient(factory=_create_supabase_client)
+
+# Builds APK: service créé au premier build (chaîne de build + dossiers de travail)
+_build_service = None
+_build_service_lock = threading.Lock()
+
+def get_build_service():
+    """BuildService, created on first use."""
+    global _build_service
+    if _build_service is None:
+        with _build_service_lock:
+            if _build_service is None:
+                from services.build_service import BuildService
+                _build_service = BuildService(supabase)
+    return _build_service
+
+# Flux temps réel (SSE) par utilisateur
+event_broker = EventBroker()
+
+# Courses en attente non assignées, servies aux chauffeurs sans requête
+ride_board = PendingRideBoard()
+
+# bcrypt dans un pool de process (hors boucle asyncio)
+password_hasher = PasswordHasher()
+
+# JWT déjà vérifiés (claims) gardés jusqu'à exp
+token_cache = TokenCache()
+
+# Versions des profils: rend périmé le claim "profile" des tokens après une modification
+profile_versions = ProfileVersions()
+
+# Invalidations des caches en mémoire entre workers (Redis, sockets Unix de serve.py, ou local)
+invalidation_bus = create_invalidation_bus()
+# Villes et tarifs lus à chaque estimation: gardés jusqu'à une modification sur n'importe quel worker
+cities_cache = InvalidatedCache(invalidation_bus, "cities")
+pricing_cache = InvalidatedCache(invalidation_bus, "pricing")
+# Contenu landing + footer fusionné et sérialisé: reconstruit après update_landing / reset_landing
+landing_cache = InvalidatedCache(invalidation_bus, "landing")
+
+def _on_user_changed(user_id: Optional[str], version: float) -> None:
+    if user_id is None:
+        profile_versions.bump_all(version)
+    else:
+        profile_versions.bump_user(user_id, at=version)
+    ride_board.forget_driver(user_id)
 
-# Create the main app
-app = FastAPI(title="TapTapGo API", version="1.0.0")
+def _on_admin_changed(admin_id: Optional[str], version: float) -> None:
+    if admin_id is None:
+        profile_versions.bump_all(version)
+    else:
+        profile_versions.bump_admin(admin_id, at=version)
+
+def _on_build_queued(build_id: Optional[str], version: float) -> None:
+    # Réveille le dépileur s'il tourne dans ce worker (sinon il scrute la file toutes les 5 s)
+    if _build_service is not None:
+        _build_service.queue.notify()
+
+invalidation_bus.subscribe("user", _on_user_changed)
+invalidation_bus.subscribe("admin", _on_admin_changed)
+invalidation_bus.subscribe("builds", _on_build_queued)
+
+# Codes OTP actifs (TTL, essais, usage unique); otp_codes ne sert plus que d'historique
+otp_store = create_otp_store()
+otp_audit = OTPAuditSink(supabase)
+
+# Téléphone / email -> compte (table user_identities), pour login et mot de passe oublié
+identity_directory = IdentityDirectory(supabase)
+
+# Lag de la boucle asyncio et appels bloquants (pile + route loggées au-delà du seuil)
+loop_monitor = LoopMonitor()
+
+# Compteurs et latences par route, exposés sur /metrics (format Prometheus)
+metrics_registry = MetricsRegistry(loop_monitor=loop_monitor)
+
+# Profils de pile par requête (X-Profile: 1 d'un superadmin, ou 1 sur N), format flame graph
+request_profiler = RequestProfiler()
+
+def _reinit_after_fork() -> None:
+    """In a forked worker (serve.py, gunicorn --preload): drop clients and pools inherited from the master."""
+    supabase.reset_after_fork()
+    password_hasher.reset_after_fork()
+    tracer.reset_after_fork()
+    event_broker.reset_after_fork()
+    ride_board.reset_after_fork()
+    profile_versions.reset_after_fork()
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reinit_after_fork)
+
+# Limites des endpoints publics (par IP et par identifiant), appliquées avant le handler
+rate_limiter = RateLimiter([
+    RateLimitRule("otp_send", "/api/otp/send", per_ip=(10, 600), per_identifier=(5, 600), identifier_fields=("phone",)),
+    RateLimitRule("otp_verify", "/api/otp/verify", per_ip=(30, 600), per_identifier=(10, 600), identifier_fields=("phone",)),
+    RateLimitRule("login", "/api/auth/login", per_ip=(30, 300), per_identifier=(10, 300), identifier_fields=("phone_or_email",)),
+    RateLimitRule("password_reset", "/api/auth/password-reset/request", per_ip=(10, 600), per_identifier=(5, 600), identifier_fields=("identifier",)),
+    RateLimitRule("password_reset_confirm", "/api/auth/password-reset/confirm", per_ip=(20, 600), per_identifier=(10, 600), identifier_fields=("identifier",)),
+    RateLimitRule("register_passenger", "/api/auth/register/passenger", per_ip=(10, 3600), per_identifier=(5, 3600), identifier_fields=("phone", "email")),
+    RateLimitRule("register_driver", "/api/auth/register/driver", per_ip=(10, 3600), per_identifier=(5, 3600), identifier_fields=("phone", "email")),
+    RateLimitRule("whitelabel_request", "/api/landing/whitelabel-request", per_ip=(5, 3600), per_identifier=(3, 3600), identifier_fields=("email", "phone")),
+    RateLimitRule("support_message", "/api/landing/support-message", per_ip=(5, 3600), per_identifier=(3, 3600), identifier_fields=("email", "phone")),
+])
 
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
 
+# Routes hors /api (landing, /metrics)
+site_router = APIRouter()
+
 security = HTTPBearer()
 
 # Configure logging
@@ -81,18 +203,158 @@ REGLES_RETRAIT = {
     "frais_retrait": 0,
 }
 
+def _push_event(user_id: Optional[str], event: str, data: dict) -> None:
+    """Publish an SSE event here and relay it to the workers holding the user's other connections."""
+    if not user_id:
+        return
+    event_broker.publish(user_id, event, data)
+    invalidation_bus.send("events", user_id, {"event": event, "data": data})
+
+
+def _on_event_message(user_id: Optional[str], data: Optional[dict]) -> None:
+    """SSE event published on another worker (None: events may have been lost)."""
+    if data is None:
+        event_broker.resync_all()
+    elif user_id:
+        event_broker.publish(user_id, data.get("event") or "message", data.get("data") or {})
+
+invalidation_bus.on_message("events", _on_event_message)
+
+
 def create_notification(user_id: str, user_type: str, title: str, body: str):
     """Create an in-app notification"""
+    with tracer.span("notification.create", attributes={"taptapgo.user_type": user_type}) as span:
+        try:
+            notification = {
+                "id": str(uuid.uuid4()),
+                "user_id": user_id,
+                "user_type": user_type,
+                "title": title,
+                "body": body
+            }
+            result = supabase.table("notifications").insert(notification).execute()
+            _push_event(user_id, "notification", result.data[0] if result.data else notification)
+        except Exception as e:
+            span.set_error(e)
+            logger.error(f"Notification error: {e}")
+
+
+RIDE_EVENT_FIELDS = (
+    "id", "status", "passenger_id", "driver_id", "vehicle_type", "pickup_address",
+    "destination_address", "estimated_price", "final_price", "driver_eta_minutes",
+    "contact_code", "contact_active", "scheduled_at", "assigned_at", "started_at",
+    "completed_at", "cancelled_at", "cancel_reason",
+)
+
+
+def _publish_ride_event(ride: dict, previous_status: Optional[str] = None) -> None:
+    """Push a ride status change to the passenger and the assigned driver (SSE)."""
     try:
-        supabase.table("notifications").insert({
-            "id": str(uuid.uuid4()),
-            "user_id": user_id,
-            "user_type": user_type,
-            "title": title,
-            "body": body
-        }).execute()
+        payload = {k: ride.get(k) for k in RIDE_EVENT_FIELDS if k in ride}
+        payload["previous_status"] = previous_status
+        _push_event(ride.get("passenger_id"), "ride", payload)
+        if ride.get("driver_id") and ride.get("driver_id") != ride.get("passenger_id"):
+            _push_event(ride.get("driver_id"), "ride", payload)
     except Exception as e:
-        logger.error(f"Notification error: {e}")
+        logger.error(f"Ride event error: {e}")
+
+
+def _board_apply(ride: dict) -> None:
+    """Apply a ride change to this worker's board and forward it to the other workers."""
+    ride_board.apply(ride)
+    if ride.get("id"):
+        invalidation_bus.send("ride_board", ride["id"], {"op": "apply", "ride": ride})
+
+
+def _board_remove(ride_id: str) -> None:
+    ride_board.remove(ride_id)
+    invalidation_bus.send("ride_board", ride_id, {"op": "remove"})
+
+
+def _board_drop_admin(admin_id: str) -> None:
+    ride_board.drop_admin(admin_id)
+    invalidation_bus.send("ride_board", None, {"op": "drop_admin", "admin_id": admin_id})
+
+
+def _on_ride_board_message(ride_id: Optional[str], data: Optional[dict]) -> None:
+    """Board change made on another worker (None: changes may have been lost, reload from the DB)."""
+    if data is None:
+        ride_board.mark_stale()
+    elif data.get("op") == "apply":
+        ride_board.apply(data.get("ride") or {})
+    elif data.get("op") == "remove" and ride_id:
+        ride_board.remove(ride_id)
+    elif data.get("op") == "drop_admin":
+        ride_board.drop_admin(data.get("admin_id"))
+
+invalidation_bus.on_message("ride_board", _on_ride_board_message)
+
+
+def _track_ride(ride: dict, previous_status: Optional[str] = None) -> None:
+    """Keep the pending-ride board in sync and push the change to the ride's users."""
+    _board_apply(ride)
+    _publish_ride_event(ride, previous_status)
+
+
+def _resume_build_queue() -> None:
+    """Start the build service if builds are waiting (queued, or building under a lease that may have expired)."""
+    pending = (
+        supabase.table("builds").select("id").or_("status.eq.queued,status.eq.building")
+        .limit(1).execute()
+    )
+    if pending.data:
+        get_build_service()
+
+
+def _sync_ride_board() -> None:
+    """Reload open rides (pending, no driver) from the DB into the board."""
+    as_of = ride_board.begin_sync()
+    result = (
+        supabase.table("rides")
+        .select("*")
+        .eq("status", "pending")
+        .is_("driver_id", "null")
+        .execute()
+    )
+    ride_board.load(result.data or [], as_of=as_of)
+
+
+async def _ride_board_resync_loop() -> None:
+    while True:
+        await asyncio.sleep(RIDE_BOARD_RESYNC_SECONDS)
+        try:
+            await asyncio.to_thread(_sync_ride_board)
+        except Exception as e:
+            logger.warning(f"Ride board resync error: {e}")
+
+
+def _attach_passenger_info(rides: List[dict]) -> None:
+    """Add passenger_name / passenger_phone to rides that lack them."""
+    passenger_ids = list({
+        r.get("passenger_id") for r in rides
+        if r.get("passenger_id") and "passenger_name" not in r
+    })
+    if not passenger_ids:
+        return
+    passengers = (
+        supabase.table("passengers")
+        .select("id,full_name,phone")
+        .in_("id", passenger_ids)
+        .execute()
+        .data
+        or []
+    )
+    passenger_map = {p["id"]: p for p in passengers}
+    for ride in rides:
+        passenger = passenger_map.get(ride.get("passenger_id"))
+        if passenger and "passenger_name" not in ride:
+            ride["passenger_name"] = passenger.get("full_name")
+            ride["passenger_phone"] = passenger.get("phone")
+
+
+def _publish_wallet_event(chauffeur_id: str, reason: str, **fields) -> None:
+    """Push a wallet balance change to the driver (SSE)."""
+    _push_event(chauffeur_id, "wallet", {"reason": reason, **fields})
 
 
 def _get_or_create_wallet(chauffeur_id: str) -> dict:
@@ -150,6 +412,10 @@ def _credit_driver_wallet_after_ride(ride_id: str, driver_id: str, final_price:
             "gain_chauffeur": gain_chauffeur,
             "statut": "ok",
         }).execute()
+        _publish_wallet_event(
+            driver_id, "course_completed",
+            ride_id=ride_id, montant=gain_chauffeur, balance=new_balance,
+        )
         create_notification(
             driver_id,
             "driver",
@@ -475,19 +741,36 @@ MOTO_BRANDS = {
 
 # ============== HELPER FUNCTIONS ==============
 
-def hash_password(password: str) -> str:
-    return bcrypt.hashpw(password.encode(), bcrypt.gensalt()).decode()
+async def hash_password(password: str) -> str:
+    try:
+        return await password_hasher.hash(password)
+    except PasswordHasherBusy:
+        raise HTTPException(status_code=503, detail="Sèvè a chaje, eseye ankò", headers={"Retry-After": "2"})
 
-def verify_password(password: str, hashed: str) -> bool:
-    return bcrypt.checkpw(password.encode(), hashed.encode())
+async def verify_password(password: str, hashed: str) -> bool:
+    try:
+        return await password_hasher.verify(password, hashed)
+    except PasswordHasherBusy:
+        raise HTTPException(status_code=503, detail="Sèvè a chaje, eseye ankò", headers={"Retry-After": "2"})
 
-def create_token(user_id: str, user_type: str, admin_id: Optional[str] = None) -> str:
+def create_token(
+    user_id: str,
+    user_type: str,
+    admin_id: Optional[str] = None,
+    profile: Optional[dict] = None,
+    pv: Optional[float] = None,
+) -> str:
     payload = {
         'user_id': user_id,
         'user_type': user_type,
         'admin_id': admin_id,
+        'iat': datetime.utcnow(),
         'exp': datetime.utcnow() + timedelta(days=30)
     }
+    if profile is not None:
+        # pv: moment où le profil a été lu (avant la requête), comparé aux modifications
+        payload['profile'] = profile
+        payload['pv'] = pv if pv is not None else profile_versions.now()
     return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
 
 def decode_token(token: str) -> dict:
@@ -498,10 +781,121 @@ def decode_token(token: str) -> dict:
     except jwt.InvalidTokenError:
         raise HTTPException(status_code=401, detail="Invalid token")
 
-async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
-    token_data = decode_token(credentials.credentials)
+def authenticate_token(token: str) -> dict:
+    """Decode a JWT, using the verified-token cache; rejects revoked tokens."""
+    token_data = token_cache.get(token)
+    if token_data is None:
+        token_data = decode_token(token)
+        token_cache.put(token, token_data)
+    if token_cache.is_revoked(token, token_data):
+        raise HTTPException(status_code=401, detail="Token revoked")
     return token_data
 
+def is_superadmin_token(token: str) -> bool:
+    """True if the token is a valid, non-revoked superadmin token."""
+    try:
+        return authenticate_token(token).get('user_type') == 'superadmin'
+    except HTTPException:
+        return False
+
+# Réponse en cours: permet de renvoyer un token rafraîchi (X-Refreshed-Token)
+_current_response: ContextVar[Optional[Response]] = ContextVar("current_response", default=None)
+
+async def get_current_user(response: Response, credentials: HTTPAuthorizationCredentials = Depends(security)):
+    _current_response.set(response)
+    return authenticate_token(credentials.credentials)
+
+PROFILE_TABLES = {
+    'passenger': ('passengers', "admin_id,city,full_name,phone"),
+    'driver': ('drivers', "admin_id,vehicle_type,city"),
+    'admin': ('admins', "cities,brand_name"),
+    'subadmin': ('subadmins', "admin_id"),
+}
+
+def _load_profile(user_type: str, user_id: str) -> Tuple[Optional[dict], Optional[float]]:
+    """Read the claim profile of a user from the DB. Returns (profile, pv)."""
+    if user_type not in PROFILE_TABLES:
+        return None, None
+    table, fields = PROFILE_TABLES[user_type]
+    pv = profile_versions.now()
+    row = supabase.table(table).select(fields).eq("id", user_id).execute()
+    if not row.data:
+        return None, None
+    admin_row = None
+    if user_type == 'subadmin' and row.data[0].get("admin_id"):
+        admin = supabase.table("admins").select("cities,brand_name").eq("id", row.data[0]["admin_id"]).execute()
+        admin_row = admin.data[0] if admin.data else None
+    return build_profile(user_type, row.data[0], admin_row), pv
+
+def issue_token(user_id: str, user_type: str, admin_id: Optional[str], row: Optional[dict] = None, pv: Optional[float] = None) -> str:
+    """create_token with the profile claim built from the user row (or read from the DB)."""
+    profile = None
+    if user_type in PROFILE_TABLES:
+        if row is not None and user_type != 'subadmin':
+            profile = build_profile(user_type, row)
+        else:
+            profile, pv = _load_profile(user_type, user_id)
+    return create_token(user_id, user_type, admin_id, profile=profile, pv=pv)
+
+def get_user_profile(current_user: dict) -> dict:
+    """Stable profile attributes (admin_id, city, vehicle_type, cities, brand_name...).
+
+    From the token claims when they are current; otherwise one DB read, and the
+    response carries a refreshed token in X-Refreshed-Token.
+    """
+    if profile_versions.is_current(current_user):
+        return current_user['profile']
+    if current_user.get('user_type') == 'driver':
+        memo = ride_board.driver_scope(current_user['user_id'])
+        if memo is not None:
+            return memo
+    profile, pv = _load_profile(current_user['user_type'], current_user['user_id'])
+    if profile is None:
+        return {}
+    if current_user.get('user_type') == 'driver':
+        ride_board.remember_driver(current_user['user_id'], profile)
+    response = _current_response.get()
+    if response is not None:
+        admin_id = current_user.get('admin_id')
+        if current_user['user_type'] in ('driver', 'subadmin'):
+            admin_id = profile.get('admin_id')
+        response.headers["X-Refreshed-Token"] = create_token(
+            current_user['user_id'], current_user['user_type'], admin_id, profile=profile, pv=pv
+        )
+    return profile
+
+def profile_changed(user_id: Optional[str] = None, admin_id: Optional[str] = None) -> None:
+    """A profile or admin scope changed: tokens issued before now carry stale claims (all workers)."""
+    if user_id:
+        invalidation_bus.publish("user", user_id, version=profile_versions.now())
+    if admin_id:
+        invalidation_bus.publish("admin", admin_id, version=profile_versions.now())
+
+def get_cities_cached(active_only: bool = False) -> List[dict]:
+    """Cities rows from the shared cache (do not mutate)."""
+    def load() -> List[dict]:
+        query = supabase.table("cities").select("*")
+        if active_only:
+            query = query.eq("is_active", True)
+        return query.execute().data or []
+    return cities_cache.get_or_load("active" if active_only else "all", load)
+
+def get_direct_pricing_cached() -> Optional[dict]:
+    """pricing_settings row of the "direct" scope, from the shared cache (do not mutate)."""
+    def load() -> Optional[dict]:
+        rows = supabase.table("pricing_settings").select("*").eq("scope", "direct").execute().data
+        return rows[0] if rows else None
+    return pricing_cache.get_or_load("direct", load)
+
+def get_admin_pricing_cached(admin_id: str) -> Optional[dict]:
+    """Pricing columns of an admin (white-label brand), from the shared cache (do not mutate)."""
+    def load() -> Optional[dict]:
+        rows = supabase.table("admins").select(
+            "base_fare,price_per_km,price_per_min,base_fare_moto,base_fare_car,price_per_km_moto,price_per_km_car,price_per_min_moto,price_per_min_car,surge_multiplier"
+        ).eq("id", admin_id).execute().data
+        return rows[0] if rows else None
+    return pricing_cache.get_or_load(f"admin:{admin_id}", load)
+
 def generate_otp() -> str:
     """Generate mock OTP for development"""
     return "123456"  # Mock OTP
@@ -859,26 +1253,46 @@ async def health():
     return {"status": "ok"}
 
 
+def find_account(identifier: str, user_type: str, columns, channel: Optional[str] = None):
+    """Find the account for a phone/email. Returns (resolved_type, table, row or None).
+
+    columns is a select string, or a dict of select strings per user type.
+    An admin identifier that is not an admin account falls back to subadmins.
+    """
+    table = USER_TABLES.get(user_type)
+    if not table:
+        raise HTTPException(status_code=400, detail="Invalid user type")
+    user_types = [user_type, 'subadmin'] if user_type == 'admin' else [user_type]
+
+    if identity_directory.ready:
+        identity = identity_directory.resolve(identifier, user_types, kind=channel)
+        if not identity:
+            return user_type, table, None
+        resolved_type = identity['user_type']
+        table = USER_TABLES[resolved_type]
+        select = columns[resolved_type] if isinstance(columns, dict) else columns
+        result = supabase.table(table).select(select).eq("id", identity['user_id']).limit(1).execute()
+        return resolved_type, table, (result.data[0] if result.data else None)
+
+    # Sans la migration user_identities: recherche sur chaque table candidate
+    for candidate in user_types:
+        table = USER_TABLES[candidate]
+        query = supabase.table(table).select(columns[candidate] if isinstance(columns, dict) else columns)
+        if channel:
+            query = query.eq(channel, identifier)
+        else:
+            query = query.or_(f"phone.eq.{identifier},email.eq.{identifier}")
+        result = query.execute()
+        if result.data:
+            return candidate, table, result.data[0]
+    return user_type, USER_TABLES[user_type], None
+
 @api_router.post("/otp/send")
 async def send_otp(request: OTPRequest):
     """Send OTP to phone (Mock for development)"""
     try:
         otp_code = generate_otp()
-        expires_at = datetime.utcnow() + timedelta(minutes=10)
-        
-        # Store OTP in database
-        otp_data = {
-            "id": str(uuid.uuid4()),
-            "phone": request.phone,
-            "code": otp_code,
-            "expires_at": expires_at.isoformat(),
-            "is_used": False
-        }
-        
-        try:
-            supabase.table("otp_codes").insert(otp_data).execute()
-        except Exception as e:
-            logger.warning(f"Could not save OTP to database: {e}")
+        otp_audit.issued(await otp_store.issue(request.phone, otp_code))
         
         # In production, send SMS here
         logger.info(f"OTP for {request.phone}: {otp_code}")
@@ -895,22 +1309,22 @@ async def send_otp(request: OTPRequest):
 @api_router.post("/otp/verify")
 async def verify_otp(request: OTPVerify):
     """Verify OTP code (Mock: accepts 123456)"""
-    # Mock verification - accept 123456
-    if request.code == "123456":
-        return {"success": True, "message": "OTP verified successfully"}
-    
     try:
-        result = supabase.table("otp_codes").select("*").eq("phone", request.phone).eq("code", request.code).eq("is_used", False).order("created_at", desc=True).limit(1).execute()
-        
-        if result.data:
-            otp = result.data[0]
-            if datetime.fromisoformat(otp['expires_at'].replace('Z', '')) > datetime.utcnow():
-                # Mark as used
-                supabase.table("otp_codes").update({"is_used": True}).eq("id", otp['id']).execute()
-                return {"success": True, "message": "OTP verified successfully"}
+        result = await otp_store.verify(request.phone, request.code)
     except Exception as e:
         logger.warning(f"OTP verification error: {e}")
-    
+        result = {"status": None, "id": None}
+
+    if result["status"] == OTP_OK:
+        otp_audit.used(result["id"])
+        return {"success": True, "message": "OTP verified successfully"}
+
+    # Mock verification - accept 123456
+    if request.code == "123456":
+        return {"success": True, "message": "OTP verified successfully"}
+
+    if result["status"] == OTP_LOCKED:
+        raise HTTPException(status_code=429, detail="Too many attempts, request a new OTP")
     raise HTTPException(status_code=400, detail="Invalid or expired OTP")
 
 @api_router.post("/auth/password-reset/request")
@@ -920,45 +1334,12 @@ async def request_password_reset(data: PasswordResetRequest):
         if data.channel not in {"phone", "email"}:
             raise HTTPException(status_code=400, detail="Invalid channel")
 
-        table_map = {
-            'passenger': 'passengers',
-            'driver': 'drivers',
-            'admin': 'admins',
-            'subadmin': 'subadmins',
-            'superadmin': 'superadmins'
-        }
-        table = table_map.get(data.user_type)
-        if not table:
-            raise HTTPException(status_code=400, detail="Invalid user type")
-
-        lookup_field = "phone" if data.channel == "phone" else "email"
-        result = supabase.table(table).select("id,phone,email").eq(lookup_field, data.identifier).execute()
-        resolved_type = data.user_type
-
-        if not result.data and data.user_type == 'admin':
-            table = table_map.get('subadmin')
-            result = supabase.table(table).select("id,phone,email").eq(lookup_field, data.identifier).execute()
-            if result.data:
-                resolved_type = 'subadmin'
-
-        if not result.data:
+        resolved_type, table, user = find_account(data.identifier, data.user_type, "id,phone,email", channel=data.channel)
+        if not user:
             raise HTTPException(status_code=404, detail="User not found")
 
         otp_code = generate_otp()
-        expires_at = datetime.utcnow() + timedelta(minutes=10)
-
-        otp_data = {
-            "id": str(uuid.uuid4()),
-            "phone": data.identifier,
-            "code": otp_code,
-            "expires_at": expires_at.isoformat(),
-            "is_used": False
-        }
-
-        try:
-            supabase.table("otp_codes").insert(otp_data).execute()
-        except Exception as e:
-            logger.warning(f"Could not save OTP to database: {e}")
+        otp_audit.issued(await otp_store.issue(data.identifier, otp_code))
 
         logger.info(f"OTP for {data.identifier}: {otp_code}")
 
@@ -982,36 +1363,16 @@ async def confirm_password_reset(data: PasswordResetConfirm):
         if data.channel not in {"phone", "email"}:
             raise HTTPException(status_code=400, detail="Invalid channel")
 
-        table_map = {
-            'passenger': 'passengers',
-            'driver': 'drivers',
-            'admin': 'admins',
-            'subadmin': 'subadmins',
-            'superadmin': 'superadmins'
-        }
-        table = table_map.get(data.user_type)
-        if not table:
-            raise HTTPException(status_code=400, detail="Invalid user type")
-
-        lookup_field = "phone" if data.channel == "phone" else "email"
-        result = supabase.table(table).select("id,phone,email").eq(lookup_field, data.identifier).execute()
-        resolved_type = data.user_type
-
-        if not result.data and data.user_type == 'admin':
-            table = table_map.get('subadmin')
-            result = supabase.table(table).select("id,phone,email").eq(lookup_field, data.identifier).execute()
-            if result.data:
-                resolved_type = 'subadmin'
-
-        if not result.data:
+        resolved_type, table, user = find_account(data.identifier, data.user_type, "id,phone,email", channel=data.channel)
+        if not user:
             raise HTTPException(status_code=404, detail="User not found")
 
         await verify_otp(OTPVerify(phone=data.identifier, code=data.code))
 
         supabase.table(table).update({
-            "password_hash": hash_password(data.new_password),
+            "password_hash": await hash_password(data.new_password),
             "updated_at": datetime.utcnow().isoformat()
-        }).eq("id", result.data[0]["id"]).execute()
+        }).eq("id", user["id"]).execute()
 
         return {"success": True, "message": "Password updated", "user_type": resolved_type, "channel": data.channel}
     except HTTPException:
@@ -1036,7 +1397,7 @@ async def register_passenger(data: UserRegisterPassenger):
             "phone": data.phone,
             "email": data.email,
             "city": data.city,
-            "password_hash": hash_password(data.password),
+            "password_hash": await hash_password(data.password),
             "profile_photo": data.profile_photo,
             "wallet_balance": 0,
             "is_verified": True,  # Set to True after OTP in production
@@ -1048,7 +1409,7 @@ async def register_passenger(data: UserRegisterPassenger):
         
         if result.data:
             user = result.data[0]
-            token = create_token(user['id'], 'passenger')
+            token = issue_token(user['id'], 'passenger', None, row=user)
             return {
                 "success": True,
                 "message": "Registration successful",
@@ -1086,7 +1447,7 @@ async def register_driver(data: UserRegisterDriver):
             "phone": data.phone,
             "email": data.email,
             "city": data.city,
-            "password_hash": hash_password(data.password),
+            "password_hash": await hash_password(data.password),
             "vehicle_type": data.vehicle_type,
             "vehicle_brand": data.vehicle_brand,
             "vehicle_model": data.vehicle_model,
@@ -1111,7 +1472,7 @@ async def register_driver(data: UserRegisterDriver):
         
         if result.data:
             user = result.data[0]
-            token = create_token(user['id'], 'driver')
+            token = issue_token(user['id'], 'driver', None, row=user)
             return {
                 "success": True,
                 "message": "Registration successful. Pending admin approval.",
@@ -1138,33 +1499,17 @@ async def register_driver(data: UserRegisterDriver):
 async def login(data: LoginRequest):
     """Login for all user types"""
     try:
-        table_map = {
-            'passenger': 'passengers',
-            'driver': 'drivers',
-            'admin': 'admins',
-            'subadmin': 'subadmins',
-            'superadmin': 'superadmins'
-        }
-        
-        table = table_map.get(data.user_type)
-        if not table:
+        if data.user_type not in USER_TABLES:
             raise HTTPException(status_code=400, detail="Invalid user type")
         
         # Find user by phone or email
-        result = supabase.table(table).select("*").or_(f"phone.eq.{data.phone_or_email},email.eq.{data.phone_or_email}").execute()
-        
-        if not result.data and data.user_type == 'admin':
-            table = table_map.get('subadmin')
-            result = supabase.table(table).select("*").or_(f"phone.eq.{data.phone_or_email},email.eq.{data.phone_or_email}").execute()
-            if result.data:
-                data.user_type = 'subadmin'
+        pv = profile_versions.now()
+        data.user_type, _, user = find_account(data.phone_or_email, data.user_type, LOGIN_COLUMNS)
         
-        if not result.data:
+        if not user:
             raise HTTPException(status_code=401, detail="Invalid credentials")
         
-        user = result.data[0]
-        
-        if not verify_password(data.password, user['password_hash']):
+        if not await verify_password(data.password, user['password_hash']):
             raise HTTPException(status_code=401, detail="Invalid credentials")
         
         if not user.get('is_active', True):
@@ -1174,7 +1519,7 @@ async def login(data: LoginRequest):
             user.get('admin_id') if data.user_type in ['driver', 'subadmin']
             else (user.get('id') if data.user_type == 'admin' else None)
         )
-        token = create_token(user['id'], data.user_type, admin_id)
+        token = issue_token(user['id'], data.user_type, admin_id, row=user, pv=pv)
         
         # Remove sensitive data
         user.pop('password_hash', None)
@@ -1208,7 +1553,7 @@ async def create_superadmin(data: SuperAdminCreate):
             "full_name": data.full_name,
             "phone": data.phone,
             "email": data.email,
-            "password_hash": hash_password(data.password),
+            "password_hash": await hash_password(data.password),
             "is_active": True
         }
         
@@ -1247,7 +1592,7 @@ async def create_admin(data: AdminCreate, current_user: dict = Depends(get_curre
             "full_name": data.full_name,
             "phone": data.phone,
             "email": data.email,
-            "password_hash": hash_password(data.password),
+            "password_hash": await hash_password(data.password),
             "address": data.address,
             "force_password_change": data.force_password_change if data.force_password_change is not None else True,
             "cities": data.cities,
@@ -1292,7 +1637,7 @@ async def create_subadmin(data: SubAdminCreate, current_user: dict = Depends(get
             "full_name": data.full_name,
             "phone": data.phone,
             "email": data.email,
-            "password_hash": hash_password(data.password),
+            "password_hash": await hash_password(data.password),
             "force_password_change": data.force_password_change if data.force_password_change is not None else True,
             "is_active": True
         }
@@ -1385,6 +1730,8 @@ async def update_admin(admin_id: str, data: AdminUpdate, current_user: dict = De
             raise HTTPException(status_code=400, detail="No fields to update")
         update_data["updated_at"] = datetime.utcnow().isoformat()
         result = supabase.table("admins").update(update_data).eq("id", admin_id).execute()
+        profile_changed(admin_id=admin_id)
+        invalidation_bus.publish("pricing", f"admin:{admin_id}")
         if result.data:
             admin = result.data[0]
             admin.pop('password_hash', None)
@@ -1442,6 +1789,7 @@ async def delete_admin(admin_id: str, current_user: dict = Depends(get_current_u
                 supabase.table("notifications").delete().in_("user_id", passenger_ids).execute()
 
             supabase.table("rides").delete().eq("admin_id", admin_id).execute()
+            _board_drop_admin(admin_id)
             if driver_ids:
                 supabase.table("rides").delete().in_("driver_id", driver_ids).execute()
             if passenger_ids:
@@ -1462,6 +1810,8 @@ async def delete_admin(admin_id: str, current_user: dict = Depends(get_current_u
             supabase.table("passengers").delete().eq("admin_id", admin_id).execute()
 
         result = supabase.table("admins").delete().eq("id", admin_id).execute()
+        profile_changed(admin_id=admin_id)
+        invalidation_bus.publish("pricing", f"admin:{admin_id}")
         if result.data:
             return {"success": True}
         raise HTTPException(status_code=404, detail="Admin not found")
@@ -1469,6 +1819,51 @@ async def delete_admin(admin_id: str, current_user: dict = Depends(get_current_u
         logger.error(f"Admin delete error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@api_router.get("/superadmin/runtime")
+async def get_runtime_stats(current_user: dict = Depends(get_current_user)):
+    """In-process caches and pools of this worker (token cache, bcrypt, ride board, SSE)"""
+    if current_user['user_type'] != 'superadmin':
+        raise HTTPException(status_code=403, detail="Only SuperAdmin can view stats")
+    return {
+        "pid": os.getpid(),
+        "token_cache": token_cache.stats(),
+        "profile_claims": profile_versions.stats(),
+        "invalidation": {
+            **invalidation_bus.stats(),
+            "caches": [cities_cache.stats(), pricing_cache.stats(), landing_cache.stats()],
+        },
+        "rate_limit": rate_limiter.stats(),
+        "otp": {**otp_store.stats(), **otp_audit.stats()},
+        "identity_directory": identity_directory.stats(),
+        "db": supabase.query_stats.stats(),
+        "profiling": request_profiler.stats(),
+        "event_loop": loop_monitor.stats(),
+        "tracing": tracer.stats(),
+        "password_hasher": password_hasher.stats(),
+        "ride_board": ride_board.stats(),
+        "realtime": event_broker.stats(),
+        "landing_page": landing_page.stats(),
+        "build_queue": _build_service.queue.stats() if _build_service is not None else None,
+        "build_templates": _build_service.node_modules.stats() if _build_service is not None else None,
+    }
+
+@api_router.get("/superadmin/profiles")
+async def list_profiles(current_user: dict = Depends(get_current_user)):
+    """Request profiles on disk, newest first (see X-Profile-Id)"""
+    if current_user['user_type'] != 'superadmin':
+        raise HTTPException(status_code=403, detail="Only SuperAdmin can view profiles")
+    return {"profiles": await asyncio.to_thread(request_profiler.list_profiles), "last": request_profiler.last}
+
+@api_router.get("/superadmin/profiles/{name}")
+async def download_profile(name: str, current_user: dict = Depends(get_current_user)):
+    """Download a profile in collapsed-stack format (flamegraph.pl, speedscope)"""
+    if current_user['user_type'] != 'superadmin':
+        raise HTTPException(status_code=403, detail="Only SuperAdmin can view profiles")
+    path = request_profiler.profile_path(name)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(path, media_type="text/plain", filename=name)
+
 @api_router.get("/superadmin/stats")
 async def get_superadmin_stats(current_user: dict = Depends(get_current_user)):
     """Get system-wide statistics"""
@@ -1589,6 +1984,7 @@ async def create_city(data: CityCreate, current_user: dict = Depends(get_current
         }
         
         result = supabase.table("cities").insert(city_data).execute()
+        invalidation_bus.publish("cities")
         if result.data:
             return {"success": True, "city": result.data[0]}
         raise HTTPException(status_code=500, detail="Creation failed")
@@ -1600,8 +1996,7 @@ async def create_city(data: CityCreate, current_user: dict = Depends(get_current
 async def get_cities():
     """Get all active cities"""
     try:
-        result = supabase.table("cities").select("*").eq("is_active", True).execute()
-        return {"cities": result.data or []}
+        return {"cities": get_cities_cached(active_only=True)}
     except Exception as e:
         logger.error(f"Get cities error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -1614,6 +2009,7 @@ async def delete_city(city_id: str, current_user: dict = Depends(get_current_use
     
     try:
         result = supabase.table("cities").delete().eq("id", city_id).execute()
+        invalidation_bus.publish("cities")
         if result.data:
             return {"success": True}
         raise HTTPException(status_code=404, detail="City not found")
@@ -1685,6 +2081,7 @@ async def update_pricing(scope: str = Query(...), data: PricingUpdate = None, cu
             elif key == "commission_rate":
                 payload[key] = data.commission_rate if data.commission_rate is not None else 0
         result = supabase.table("pricing_settings").upsert(payload, on_conflict="scope").execute()
+        invalidation_bus.publish("pricing", scope)
         pricing = result.data[0] if result.data else payload
         return {"pricing": pricing}
     except HTTPException:
@@ -1753,6 +2150,7 @@ async def update_admin_pricing(data: AdminPricingUpdate, current_user: dict = De
             if v is not None:
                 payload[key] = v
         result = supabase.table("admins").update(payload).eq("id", current_user['user_id']).execute()
+        invalidation_bus.publish("pricing", f"admin:{current_user['user_id']}")
         if result.data:
             return {"pricing": result.data[0]}
         raise HTTPException(status_code=404, detail="Admin not found")
@@ -1844,6 +2242,7 @@ async def update_city(city_id: str, data: CityUpdate, current_user: dict = Depen
     try:
         update_data = {k: v for k, v in data.dict().items() if v is not None}
         result = supabase.table("cities").update(update_data).eq("id", city_id).execute()
+        invalidation_bus.publish("cities")
         if result.data:
             return {"success": True, "city": result.data[0]}
         raise HTTPException(status_code=404, detail="City not found")
@@ -1864,10 +2263,9 @@ async def get_drivers(status: Optional[str] = None, city: Optional[str] = None,
         admin_brand_name = None
         if current_user['user_type'] in ['admin', 'subadmin']:
             admin_id = current_user['admin_id'] if current_user['user_type'] == 'subadmin' else current_user['user_id']
-            admin = supabase.table("admins").select("cities,brand_name").eq("id", admin_id).execute()
-            if admin.data:
-                admin_cities = admin.data[0].get('cities', []) or []
-                admin_brand_name = admin.data[0].get('brand_name')
+            admin_scope = get_user_profile(current_user)
+            admin_cities = admin_scope.get('cities', []) or []
+            admin_brand_name = admin_scope.get('brand_name')
 
         if status:
             query = query.eq("status", status)
@@ -1921,10 +2319,9 @@ async def remind_drivers_missing_docs(payload: DriverReminderRequest, current_us
         admin_brand_name = None
         if current_user['user_type'] in ['admin', 'subadmin']:
             admin_id = current_user['admin_id'] if current_user['user_type'] == 'subadmin' else current_user['user_id']
-            admin = supabase.table("admins").select("cities,brand_name").eq("id", admin_id).execute()
-            if admin.data:
-                admin_cities = admin.data[0].get('cities', []) or []
-                admin_brand_name = admin.data[0].get('brand_name')
+            admin_scope = get_user_profile(current_user)
+            admin_cities = admin_scope.get('cities', []) or []
+            admin_brand_name = admin_scope.get('brand_name')
 
         if payload.status:
             query = query.eq("status", payload.status)
@@ -1986,9 +2383,9 @@ async def approve_driver(driver_id: str, current_user: dict = Depends(get_curren
             admin_id = current_user.get('admin_id')
 
         if current_user['user_type'] in ['admin', 'subadmin']:
-            admin = supabase.table("admins").select("cities,brand_name").eq("id", admin_id).execute()
-            admin_cities = admin.data[0].get("cities", []) if admin.data else []
-            admin_brand_name = admin.data[0].get("brand_name") if admin.data else None
+            admin_scope = get_user_profile(current_user)
+            admin_cities = admin_scope.get("cities", [])
+            admin_brand_name = admin_scope.get("brand_name")
             if admin_cities and driver.get("city") not in admin_cities:
                 raise HTTPException(status_code=403, detail="Driver not in your cities")
             if admin_brand_name and not driver.get("admin_id"):
@@ -2007,6 +2404,7 @@ async def approve_driver(driver_id: str, current_user: dict = Depends(get_curren
         }
         
         result = supabase.table("drivers").update(update_data).eq("id", driver_id).execute()
+        profile_changed(user_id=driver_id)
         if result.data:
             supabase.table("driver_verifications").insert({
                 "id": str(uuid.uuid4()),
@@ -2133,7 +2531,7 @@ async def create_driver_by_admin(data: AdminDriverCreate, current_user: dict = D
             "phone": data.phone,
             "email": data.email,
             "city": data.city,
-            "password_hash": hash_password(data.password),
+            "password_hash": await hash_password(data.password),
             "vehicle_type": data.vehicle_type,
             "vehicle_brand": data.vehicle_brand,
             "vehicle_model": data.vehicle_model,
@@ -2198,6 +2596,25 @@ async def mark_notifications_read(current_user: dict = Depends(get_current_user)
         logger.error(f"Mark notifications read error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@api_router.get("/events/stream")
+async def stream_user_events(request: Request, current_user: dict = Depends(get_current_user)):
+    """SSE stream: notifications, ride status and wallet changes for the current user.
+
+    Events: notification, ride, wallet (+ ready, resync). Reconnect with Last-Event-ID to resume.
+    """
+    last_event_id = parse_last_event_id(
+        request.headers.get("last-event-id") or request.query_params.get("last_event_id")
+    )
+    return StreamingResponse(
+        stream_events(event_broker, current_user['user_id'], last_event_id, request.is_disconnected),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+            "X-Accel-Buffering": "no",
+        },
+    )
+
 # ============== PASSENGER ENDPOINTS ==============
 
 @api_router.get("/passengers")
@@ -2217,9 +2634,7 @@ async def get_passengers(
         admin_brand_name = None
         if current_user['user_type'] in ['admin', 'subadmin']:
             admin_owner_id = current_user['admin_id'] if current_user['user_type'] == 'subadmin' else current_user['user_id']
-            admin = supabase.table("admins").select("brand_name").eq("id", admin_owner_id).execute()
-            if admin.data:
-                admin_brand_name = admin.data[0].get("brand_name")
+            admin_brand_name = get_user_profile(current_user).get("brand_name")
 
         if current_user['user_type'] == 'admin':
             if admin_brand_name:
@@ -2508,13 +2923,12 @@ async def estimate_ride(
         current_user = None
         if credentials:
             try:
-                current_user = decode_token(credentials.credentials)
+                current_user = authenticate_token(credentials.credentials)
             except Exception:
                 current_user = None
 
         # Get city pricing
-        city_result = supabase.table("cities").select("*").execute()
-        cities = city_result.data or []
+        cities = get_cities_cached()
         
         # Use default pricing if city not found
         city_data = cities[0] if cities else {
@@ -2529,18 +2943,11 @@ async def estimate_ride(
 
         pricing_data = None
         if current_user and current_user.get('user_type') == 'passenger':
-            passenger = supabase.table("passengers").select("admin_id").eq("id", current_user['user_id']).execute()
-            admin_id = passenger.data[0].get('admin_id') if passenger.data else None
+            admin_id = get_user_profile(current_user).get('admin_id')
             if admin_id:
-                admin_pricing = supabase.table("admins").select(
-                    "base_fare,price_per_km,price_per_min,base_fare_moto,base_fare_car,price_per_km_moto,price_per_km_car,price_per_min_moto,price_per_min_car,surge_multiplier"
-                ).eq("id", admin_id).execute()
-                if admin_pricing.data:
-                    pricing_data = admin_pricing.data[0]
+                pricing_data = get_admin_pricing_cached(admin_id)
             else:
-                pricing_result = supabase.table("pricing_settings").select("*").eq("scope", "direct").execute()
-                if pricing_result.data:
-                    pricing_data = pricing_result.data[0]
+                pricing_data = get_direct_pricing_cached()
         
         pricing = calculate_ride_price(
             city_data,
@@ -2565,9 +2972,9 @@ async def create_ride(data: RideRequest, current_user: dict = Depends(get_curren
         raise HTTPException(status_code=403, detail="Only passengers can request rides")
     
     try:
-        passenger = supabase.table("passengers").select("admin_id,city").eq("id", current_user['user_id']).execute()
-        admin_id = passenger.data[0].get('admin_id') if passenger.data else None
-        passenger_city = passenger.data[0].get('city') if passenger.data else None
+        passenger = get_user_profile(current_user)
+        admin_id = passenger.get('admin_id')
+        passenger_city = passenger.get('city')
         matched_driver = None
         eta_minutes = None
         contact_code = None
@@ -2641,6 +3048,7 @@ async def create_ride(data: RideRequest, current_user: dict = Depends(get_curren
             "estimated_price": data.estimated_price,
             "status": "scheduled" if is_scheduled else "pending",
             "payment_method": payment_method,
+            "city": passenger_city,
             "admin_id": admin_id,
             "scheduled_at": data.scheduled_at
         }
@@ -2656,6 +3064,14 @@ async def create_ride(data: RideRequest, current_user: dict = Depends(get_curren
         
         result = supabase.table("rides").insert(ride_data).execute()
         if result.data:
+            if passenger:
+                _track_ride({
+                    **result.data[0],
+                    "passenger_name": passenger.get("full_name"),
+                    "passenger_phone": passenger.get("phone"),
+                })
+            else:
+                _track_ride(result.data[0])
             if matched_driver and not is_scheduled:
                 driver_name = matched_driver.get('full_name', 'Chofè')
                 vehicle_brand = matched_driver.get('vehicle_brand') or ''
@@ -2700,11 +3116,25 @@ async def get_rides(status: Optional[str] = None, current_user: dict = Depends(g
     try:
         query = supabase.table("rides").select("*")
         
+        if current_user['user_type'] == 'driver' and ride_board.ready:
+            # Own rides by driver_id; open rides of the scope from the board
+            query = query.eq("driver_id", current_user['user_id'])
+            if status:
+                query = query.eq("status", status)
+            rides = query.order("created_at", desc=True).execute().data or []
+            if not status or status == "pending":
+                scope = get_user_profile(current_user)
+                _, open_rides = ride_board.snapshot(scope.get("admin_id"), scope.get("vehicle_type"), scope.get("city"))
+                own_ids = {r.get("id") for r in rides}
+                rides.extend(r for r in open_rides if r.get("id") not in own_ids)
+                rides.sort(key=lambda r: str(r.get("created_at") or ""), reverse=True)
+            _attach_passenger_info(rides)
+            return {"rides": rides}
+
         if current_user['user_type'] == 'passenger':
             query = query.eq("passenger_id", current_user['user_id'])
         elif current_user['user_type'] == 'driver':
-            driver_info = supabase.table("drivers").select("admin_id,vehicle_type").eq("id", current_user['user_id']).execute()
-            driver_data = driver_info.data[0] if driver_info.data else {}
+            driver_data = get_user_profile(current_user)
             driver_admin_id = driver_data.get("admin_id")
             driver_vehicle = driver_data.get("vehicle_type")
 
@@ -2727,28 +3157,43 @@ async def get_rides(status: Optional[str] = None, current_user: dict = Depends(g
         rides = result.data or []
 
         if current_user['user_type'] == 'driver' and rides:
-            passenger_ids = list({r.get("passenger_id") for r in rides if r.get("passenger_id")})
-            if passenger_ids:
-                passengers = (
-                    supabase.table("passengers")
-                    .select("id,full_name,phone")
-                    .in_("id", passenger_ids)
-                    .execute()
-                    .data
-                    or []
-                )
-                passenger_map = {p["id"]: p for p in passengers}
-                for ride in rides:
-                    passenger = passenger_map.get(ride.get("passenger_id"))
-                    if passenger:
-                        ride["passenger_name"] = passenger.get("full_name")
-                        ride["passenger_phone"] = passenger.get("phone")
+            # Same city rule as the board: open rides of the driver's city, or without a city
+            driver_city = driver_data.get("city")
+            if driver_city:
+                rides = [r for r in rides if r.get("driver_id") or not r.get("city") or r.get("city") == driver_city]
+            _attach_passenger_info(rides)
 
         return {"rides": rides}
     except Exception as e:
         logger.error(f"Get rides error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@api_router.get("/rides/pending-feed")
+async def get_pending_ride_feed(since: Optional[str] = None, current_user: dict = Depends(get_current_user)):
+    """Driver: open rides of the driver's scope, from the in-memory board.
+
+    Pass the last `version` as `since`: if nothing changed, `changed` is false and `rides` is empty.
+    Versions are opaque and per worker: one from another worker always counts as changed.
+    """
+    if current_user['user_type'] != 'driver':
+        raise HTTPException(status_code=403, detail="Driver only")
+    try:
+        if not ride_board.ready:
+            await asyncio.to_thread(_sync_ride_board)
+        scope = get_user_profile(current_user)
+        admin_id, vehicle_type, city = scope.get("admin_id"), scope.get("vehicle_type"), scope.get("city")
+        version = ride_board.feed_version(ride_board.scope_version(admin_id, vehicle_type, city))
+        if since is not None and since == version:
+            return {"version": version, "changed": False, "rides": []}
+        seq, rides = ride_board.snapshot(admin_id, vehicle_type, city)
+        _attach_passenger_info(rides)
+        return {"version": ride_board.feed_version(seq), "changed": True, "rides": rides}
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Pending ride feed error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 async def _create_test_ride_for_driver(driver_id: str):
     try:
         driver_result = supabase.table("drivers").select(
@@ -2776,7 +3221,7 @@ async def _create_test_ride_for_driver(driver_id: str):
         distance_km = calculate_distance_km(pickup_lat, pickup_lng, dest_lat, dest_lng)
         duration_min = max(5, distance_km * 3)
 
-        cities = supabase.table("cities").select("*").execute().data or []
+        cities = get_cities_cached()
         city_name = driver.get("city") or ""
         city_data = next(
             (c for c in cities if str(c.get("name", "")).lower() == str(city_name).lower()),
@@ -2852,7 +3297,7 @@ async def _create_test_ride_for_scope(
         distance_km = calculate_distance_km(pickup_lat, pickup_lng, destination_lat, destination_lng)
         duration_min = max(5, distance_km * 3)
 
-        cities = supabase.table("cities").select("*").execute().data or []
+        cities = get_cities_cached()
         city_data = next(
             (c for c in cities if str(c.get("name", "")).lower() == str(city_name or "").lower()),
             cities[0] if cities else {
@@ -2890,6 +3335,7 @@ async def _create_test_ride_for_scope(
 
         result = supabase.table("rides").insert(ride_data).execute()
         if result.data:
+            _board_apply(result.data[0])
             return result.data[0]
         raise HTTPException(status_code=500, detail="Test ride creation failed")
     except HTTPException:
@@ -2913,10 +3359,9 @@ async def create_test_ride_admin(payload: TestRideRequest, current_user: dict =
         admin_id = payload.admin_id
     elif current_user['user_type'] in ['admin', 'subadmin']:
         admin_id = current_user['admin_id'] if current_user['user_type'] == 'subadmin' else current_user['user_id']
-        admin = supabase.table("admins").select("cities,brand_name").eq("id", admin_id).execute()
-        if admin.data:
-            admin_city = (admin.data[0].get("cities") or [None])[0]
-            admin_brand_name = admin.data[0].get("brand_name")
+        admin_scope = get_user_profile(current_user)
+        admin_city = (admin_scope.get("cities") or [None])[0]
+        admin_brand_name = admin_scope.get("brand_name")
 
     city_name = payload.city or admin_city
     vehicle_type = payload.vehicle_type
@@ -3019,7 +3464,10 @@ async def accept_ride(ride_id: str, current_user: dict = Depends(get_current_use
         }).eq("id", ride_id).eq("status", "pending").execute()
         
         if result.data:
+            _track_ride(result.data[0], previous_status=ride.get("status"))
             return {"success": True, "ride": result.data[0]}
+        # Lost the race: drop the stale board entry so other drivers stop seeing it
+        _board_remove(ride_id)
         raise HTTPException(status_code=404, detail="Ride not found or already accepted")
     except Exception as e:
         logger.error(f"Accept ride error: {e}")
@@ -3068,6 +3516,7 @@ async def update_ride_status(ride_id: str, data: RideStatusUpdate, current_user:
         result = supabase.table("rides").update(update_data).eq("id", ride_id).execute()
         
         if result.data:
+            _track_ride({**ride, **result.data[0]}, previous_status=ride.get("status"))
             if data.status == "completed" and not was_completed:
                 driver_id = ride.get("driver_id")
                 if driver_id:
@@ -3314,6 +3763,10 @@ async def request_withdraw(data: WithdrawRequest, current_user: dict = Depends(g
             "updated_at": datetime.utcnow().isoformat(),
         }).eq("chauffeur_id", chauffeur_id).execute()
         supabase.table("drivers").update({"wallet_balance": new_balance, "updated_at": datetime.utcnow().isoformat()}).eq("id", chauffeur_id).execute()
+        _publish_wallet_event(
+            chauffeur_id, "retrait_demande",
+            retrait_id=retrait_id, montant=montant, balance=new_balance, balance_en_attente=new_attente,
+        )
 
         create_notification(
             chauffeur_id,
@@ -3439,6 +3892,10 @@ async def traiter_retrait(retrait_id: str, current_user: dict = Depends(get_curr
             "reference": retrait_id,
             "statut": "ok",
         }).execute()
+        _publish_wallet_event(
+            chauffeur_id, "retrait_traite",
+            retrait_id=retrait_id, montant=montant, balance_en_attente=max(0, attente), total_retire=total_retire,
+        )
         create_notification(
             chauffeur_id,
             "driver",
@@ -3481,6 +3938,10 @@ async def annuler_retrait(retrait_id: str, current_user: dict = Depends(get_curr
             "date_traitement": datetime.utcnow().isoformat(),
             "traite_par": current_user["user_id"],
         }).eq("id", retrait_id).execute()
+        _publish_wallet_event(
+            chauffeur_id, "retrait_annule",
+            retrait_id=retrait_id, montant=montant, balance=new_balance, balance_en_attente=max(0, attente),
+        )
         create_notification(
             chauffeur_id,
             "driver",
@@ -3523,9 +3984,9 @@ async def get_admin_stats(current_user: dict = Depends(get_current_user)):
     
     try:
         if current_user['user_type'] == 'admin':
-            admin = supabase.table("admins").select("cities,brand_name").eq("id", current_user['user_id']).execute()
-            admin_cities = admin.data[0].get('cities', []) if admin.data else []
-            admin_brand_name = admin.data[0].get('brand_name') if admin.data else None
+            admin_scope = get_user_profile(current_user)
+            admin_cities = admin_scope.get('cities', [])
+            admin_brand_name = admin_scope.get('brand_name')
 
             drivers_query = supabase.table("drivers").select("id,status")
             passengers_query = supabase.table("passengers").select("id")
@@ -3612,10 +4073,10 @@ async def change_password(data: PasswordChange, current_user: dict = Depends(get
         if not result.data:
             raise HTTPException(status_code=404, detail="User not found")
         hashed = result.data[0].get('password_hash')
-        if not verify_password(data.current_password, hashed):
+        if not await verify_password(data.current_password, hashed):
             raise HTTPException(status_code=400, detail="Invalid current password")
         supabase.table(table).update({
-            "password_hash": hash_password(data.new_password),
+            "password_hash": await hash_password(data.new_password),
             "updated_at": datetime.utcnow().isoformat()
         }).eq("id", current_user['user_id']).execute()
         return {"success": True}
@@ -3626,7 +4087,7 @@ async def change_password(data: PasswordChange, current_user: dict = Depends(get
         raise HTTPException(status_code=500, detail=str(e))
 
 @api_router.put("/profile")
-async def update_profile(data: Dict[str, Any], current_user: dict = Depends(get_current_user)):
+async def update_profile(data: Dict[str, Any], response: Response, current_user: dict = Depends(get_current_user)):
     """Update current user profile"""
     try:
         table_map = {
@@ -3713,11 +4174,18 @@ async def update_profile(data: Dict[str, Any], current_user: dict = Depends(get_
                     raise HTTPException(status_code=400, detail="Bank must be enabled for default")
         update_data["updated_at"] = datetime.utcnow().isoformat()
         result = supabase.table(table).update(update_data).eq("id", current_user['user_id']).execute()
+        profile_changed(
+            user_id=current_user['user_id'],
+            admin_id=current_user['user_id'] if current_user['user_type'] == 'admin' else None,
+        )
         if result.data:
             user = result.data[0]
             user.pop('password_hash', None)
             user['user_type'] = current_user['user_type']
-            return {"user": user}
+            # Fresh token: the claims of the previous one are now stale
+            token = issue_token(current_user['user_id'], current_user['user_type'], current_user.get('admin_id'), row=user)
+            response.headers["X-Refreshed-Token"] = token
+            return {"user": user, "token": token}
         raise HTTPException(status_code=404, detail="User not found")
     except HTTPException:
         raise
@@ -3842,6 +4310,7 @@ async def update_my_vehicle(
     try:
         if vehicle_id == driver_id:
             result = supabase.table("drivers").update(update_data).eq("id", driver_id).execute()
+            profile_changed(user_id=driver_id)
             if not result.data:
                 raise HTTPException(status_code=404, detail="User not found")
             return {"vehicle": {**result.data[0], "id": driver_id, "is_primary": True}}
@@ -3892,8 +4361,16 @@ async def generate_build(data: BuildRequest, current_user: dict = Depends(get_cu
         if not brand.data:
             raise HTTPException(status_code=404, detail="Brand not found")
 
-        build_id = await build_service.create_build(data.brand_id, data.dict())
-        return {"success": True, "build_id": build_id, "message": "Build started successfully"}
+        service = get_build_service()
+        build_id = await service.create_build(data.brand_id, data.dict())
+        invalidation_bus.publish("builds", build_id)
+        position = service.queue_position(build_id)
+        return {
+            "success": True,
+            "build_id": build_id,
+            "queue_position": position,
+            "message": f"Build queued (position {position})" if position else "Build started successfully",
+        }
     except HTTPException:
         raise
     except Exception as e:
@@ -3913,7 +4390,7 @@ async def cancel_build(build_id: str, current_user: dict = Depends(get_current_u
             detail="Se SuperAdmin sèlman ki ka anile yon build.",
         )
     try:
-        build_service.request_cancel(build_id)
+        get_build_service().request_cancel(build_id)
         return {"success": True, "message": "Demann anilasyon voye. Build la ap sispann byento."}
     except Exception as e:
         logger.error(f"Cancel build error: {e}")
@@ -3927,7 +4404,7 @@ async def get_build_status(build_id: str, current_user: dict = Depends(get_curre
         raise HTTPException(status_code=403, detail="Only SuperAdmin can view builds")
 
     try:
-        status = build_service.get_build_status(build_id)
+        status = get_build_service().get_build_status(build_id)
         if not status:
             raise HTTPException(status_code=404, detail="Build not found")
         return {"build": status}
@@ -3945,7 +4422,7 @@ async def list_builds(brand_id: Optional[str] = None, current_user: dict = Depen
         raise HTTPException(status_code=403, detail="Only SuperAdmin can view builds")
 
     try:
-        builds = build_service.list_builds(brand_id)
+        builds = get_build_service().list_builds(brand_id)
         return {"builds": builds}
     except Exception as e:
         logger.error(f"List builds error: {e}")
@@ -3959,7 +4436,7 @@ async def download_build(build_id: str, current_user: dict = Depends(get_current
         raise HTTPException(status_code=403, detail="Only SuperAdmin can download builds")
 
     try:
-        status = build_service.get_build_status(build_id)
+        status = get_build_service().get_build_status(build_id)
         if not status:
             raise HTTPException(status_code=404, detail="Build not found")
         if status.get("status") != "success":
@@ -3988,7 +4465,7 @@ async def submit_build_to_play_store(data: BuildSubmitRequest, current_user: dic
     if current_user['user_type'] != 'superadmin':
         raise HTTPException(status_code=403, detail="Only SuperAdmin can submit builds")
     try:
-        result = build_service.submit_build_to_play_store(data.build_id, data.track or "internal")
+        result = get_build_service().submit_build_to_play_store(data.build_id, data.track or "internal")
         return {"success": True, **result}
     except HTTPException:
         raise
@@ -4006,7 +4483,7 @@ async def clear_build_cache(current_user: dict = Depends(get_current_user)):
             detail="Se SuperAdmin sèlman ki ka netwaye cache build la. Konekte kòm SuperAdmin."
         )
     try:
-        result = build_service.clear_build_cache()
+        result = get_build_service().clear_build_cache()
         return {"success": True, **result}
     except Exception as e:
         logger.error(f"Clear build cache error: {e}")
@@ -4019,7 +4496,7 @@ async def clear_failed_builds(brand_id: Optional[str] = None, current_user: dict
     if current_user['user_type'] != 'superadmin':
         raise HTTPException(status_code=403, detail="Only SuperAdmin can clear failed builds")
     try:
-        result = build_service.clear_failed_builds(brand_id)
+        result = get_build_service().clear_failed_builds(brand_id)
         return {"success": True, **result}
     except Exception as e:
         logger.error(f"Clear failed builds error: {e}")
@@ -4100,7 +4577,7 @@ FOOTER_DEFAULTS = {
     "whitelabel_confirm_body": "Bonjou {{name}},\n\nMèsi paske ou te voye demann ou pou {{company}} ({{zone}}).\n\nNou resevwa li byen. Yon nan ekspè nou nan depatman an ap kontakte w pou yon kout diskisyon.\n\nNou ap reponn ou byento!\n\nBonjou,\nEkip TapTapGo",
     "support_sant_ed_content": "🆘 SANT ED — REPONS RAPID POU KESYON W\n\n═══════════════════════════════════════\n\n📱 SÈVI AK APP LA\n\n❓ Kijan mwen mande yon kous?\n✅ Ouvri app TapTapGo, antre adrès ou ak kote w prale. Konfime pri a epi chofè a ap vin pran w.\n\n❓ Kijan mwen ka anile yon kous?\n✅ Klike sou bouton \"Anile Kous\" avan chofè a rive. Si w anile apre 2 minit, ka gen yon ti frè anilasyon.\n\n❓ Èske mwen ka planifye yon kous pou pita?\n✅ Wi! Chwazi \"Planifye Kous\" epi seleksyone lè ak dat ou vle pati. Chofè a ap vin nan lè egzat.\n\n❓ Kijan mwen ka suiv chofè a?\n✅ Yon fwa w mande kous la, ou ap wè machin nan sou kat la an tan reyèl. Ou ka pataje trajè w ak fanmi w tou.\n\n❓ Èske mwen bezwen entènèt pou sèvi ak app la?\n✅ Ou bezwen entènèt pou mande kous la, men GPS la fonksyone ofline pou montre wout la.\n\n═══════════════════════════════════════\n\n💳 KESYON SOU PEMAN\n\n❓ Kijan mwen peye?\n✅ Ou kapab peye avèk MonCash, NatCash, kach oswa lòt metòd disponib nan app la.\n\n❓ Èske mwen ka peye apre kous la?\n✅ Wi! Si w chwazi \"Peye an Kach\", w ap peye chofè a dirèk apre kous la fini.\n\n❓ Èske gen frè kache?\n✅ NON! Pri ou wè avan w monte se pri total. 0 sipriz, 0 frè adisyonèl.\n\n❓ Èske mwen ka bay poubwa?\n✅ Wi! Ou ka bay poubwa an kach oswa ajoute l nan app la apre kous la.\n\n❓ Kijan mwen jwenn resi mwen?\n✅ Ale nan \"Istwa Kous\" epi klike sou kous la. Ou ka telechaje resi a oswa resevwa l pa imèl.\n\n═══════════════════════════════════════\n\n🛡️ SEKIRITE AK PWOTEKSYON\n\n❓ Kijan mwen konnen chofè a verifye?\n✅ TOUT chofè pase verifikasyon : ID nasyonal, kasye jidisyè, entèvyou, ak fòmasyon. Ou wè foto yo ak nòt yo nan app la.\n\n❓ Sa pou m fè si m santi m pa an sekirite?\n✅ Klike sou bouton SOS WOUJ la nan app la. Sa ap kontakte fòs lòd ak fanmi w otomatikman.\n\n❓ Èske fanmi m ka suiv kous mwen?\n✅ Wi! Ou ka pataje kous la an DIRÈK avèk moun ou fè konfyans. Yo ap wè egzakteman kote w ye.\n\n❓ Sa pase si m bliye yon bagay nan machin nan?\n✅ Kontakte nou imedyatman (24/7). Nou ap pale ak chofè a epi ede w jwenn bagay ou a.\n\n❓ Kijan mwen rapòte yon pwoblèm?\n✅ Ale nan \"Istwa Kous\", chwazi kous la, epi klike \"Rapòte Pwoblèm\". Nou ap reponn nan mwens pase 24 èdtan.\n\n═══════════════════════════════════════\n\n🚗 POU CHOFÈ YO\n\n❓ Kijan mwen vin chofè?\n✅ Ouvri app la, chwazi mòd chofè, epi ranpli fòmilè enskripsyon an. Ekip nou an ap verifye enfòmasyon w epi apwouve w.\n\n❓ Ki dokiman mwen bezwen?\n✅ ID nasyonal, pèmi kondi, kat gri machin nan, kat asirans, ak 2 foto pasepò.\n\n❓ Konbyen tan li pran pou yo apwouve m?\n✅ Si tout dokiman w kòrèk, apwobasyon an pran 24-48 èdtan.\n\n❓ Èske mwen peye pou enskripsyon?\n✅ NON! Enskripsyon an 100% GRATIS. Nou pa mande okenn frè davans.\n\n❓ Konbyen mwen ka fè pa jou?\n✅ Sa depann de konbyen kous ou aksepte. Chofè nou yo fè ant 1,500-5,000 goud pa jou an mwayèn.\n\n❓ Kilè mwen resevwa lajan mwen?\n✅ Lajan pou chak kous transfere OTOMATIKMAN chak jou oswa chak semèn selon preferans ou.\n\n❓ Èske mwen ka refize yon kous?\n✅ Wi! Ou ka aksepte oswa refize nenpòt kous. Men atansyon, si w refize twòp, sa ka afekte nòt ou.\n\n═══════════════════════════════════════\n\n⚙️ PWOBLÈM TEKNIK\n\n❓ App la pa ouvè — sa pou m fè?\n✅ 1) Verifye si ou gen dènye vèsyon an\n   2) Redémarre telefòn ou\n   3) Si sa pa mache, kontakte nou\n\n❓ Kijan mwen mete ajou app la?\n✅ Ale nan Play Store (Android) oswa App Store (iPhone), chèche \"TapTapGo\", epi klike \"Mete Ajou\".\n\n❓ App la manje twòp batri — poukisa?\n✅ GPS la itilize batri. Mete \"Mode Ekonomi Batri\" nan Settings pou redui sa.\n\n❓ Mwen pa resevwa notifikasyon — poukisa?\n✅ Ale nan Settings telefòn ou → Aplikasyon → TapTapGo → Notifikasyon epi aktive yo.\n\n❓ Kijan mwen chanje enfòmasyon mwen?\n✅ Ale nan \"Pwofil\" → \"Modifye Enfòmasyon\" → Fè chanjman yo → Anrejistre.\n\n═══════════════════════════════════════\n\n📞 GEN YON PWOBLÈM?\n\nKontakte nou pa telefòn, WhatsApp oswa imèl (gade \"Kontakte Nou\"). \n\n🕐 Nou la pou ede w 24/7!\n\n📱 WhatsApp : [+509 XXXX XXXX]\n📧 Email : support@taptapgo.ht\n💬 Chat Live : Nan app la\n\n═══════════════════════════════════════\n\n❓ PA JWENN REPONS OU?\n\n[BOUTON : PALE AK YON AJAN]\n[BOUTON : GADE VIDEYO EKSPLIKASYON]\n\nNou la pou ou, chak jou, chak èdtan! 💚",
     "support_kontak_content": "TapTapGo — Kontakte Nou\n\n• Telefòn sipò: +509 XX XX XX XX\n• WhatsApp: +509 XX XX XX XX\n• Imèl: sipò@taptapgoht.com\n\nLè nou ouvri: 24/7\n\nPou demann White-Label (marque pwop ou), ranpli fòmilè a sou paj sa a. Ekip nou an ap kontakte w byento.\n\nPou chofè ak pasajè: Ouvri app la epi ale nan \"Èd & Sipò\" pou jwenn lyen dirèk pou rele oswa WhatsApp.",
-    "support_politik_content": _load_politik_content(),
+    "support_politik_content": "",  # lu depuis support_politik_content.txt par _footer_defaults()
     "support_video_url": "",
     "image_ride_url": "",
     "image_moto_url": "",
@@ -4133,14 +4610,20 @@ FOOTER_DEFAULTS = {
 }
 
 
-def _get_footer_merged() -> Dict[str, Any]:
+@lru_cache(maxsize=1)
+def _footer_defaults() -> Dict[str, Any]:
+    """FOOTER_DEFAULTS with the privacy policy file read on first use."""
+    return {**FOOTER_DEFAULTS, "support_politik_content": _load_politik_content()}
+
+
+def _read_landing_row(key: str) -> Dict[str, Any]:
+    r = supabase.table("landing_content").select("value").eq("key", key).execute()
+    return (r.data[0]["value"] or {}) if r.data else {}
+
+
+def _merge_footer(stored: Dict[str, Any]) -> Dict[str, Any]:
     """Merge stored footer with defaults."""
-    try:
-        r = supabase.table("landing_content").select("value").eq("key", "footer").execute()
-        stored = (r.data[0]["value"] or {}) if r.data else {}
-    except Exception:
-        stored = {}
-    result = dict(FOOTER_DEFAULTS)
+    result = dict(_footer_defaults())
     if stored.get("brand_title") is not None:
         result["brand_title"] = stored["brand_title"]
     if stored.get("brand_text") is not None:
@@ -4180,13 +4663,8 @@ def _get_footer_merged() -> Dict[str, Any]:
     return result
 
 
-def _get_landing_merged() -> Dict[str, str]:
+def _merge_landing(stored: Dict[str, Any]) -> Dict[str, str]:
     """Merge stored content with defaults."""
-    try:
-        r = supabase.table("landing_content").select("value").eq("key", "sections").execute()
-        stored = (r.data[0]["value"] or {}) if r.data else {}
-    except Exception:
-        stored = {}
     result = dict(LANDING_DEFAULTS)
     for k, v in stored.items():
         if v is not None and str(v).strip():
@@ -4194,14 +4672,47 @@ def _get_landing_merged() -> Dict[str, str]:
     return result
 
 
+def _build_landing_blob() -> Dict[str, Any]:
+    """Merged content + footer, serialized once; the ETag is the hash of the JSON body."""
+    merged = {
+        "content": _merge_landing(_read_landing_row("sections")),
+        "footer": _merge_footer(_read_landing_row("footer")),
+    }
+    body = json.dumps(merged, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return {"merged": merged, "body": body, "etag": f'"{hashlib.sha256(body).hexdigest()[:20]}"'}
+
+
+def _landing_blob() -> Dict[str, Any]:
+    """Shared cached blob (do not mutate); DB errors are not cached."""
+    return landing_cache.get_or_load("blob", _build_landing_blob)
+
+
+def _get_footer_merged() -> Dict[str, Any]:
+    try:
+        return _landing_blob()["merged"]["footer"]
+    except Exception:
+        return _merge_footer({})
+
+
+def _get_landing_merged() -> Dict[str, str]:
+    try:
+        return _landing_blob()["merged"]["content"]
+    except Exception:
+        return _merge_landing({})
+
+
 @api_router.get("/landing")
-async def get_landing_content():
-    """Public - get landing page content + footer (merge defaults + stored)."""
+async def get_landing_content(request: Request):
+    """Public - get landing page content + footer (merge defaults + stored), served pre-serialized."""
     try:
-        return {"content": _get_landing_merged(), "footer": _get_footer_merged()}
+        blob = _landing_blob()
     except Exception as e:
         logger.error(f"Get landing error: {e}")
-        return {"content": LANDING_DEFAULTS, "footer": FOOTER_DEFAULTS}
+        return {"content": LANDING_DEFAULTS, "footer": _footer_defaults()}
+    headers = {"ETag": blob["etag"], "Cache-Control": "no-cache"}
+    if request.headers.get("if-none-match") == blob["etag"]:
+        return Response(status_code=304, headers=headers)
+    return Response(blob["body"], media_type="application/json", headers=headers)
 
 
 class WhiteLabelRequestCreate(BaseModel):
@@ -4246,6 +4757,9 @@ def _send_email_smtp(to_email: str, subject: str, body: str) -> None:
     smtp_from = os.environ.get("SMTP_FROM") or smtp_user
     if not all([smtp_host, smtp_user, smtp_pass]):
         raise RuntimeError("SMTP non configuré (SMTP_HOST, SMTP_USER, SMTP_PASS)")
+    import smtplib
+    from email.mime.multipart import MIMEMultipart
+    from email.mime.text import MIMEText
     msg = MIMEMultipart()
     msg["From"] = smtp_from
     msg["To"] = to_email
@@ -4518,7 +5032,8 @@ async def update_landing(data: LandingUpdate, current_user: dict = Depends(get_c
                 {"key": "footer", "value": data.footer, "updated_at": datetime.utcnow().isoformat()},
                 on_conflict="key",
             ).execute()
-        return {"success": True, "content": _get_landing_merged(), "footer": _get_footer_merged()}
+        invalidation_bus.publish("landing")
+        return {"success": True, **_landing_blob()["merged"]}
     except Exception as e:
         logger.error(f"Update landing error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -4538,7 +5053,8 @@ async def reset_landing(current_user: dict = Depends(get_current_user)):
             {"key": "footer", "value": {}, "updated_at": datetime.utcnow().isoformat()},
             on_conflict="key",
         ).execute()
-        return {"success": True, "content": LANDING_DEFAULTS, "footer": FOOTER_DEFAULTS}
+        invalidation_bus.publish("landing")
+        return {"success": True, "content": LANDING_DEFAULTS, "footer": _footer_defaults()}
     except Exception as e:
         logger.error(f"Reset landing error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -4548,39 +5064,122 @@ async def reset_landing(current_user: dict = Depends(get_current_user)):
 LANDING_DIR = ROOT_DIR.parent / "landing"
 
 
-@app.get("/landing", response_class=HTMLResponse)
-def serve_landing(request: Request):
-    """Sert la page landing. En localhost, remplace les liens domaine par localhost:8081."""
-    index_path = LANDING_DIR / "index.html"
-    if not index_path.is_file():
+# index.html rendue (production et localhost) et compressée une fois, rechargée si le fichier change
+landing_page = LandingPage(LANDING_DIR / "index.html")
+
+@site_router.get("/landing", response_class=HTMLResponse)
+async def serve_landing(request: Request):
+    """Sert la page landing depuis la mémoire (gzip/brotli, ETag). En localhost, liens vers localhost:8081."""
+    if landing_page.is_stale():
+        await asyncio.to_thread(landing_page.load)
+    page = landing_page.page(request.headers.get("host", ""))
+    if page is None:
         raise HTTPException(status_code=404, detail="Landing page not found")
-    html = index_path.read_text(encoding="utf-8")
-    # En localhost, faire pointer les liens vers l'app front (8081)
-    host = request.headers.get("host", "")
-    if "localhost" in host or "127.0.0.1" in host:
-        front_origin = "http://localhost:8081"
-        html = html.replace("https://taptapgoht.com", front_origin)
-    # Faire pointer les assets vers le backend
-    html = html.replace('src="images/', 'src="/landing-assets/images/')
-    html = html.replace('href="images/', 'href="/landing-assets/images/')
-    html = html.replace("url('images/", "url('/landing-assets/images/")
-    html = html.replace('url("images/', 'url("/landing-assets/images/')
-    return HTMLResponse(html)
-
-
-app.mount("/landing-assets", StaticFiles(directory=str(LANDING_DIR)), name="landing-assets")
-
-# Include the router in the main app
-app.include_router(api_router)
-
-app.add_middleware(
-    CORSMiddleware,
-    allow_credentials=True,
-    allow_origins=CORS_ORIGINS,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+    encoding, body, etag = page.select(request.headers.get("accept-encoding", ""))
+    headers = {"ETag": etag, "Vary": "Accept-Encoding", "Cache-Control": "no-cache"}
+    if page.matches(request.headers.get("if-none-match", "")):
+        return Response(status_code=304, headers=headers)
+    if encoding != "identity":
+        headers["Content-Encoding"] = encoding
+    return Response(body, media_type="text/html; charset=utf-8", headers=headers)
+
+@site_router.api_route("/landing-assets/{path:path}", methods=["GET", "HEAD"], include_in_schema=False)
+async def serve_landing_asset(path: str, request: Request):
+    """Fichiers de landing/: nom fingerprinté -> Cache-Control immutable; sert foo.br / foo.gz s'ils existent."""
+    if landing_page.is_stale():
+        await asyncio.to_thread(landing_page.load)
+    found = landing_page.asset(path)
+    if found is None:
+        raise HTTPException(status_code=404, detail="Not Found")
+    asset, immutable = found
+    file_path, headers = asset.select(request.headers.get("accept-encoding", ""), immutable)
+    if request.headers.get("if-none-match") == headers["ETag"]:
+        return Response(status_code=304, headers=headers)
+    return FileResponse(file_path, media_type=asset.media_type, headers=headers)
+
+
+@site_router.get("/metrics", include_in_schema=False)
+async def prometheus_metrics(request: Request):
+    """Per-route request counts and latency histograms (Prometheus text format)"""
+    if METRICS_TOKEN:
+        supplied = request.headers.get("authorization", "").removeprefix("Bearer ").strip()
+        if not hmac.compare_digest(supplied, METRICS_TOKEN):
+            raise HTTPException(status_code=401, detail="Invalid metrics token")
+    body = await asyncio.to_thread(metrics_registry.render)
+    return PlainTextResponse(body, media_type="text/plain; version=0.0.4")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Startup: build the Supabase client, warm the ride board, start background tasks. Shutdown: stop them."""
+    await asyncio.to_thread(supabase.connect)
+    await invalidation_bus.start()
+    await asyncio.to_thread(landing_page.load)
+    try:
+        await asyncio.to_thread(_sync_ride_board)
+        logger.info(f"Ride board loaded: {ride_board.stats()['pending_rides']} pending rides")
+    except Exception as e:
+        logger.warning(f"Ride board warm-up failed, drivers fall back to DB: {e}")
+    app.state.ride_board_task = asyncio.create_task(_ride_board_resync_loop())
+    app.state.otp_purge_task = asyncio.create_task(otp_audit.purge_loop())
+    app.state.landing_refresh_task = asyncio.create_task(landing_page.refresh_loop())
+    await asyncio.to_thread(identity_directory.check)
+    try:
+        await asyncio.to_thread(_resume_build_queue)
+    except Exception as e:
+        logger.warning(f"Build queue resume failed: {e}")
+    app.state.metrics_task = asyncio.create_task(metrics_registry.flush_loop())
+    loop_monitor.start()
+    try:
+        yield
+    finally:
+        for name in ("ride_board_task", "otp_purge_task", "landing_refresh_task", "metrics_task"):
+            task = getattr(app.state, name, None)
+            if task:
+                task.cancel()
+        loop_monitor.stop()
+        if _build_service is not None:
+            _build_service.queue.stop()
+        await invalidation_bus.stop()
+        await otp_audit.drain()
+        password_hasher.shutdown()
+        metrics_registry.remove_snapshot()
+        tracer.shutdown()
+        logger.info("Shutting down TapTapGo API")
+
+
+def create_app() -> FastAPI:
+    """Build the ASGI app (uvicorn server:app, or uvicorn server:create_app --factory).
+
+    Caches, limiter and metrics are module-level: one app per process.
+    """
+    app = FastAPI(title="TapTapGo API", version="1.0.0", lifespan=lifespan)
+    app.include_router(api_router)
+    app.include_router(site_router)
+
+    # Ajouté en premier (le plus interne): le profil couvre le handler, pas les autres middlewares
+    app.add_middleware(ProfilingMiddleware, profiler=request_profiler, authorize=is_superadmin_token)
+
+    # Nombre et durée des appels base par requête (en-tête Server-Timing, log N+1)
+    app.add_middleware(QueryTimingMiddleware)
+
+    # Ajouté avant CORS: les réponses 429 gardent les en-têtes CORS
+    app.add_middleware(RateLimitMiddleware, limiter=rate_limiter)
+
+    app.add_middleware(
+        CORSMiddleware,
+        allow_credentials=True,
+        allow_origins=CORS_ORIGINS,
+        allow_methods=["*"],
+        allow_headers=["*"],
+        expose_headers=["X-Refreshed-Token", "Retry-After", "Server-Timing", "X-Profile-Id", "X-Trace-Id"],
+    )
+
+    # Ajouté après CORS: mesure aussi les réponses CORS et 429
+    app.add_middleware(MetricsMiddleware, registry=metrics_registry)
+
+    # Span racine de chaque requête (route, statut); les appels base, bcrypt et notifications en sont les enfants
+    app.add_middleware(TracingMiddleware, tracer=tracer)
+    return app
+
 
-@app.on_event("shutdown")
-async def shutdown():
-    logger.info("Shutting down TapTapGo API")
+app = create_app()
@@ -0,0 +1,269 @@
+import os
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Set
+import logging
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+logger = logging.getLogger(__name__)
+
+# Builds simultanés max sur cette machine (0 = selon les cœurs et la RAM disponibles)
+BUILD_CONCURRENCY = int(os.getenv("TAPTAPGO_BUILD_CONCURRENCY", "0"))
+# Ressources réservées par build local (Gradle + Metro + npm): servent au calcul automatique
+BUILD_CPUS_PER_SLOT = 2
+BUILD_RAM_GB_PER_SLOT = 4.0
+# Bail d'un build en cours: renouvelé par le process qui l'exécute, repris par un autre s'il expire
+BUILD_LEASE_SECONDS = int(os.getenv("TAPTAPGO_BUILD_LEASE_SECONDS", "120"))
+# Un build dont le bail a expiré (process arrêté) est remis en file jusqu'à ce nombre de tentatives
+BUILD_MAX_ATTEMPTS = 2
+# Scrutation de la file: builds ajoutés par un autre worker, annulations, baux expirés
+BUILD_POLL_SECONDS = 5.0
+
+
+def _available_memory_gb() -> Optional[float]:
+    """RAM disponible (Linux: MemAvailable, bornée par la limite cgroup v2), None si inconnue."""
+    available = None
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    available = int(line.split()[1]) * 1024
+                    break
+    except OSError:
+        return None
+    try:
+        with open("/sys/fs/cgroup/memory.max") as f:
+            limit = f.read().strip()
+        if limit != "max" and available is not None:
+            available = min(available, int(limit))
+    except (OSError, ValueError):
+        pass
+    return available / 1024 ** 3 if available is not None else None
+
+
+def default_concurrency() -> int:
+    if BUILD_CONCURRENCY > 0:
+        return BUILD_CONCURRENCY
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else (os.cpu_count() or 1)
+    slots = cpus // BUILD_CPUS_PER_SLOT
+    memory = _available_memory_gb()
+    if memory is not None:
+        slots = min(slots, int(memory // BUILD_RAM_GB_PER_SLOT))
+    return max(1, slots)
+
+
+def _now() -> datetime:
+    return datetime.utcnow()
+
+
+class BuildQueue:
+    """File de builds persistante (table builds, status "queued"), exécutée par un pool de slots.
+
+    Ordre FIFO (created_at). La prise d'un build est un UPDATE conditionnel
+    (status = queued -> building): deux process qui visent le même build, un seul
+    l'obtient. Le process qui l'exécute pose un bail (lease_owner, lease_expires_at)
+    renouvelé tant que le build tourne; un bail expiré (process tué) remet le build en
+    file. Sur une machine, un seul process (verrou fichier dans le dossier de build)
+    dépile: les autres workers uvicorn ne font qu'ajouter à la file.
+    """
+
+    def __init__(
+        self,
+        supabase_client: Any,
+        run: Callable[[str, str, Dict[str, Any]], None],
+        lock_path: Path,
+        slots: Optional[int] = None,
+        lease_seconds: int = BUILD_LEASE_SECONDS,
+        on_cancel: Optional[Callable[[str], None]] = None,
+    ):
+        self.supabase = supabase_client
+        self.run = run
+        self.lock_path = lock_path
+        self.slots = slots or default_concurrency()
+        self.lease_seconds = lease_seconds
+        self.on_cancel = on_cancel
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self._executor = ThreadPoolExecutor(max_workers=self.slots, thread_name_prefix="taptapgo-build")
+        self._running: Set[str] = set()
+        self._running_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock_file = None
+        self._renewed_at = 0.0
+        self.started = 0
+        self.reclaimed = 0
+
+    # -- Cycle de vie ------------------------------------------------------------------
+    def start(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name="taptapgo-build-queue", daemon=True)
+            self._thread.start()
+
+    def notify(self) -> None:
+        """Un build vient d'être ajouté: dépiler sans attendre la prochaine scrutation."""
+        self._wake.set()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._wake.set()
+
+    def _loop(self) -> None:
+        while not self._stop.is_set():
+            try:
+                if self._lock_file is None:
+                    self._try_lock()
+                if self._lock_file is not None:
+                    self._renew_leases()
+                    self._sync_cancels()
+                    self._reclaim_expired()
+                    self._fill_slots()
+            except Exception as e:
+                logger.error(f"Build queue error: {e}")
+            self._wake.wait(BUILD_POLL_SECONDS)
+            self._wake.clear()
+
+    def _try_lock(self) -> None:
+        self.lock_path.parent.mkdir(parents=True, exist_ok=True)
+        f = open(self.lock_path, "a+")
+        try:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+        except OSError:
+            f.close()
+            return
+        self._lock_file = f
+        logger.info(f"Build queue dispatcher {self.owner} ({self.slots} slots)")
+
+    # -- Dépilement --------------------------------------------------------------------
+    def running(self) -> List[str]:
+        with self._running_lock:
+            return list(self._running)
+
+    def _fill_slots(self) -> None:
+        while len(self.running()) < self.slots:
+            claimed = self._claim_next()
+            if claimed is None:
+                return
+            with self._running_lock:
+                self._running.add(claimed["id"])
+            self.started += 1
+            self._executor.submit(self._execute, claimed)
+
+    def _claim_next(self) -> Optional[Dict[str, Any]]:
+        candidates = (
+            self.supabase.table("builds").select("id,attempts").eq("status", "queued")
+            .order("created_at").limit(self.slots * 2).execute().data or []
+        )
+        for candidate in candidates:
+            now = _now()
+            claimed = self.supabase.table("builds").update({
+                "status": "building",
+                "message": "Build la kòmanse...",
+                "lease_owner": self.owner,
+                "lease_expires_at": (now + timedelta(seconds=self.lease_seconds)).isoformat(),
+                "started_at": now.isoformat(),
+                "attempts": int(candidate.get("attempts") or 0) + 1,
+            }).eq("id", candidate["id"]).eq("status", "queued").execute().data
+            if claimed:
+                row = self.supabase.table("builds").select("id,brand_id,config").eq("id", candidate["id"]).execute().data
+                if row:
+                    return row[0]
+        return None
+
+    def _execute(self, row: Dict[str, Any]) -> None:
+        build_id = row["id"]
+        try:
+            self.run(build_id, row["brand_id"], row.get("config") or {})
+        except Exception as e:
+            logger.error(f"Build {build_id} crashed: {e}")
+        finally:
+            try:
+                self.supabase.table("builds").update({"lease_owner": None, "lease_expires_at": None}).eq(
+                    "id", build_id
+                ).eq("lease_owner", self.owner).execute()
+            except Exception as e:
+                logger.warning(f"Build {build_id}: lease release failed: {e}")
+            with self._running_lock:
+                self._running.discard(build_id)
+            self._wake.set()
+
+    # -- Baux et annulations -----------------------------------------------------------
+    def _renew_leases(self) -> None:
+        running = self.running()
+        if not running or time.monotonic() - self._renewed_at < self.lease_seconds / 3:
+            return
+        self._renewed_at = time.monotonic()
+        expires = (_now() + timedelta(seconds=self.lease_seconds)).isoformat()
+        self.supabase.table("builds").update({"lease_expires_at": expires}).in_("id", running).eq(
+            "lease_owner", self.owner
+        ).execute()
+
+    def _sync_cancels(self) -> None:
+        """Annulations demandées depuis un autre worker (colonne cancel_requested)."""
+        running = self.running()
+        if not running or self.on_cancel is None:
+            return
+        cancelled = self.supabase.table("builds").select("id").in_("id", running).eq("cancel_requested", True).execute().data
+        for row in cancelled or []:
+            self.on_cancel(row["id"])
+
+    def _reclaim_expired(self) -> None:
+        now = _now().isoformat()
+        expired = (
+            self.supabase.table("builds").select("id,attempts,lease_owner").eq("status", "building")
+            .lt("lease_expires_at", now).execute().data or []
+        )
+        for row in expired:
+            if row.get("lease_owner") is None:
+                continue
+            requeue = int(row.get("attempts") or 0) < BUILD_MAX_ATTEMPTS
+            update = (
+                {"status": "queued", "progress": 0, "message": "Build la remèt nan fil atant (sèvè a rekòmanse)."}
+                if requeue
+                else {"status": "failed", "progress": 0, "message": "Build la koupe (sèvè a rekòmanse).", "completed_at": now}
+            )
+            update.update({"lease_owner": None, "lease_expires_at": None})
+            done = self.supabase.table("builds").update(update).eq("id", row["id"]).eq(
+                "lease_owner", row["lease_owner"]
+            ).lt("lease_expires_at", now).execute().data
+            if done:
+                self.reclaimed += 1
+                logger.warning(f"Build {row['id']}: lease of {row['lease_owner']} expired, {'requeued' if requeue else 'failed'}")
+
+    def cancel_queued(self, build_id: str) -> bool:
+        """Retire un build encore en file. False s'il a déjà démarré (ou n'existe pas)."""
+        cancelled = self.supabase.table("builds").update({
+            "status": "failed",
+            "progress": 0,
+            "message": "Build anile pa itilizatè",
+            "completed_at": _now().isoformat(),
+        }).eq("id", build_id).eq("status", "queued").execute().data
+        return bool(cancelled)
+
+    # -- Lecture -----------------------------------------------------------------------
+    def positions(self) -> Dict[str, int]:
+        """Position (1 = prochain) de chaque build en file."""
+        rows = self.supabase.table("builds").select("id").eq("status", "queued").order("created_at").execute().data or []
+        return {row["id"]: i + 1 for i, row in enumerate(rows)}
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "owner": self.owner,
+            "dispatcher": self._lock_file is not None,
+            "slots": self.slots,
+            "running": self.running(),
+            "started": self.started,
+            "reclaimed": self.reclaimed,
+        }
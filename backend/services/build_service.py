@@ -7,10 +7,14 @@ import tempfile
 import time
 from pathlib import Path
 from datetime import datetime
-from typing import Dict, Any, Optional, Tuple
+from typing import Dict, Any, Iterable, Optional, Tuple
 import base64
 import logging
 
+from services.build_queue import BuildQueue
+from services.build_workspace import NodeModulesTemplates, copy_sources
+from services.tracing import tracer
+
 logger = logging.getLogger(__name__)
 
 
@@ -38,13 +42,15 @@ def _resolve_build_dir() -> Path:
 BUILD_DIR = _resolve_build_dir()
 
 
-# Dossiers à ne JAMAIS supprimer (cache Gradle, etc.)
-_CLEAN_EXCLUDE = frozenset({"gradle"})
+# Dossiers à ne JAMAIS supprimer (cache Gradle, snapshots node_modules, etc.)
+_CLEAN_EXCLUDE = frozenset({"gradle", "templates"})
 
 
-def _clean_stale_work_dirs(keep_key: Optional[str] = None, max_age_seconds: int = 3600) -> int:
+def _clean_stale_work_dirs(keep_keys: Iterable[str] = (), max_age_seconds: int = 3600) -> int:
     """Supprime les anciens dossiers de travail sous BUILD_DIR (nettoyage propre).
-    Exclut le cache Gradle pour éviter FileNotFoundException sur metadata.bin."""
+    Exclut le cache Gradle pour éviter FileNotFoundException sur metadata.bin,
+    et les dossiers des builds en cours (keep_keys)."""
+    keep_keys = set(keep_keys)
     if not BUILD_DIR.exists():
         return 0
     removed = 0
@@ -55,7 +61,7 @@ def _clean_stale_work_dirs(keep_key: Optional[str] = None, max_age_seconds: int
                 continue
             if path.name in _CLEAN_EXCLUDE:
                 continue
-            if keep_key and path.name == keep_key:
+            if path.name in keep_keys:
                 continue
             try:
                 age = now - path.stat().st_mtime
@@ -77,6 +83,16 @@ BASE_PROJECT_PATH = Path(
     )
 )
 STORAGE_BUCKET = os.getenv("TAPTAPGO_BUILDS_BUCKET", "builds")
+# Colonnes renvoyées au client: ni config (logo en base64, plusieurs centaines de Ko) ni bail du worker
+BUILD_COLUMNS = (
+    "id,brand_id,status,progress,message,apk_path,apk_url,error,created_at,completed_at,"
+    "started_at,attempts,cancel_requested,eas_build_id,submit_status,submit_track"
+)
+BUILD_RUNNING_MESSAGE = "Gen yon build k ap mache pou mak sa a. Tann li fini oswa anile li anvan ou lanse yon lòt."
+
+
+def _work_key(build_id: str) -> str:
+    return build_id.split("-")[0]
 
 
 class BuildService:
@@ -86,11 +102,23 @@ class BuildService:
         BUILD_DIR.mkdir(exist_ok=True)
         OUTPUT_DIR.mkdir(exist_ok=True)
         BUILD_LOG_DIR.mkdir(exist_ok=True)
+        self.node_modules = NodeModulesTemplates(BUILD_DIR / "templates")
+        self.queue = BuildQueue(
+            supabase_client, self._run_build, OUTPUT_DIR / ".build-queue.lock", on_cancel=self._cancel_local,
+        )
+        self.queue.start()
 
-    def request_cancel(self, build_id: str) -> None:
-        """Demande l'annulation d'un build en cours."""
+    def _cancel_local(self, build_id: str) -> None:
         self._cancel_requested[build_id] = True
+
+    def request_cancel(self, build_id: str) -> None:
+        """Demande l'annulation d'un build: retiré de la file s'il attend, arrêté à la prochaine étape sinon."""
         logger.info(f"Cancel requested for build {build_id}")
+        if self.queue.cancel_queued(build_id):
+            return
+        self._cancel_local(build_id)
+        # Le build peut tourner dans un autre process: il lit ce drapeau à chaque scrutation
+        self.supabase.table("builds").update({"cancel_requested": True}).eq("id", build_id).execute()
 
     def _is_cancelled(self, build_id: str) -> bool:
         """Retourne True si annulation demandée et retire la demande."""
@@ -105,10 +133,10 @@ class BuildService:
         if self._is_cancelled(build_id):
             raise BuildCancelledException("Build anile pa itilizatè")
 
-    def _has_running_build(self) -> bool:
-        """Vérifie s'il existe déjà un build en cours (queued ou building)."""
+    def _has_running_build(self, brand_id: str) -> bool:
+        """Vérifie si la marque a déjà un build en file ou en cours."""
         try:
-            r = self.supabase.table("builds").select("id").or_(
+            r = self.supabase.table("builds").select("id").eq("brand_id", brand_id).or_(
                 "status.eq.queued,status.eq.building"
             ).execute()
             return bool(r.data and len(r.data) > 0)
@@ -117,14 +145,12 @@ class BuildService:
             return False
 
     async def create_build(self, brand_id: str, config: Dict[str, Any]) -> str:
-        """Créer un nouveau build APK (un seul à la fois)."""
+        """Ajouter un build APK à la file (un build à la fois par marque, plusieurs marques en parallèle)."""
         build_id = str(uuid.uuid4())
 
-        # Un seul build à la fois
-        if self._has_running_build():
-            raise Exception(
-                "Gen yon build k ap mache. Tann li fini oswa anile li anvan ou lanse yon lòt."
-            )
+        # Un seul build à la fois pour une même marque (garanti par idx_builds_one_active_per_brand)
+        if self._has_running_build(brand_id):
+            raise Exception(BUILD_RUNNING_MESSAGE)
 
         # Vérifications préalables
         self._check_prerequisites()
@@ -137,24 +163,20 @@ class BuildService:
                     "brand_id": brand_id,
                     "status": "queued",
                     "progress": 0,
-                    "message": "Build an preparasyon...",
+                    "message": "Build la nan fil atant...",
+                    "config": config,
+                    "attempts": 0,
                     "created_at": datetime.utcnow().isoformat(),
                 }
             ).execute()
         except Exception as e:
+            # Deux demandes simultanées: l'index unique refuse la seconde
+            if "23505" in str(e) or "duplicate key" in str(e):
+                raise Exception(BUILD_RUNNING_MESSAGE)
             logger.error(f"Database insert error: {e}")
             raise
 
-        # Lancer le build en arrière-plan
-        import threading
-
-        thread = threading.Thread(
-            target=self._build_apk,
-            args=(build_id, brand_id, config),
-            daemon=True,
-        )
-        thread.start()
-
+        self.queue.notify()
         return build_id
 
     def _check_prerequisites(self):
@@ -185,6 +207,12 @@ class BuildService:
         if errors:
             raise Exception("Prerequis ki manke:\n- " + "\n- ".join(errors))
 
+    def _run_build(self, build_id: str, brand_id: str, config: Dict[str, Any]):
+        """Thread du build: une trace par build, chaque étape de _build_apk en est un span."""
+        attributes = {"taptapgo.build_id": build_id, "taptapgo.brand_id": brand_id, "taptapgo.build_mode": config.get("build_mode") or "local"}
+        with tracer.span("build", attributes=attributes, root=True):
+            self._build_apk(build_id, brand_id, config)
+
     def _build_apk(self, build_id: str, brand_id: str, config: Dict[str, Any]):
         """Générer l'APK (exécuté en arrière-plan)"""
         work_dir: Optional[Path] = None
@@ -195,54 +223,33 @@ class BuildService:
             self._update_progress(build_id, "building", 3, "Nettoyage ansyen builds...")
 
             # 0. Nettoyage propre: supprimer les anciens dossiers de travail
-            work_key = build_id.split("-")[0]
-            _clean_stale_work_dirs(keep_key=work_key, max_age_seconds=3600)
+            work_key = _work_key(build_id)
+            # Les dossiers des autres builds en cours sur cette machine sont gardés
+            running_keys = {_work_key(b) for b in self.queue.running()} | {work_key}
+            _clean_stale_work_dirs(keep_keys=running_keys, max_age_seconds=3600)
 
             self._check_cancelled(build_id)
             self._update_progress(build_id, "building", 5, "Inisyalizasyon...")
 
             # 1. Créer le dossier de travail (toujours propre)
-            work_dir = BUILD_DIR / work_key
-            if work_dir.exists():
-                logger.info(f"Cleaning existing work dir: {work_dir}")
-                shutil.rmtree(work_dir, ignore_errors=True)
-                time.sleep(1)
-            work_dir.mkdir(parents=True, exist_ok=True)
-
-            self._update_progress(build_id, "building", 10, "Kopi pwojè debaz...")
-
-            # 2. Copier le projet de base
-            # Utilise un dossier court pour eviter les chemins trop longs sous Windows
-            copy_target_dir = work_dir / "a"
-            if not BASE_PROJECT_PATH.exists():
-                raise Exception(f"Pwojè debaz pa jwenn nan {BASE_PROJECT_PATH}")
-
-            shutil.copytree(
-                BASE_PROJECT_PATH,
-                copy_target_dir,
-                dirs_exist_ok=True,
-                ignore=shutil.ignore_patterns(
-                    "node_modules",
-                    ".git",
-                    ".expo",
-                    ".expo-shared",
-                    ".metro-cache",
-                    ".cache",
-                    "dist",
-                    "build",
-                    "android",
-                    "ios",
-                    "coverage",
-                    "tmp",
-                    "logs",
-                    "test_reports",
-                    "test_results",
-                    "memory",
-                    "*.apk",
-                    "*.aab",
-                ),
-                ignore_dangling_symlinks=True,
-            )
+            with tracer.span("build.copy"):
+                work_dir = BUILD_DIR / work_key
+                if work_dir.exists():
+                    logger.info(f"Cleaning existing work dir: {work_dir}")
+                    shutil.rmtree(work_dir, ignore_errors=True)
+                    time.sleep(1)
+                work_dir.mkdir(parents=True, exist_ok=True)
+
+                self._update_progress(build_id, "building", 10, "Kopi pwojè debaz...")
+
+                # 2. Copier le projet de base
+                # Utilise un dossier court pour eviter les chemins trop longs sous Windows
+                copy_target_dir = work_dir / "a"
+                if not BASE_PROJECT_PATH.exists():
+                    raise Exception(f"Pwojè debaz pa jwenn nan {BASE_PROJECT_PATH}")
+
+                # Sources seulement (quelques Mo): node_modules est cloné depuis un snapshot plus bas
+                copy_sources(BASE_PROJECT_PATH, copy_target_dir)
             app_dir = copy_target_dir
             # Ne pas utiliser SUBST sur Windows : React Native codegen echwe ak "different roots"
             # (Z:\ vs C:\) lè Gradle tcheke chemen relatif ant node_modules.
@@ -261,30 +268,32 @@ class BuildService:
             self._update_progress(build_id, "building", 20, "Pesonalizasyon app.json...")
 
             # 3. Personnaliser app.json
-            self._customize_app_json(app_dir, config)
+            with tracer.span("build.customize"):
+                self._customize_app_json(app_dir, config)
 
-            self._update_progress(build_id, "building", 25, "Sovgad logo...")
+                self._update_progress(build_id, "building", 25, "Sovgad logo...")
 
-            # 4. Sauvegarder le logo
-            if config.get("logo"):
-                self._save_logo(app_dir, config["logo"])
+                # 4. Sauvegarder le logo
+                if config.get("logo"):
+                    self._save_logo(app_dir, config["logo"])
 
-            self._update_progress(build_id, "building", 30, "Pesonalizasyon koulè yo...")
+                self._update_progress(build_id, "building", 30, "Pesonalizasyon koulè yo...")
 
-            # 5. Personnaliser les couleurs
-            self._customize_colors(app_dir, config)
+                # 5. Personnaliser les couleurs
+                self._customize_colors(app_dir, config)
 
-            self._check_cancelled(build_id)
-            self._update_progress(build_id, "building", 35, "Konfigirasyon mak la...")
+                self._check_cancelled(build_id)
+                self._update_progress(build_id, "building", 35, "Konfigirasyon mak la...")
 
-            # 5b. Injecter la config de marque (brand id/name)
-            self._customize_brand_config(app_dir, config)
+                # 5b. Injecter la config de marque (brand id/name)
+                self._customize_brand_config(app_dir, config)
 
             self._check_cancelled(build_id)
             build_mode = str(config.get("build_mode") or "local").lower()
             if build_mode == "cloud":
                 self._update_progress(build_id, "building", 55, "Build cloud (EAS) an preparasyon...")
-                build_url, eas_build_id = self._build_with_eas(app_dir, build_id, config)
+                with tracer.span("build.eas"):
+                    build_url, eas_build_id = self._build_with_eas(app_dir, build_id, config)
                 self.supabase.table("builds").update(
                     {
                         "status": "building",
@@ -296,15 +305,22 @@ class BuildService:
                 ).eq("id", build_id).execute()
                 return
 
-            self._update_progress(build_id, "building", 40, "Enstalasyon depandans yo...")
-
-            # 6. Installer les dépendances
-            self._install_dependencies(app_dir, build_id)
+            # 6. Dépendances: node_modules du snapshot (install complet seulement si package.json / lockfile a changé)
+            if self.node_modules.is_ready(BASE_PROJECT_PATH):
+                self._update_progress(build_id, "building", 40, "Preparasyon depandans yo...")
+            else:
+                self._update_progress(build_id, "building", 40, "Enstalasyon depandans yo (premye build apre chanjman)...")
+            with tracer.span("build.install") as span:
+                node_modules = self.node_modules.ensure(
+                    BASE_PROJECT_PATH, lambda template_dir: self._install_dependencies(template_dir, build_id)
+                )
+                span.set_attribute("taptapgo.clone_method", self.node_modules.clone(node_modules, app_dir / "node_modules"))
 
             self._update_progress(build_id, "building", 55, "Jenerasyon APK la...")
 
             # 7. Build APK
-            apk_path = self._build_with_expo(app_dir, build_id)
+            with tracer.span("build.gradle"):
+                apk_path = self._build_with_expo(app_dir, build_id)
 
             self._update_progress(build_id, "building", 85, "Copie de l'APK...")
 
@@ -328,7 +344,8 @@ class BuildService:
                 self._update_progress(build_id, "building", 90, "Upload vers Supabase Storage...")
                 storage_path = f"{brand_id}/{final_apk.name}"
                 try:
-                    public_url = self._upload_to_storage(final_apk, storage_path)
+                    with tracer.span("build.upload", attributes={"taptapgo.apk_bytes": final_apk.stat().st_size}):
+                        public_url = self._upload_to_storage(final_apk, storage_path)
                 except Exception as e:
                     upload_error = str(e)
                     logger.error(f"Upload failed for build {build_id}: {e}")
@@ -627,21 +644,22 @@ export const Shadows = {{
             logger.info("Starting Expo prebuild...")
             local_expo = app_dir / "node_modules" / ".bin" / ("expo.cmd" if os.name == "nt" else "expo")
             if local_expo.exists():
-                prebuild_cmd = [str(local_expo), "prebuild", "--platform", "android", "--clean"]
+                prebuild_cmd = [str(local_expo), "prebuild", "--platform", "android", "--clean", "--no-install"]
             else:
                 npx = shutil.which("npx") or shutil.which("npx.cmd")
                 if not npx:
                     raise Exception("npx pa jwenn nan PATH")
-                prebuild_cmd = [npx, "expo", "prebuild", "--platform", "android", "--clean"]
+                prebuild_cmd = [npx, "expo", "prebuild", "--platform", "android", "--clean", "--no-install"]
 
             logger.info(f"Prebuild command: {' '.join(prebuild_cmd)}")
-            result = subprocess.run(
-                prebuild_cmd,
-                cwd=app_dir,
-                capture_output=True,
-                text=True,
-                timeout=PREBUILD_TIMEOUT,
-            )
+            with tracer.span("build.prebuild"):
+                result = subprocess.run(
+                    prebuild_cmd,
+                    cwd=app_dir,
+                    capture_output=True,
+                    text=True,
+                    timeout=PREBUILD_TIMEOUT,
+                )
             if result.returncode != 0:
                 log_path = BUILD_LOG_DIR / f"{build_id}-prebuild.log"
                 with open(log_path, "w", encoding="utf-8") as f:
@@ -898,6 +916,8 @@ export const Shadows = {{
         """Netwaye cache build (dossiers temporaires + logs)"""
         removed = []
         errors = []
+        if self.queue.running():
+            return {"removed": removed, "errors": ["Gen build k ap mache: tann yo fini anvan ou netwaye cache a."]}
         for target in [BUILD_DIR, BUILD_LOG_DIR]:
             try:
                 if target.exists():
@@ -945,9 +965,11 @@ export const Shadows = {{
     def get_build_status(self, build_id: str) -> Optional[Dict[str, Any]]:
         """Obtenir le statut d'un build"""
         try:
-            result = self.supabase.table("builds").select("*").eq("id", build_id).execute()
+            result = self.supabase.table("builds").select(BUILD_COLUMNS).eq("id", build_id).execute()
             if result.data:
-                return result.data[0]
+                build = self._with_queue_positions(result.data)[0]
+                build["dependency_cache"] = self.node_modules.cache_stats()
+                return build
             return None
         except Exception as e:
             logger.error(f"Failed to get build status: {e}")
@@ -956,17 +978,28 @@ export const Shadows = {{
     def list_builds(self, brand_id: Optional[str] = None) -> list:
         """Lister tous les builds"""
         try:
-            query = self.supabase.table("builds").select("*").order("created_at", desc=True)
+            query = self.supabase.table("builds").select(BUILD_COLUMNS).order("created_at", desc=True)
 
             if brand_id:
                 query = query.eq("brand_id", brand_id)
 
             result = query.execute()
-            return result.data or []
+            return self._with_queue_positions(result.data or [])
         except Exception as e:
             logger.error(f"Failed to list builds: {e}")
             return []
 
+    def _with_queue_positions(self, builds: list) -> list:
+        """Ajoute queue_position aux builds en file."""
+        positions = self.queue.positions() if any(b.get("status") == "queued" for b in builds) else {}
+        for build in builds:
+            if build.get("status") == "queued":
+                build["queue_position"] = positions.get(build.get("id"))
+        return builds
+
+    def queue_position(self, build_id: str) -> Optional[int]:
+        return self.queue.positions().get(build_id)
+
     def submit_build_to_play_store(self, build_id: str, track: str = "internal") -> Dict[str, Any]:
         """Soumèt un build EAS (cloud) nan Google Play Store via EAS Submit."""
         build = self.get_build_status(build_id)
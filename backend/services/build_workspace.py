@@ -0,0 +1,357 @@
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Clonage de node_modules dans un dossier de build:
+# "auto" = reflink (copie-sur-écriture: btrfs, XFS, APFS), sinon copie. "hardlink" (liens durs)
+# seulement si rien ne réécrit node_modules pendant le build: un fichier modifié sur place le serait
+# aussi dans le snapshot
+CLONE_MODE = os.getenv("TAPTAPGO_BUILD_CLONE", "auto").strip().lower()
+# Taille max des snapshots node_modules sur disque: les moins récemment utilisés sont supprimés
+DEPENDENCY_CACHE_MAX_GB = float(os.getenv("TAPTAPGO_DEPENDENCY_CACHE_MAX_GB", "10"))
+
+# Non copiés dans un dossier de build (générés, caches, sorties)
+SOURCE_IGNORE = (
+    "node_modules",
+    ".git",
+    ".expo",
+    ".expo-shared",
+    ".metro-cache",
+    ".cache",
+    "dist",
+    "build",
+    "android",
+    "ios",
+    "coverage",
+    "tmp",
+    "logs",
+    "test_reports",
+    "test_results",
+    "memory",
+    "*.apk",
+    "*.aab",
+)
+# Ce qui décide du contenu de node_modules
+DEPENDENCY_FILES = ("package.json", "yarn.lock", "package-lock.json", ".npmrc", ".yarnrc")
+DEPENDENCY_FIELDS = ("dependencies", "devDependencies", "optionalDependencies", "peerDependencies", "resolutions", "overrides")
+# Réécrits sur place par npm / yarn (relancés par expo prebuild): jamais partagés avec le snapshot
+PACKAGE_MANAGER_STATE = (".yarn-integrity", ".package-lock.json")
+
+_READY = ".ready"
+_INDEX = "index.json"
+
+
+def copy_sources(base: Path, dst: Path) -> None:
+    """Copie réelle des sources (sans node_modules ni sorties): quelques Mo."""
+    shutil.copytree(
+        base,
+        dst,
+        dirs_exist_ok=True,
+        ignore=shutil.ignore_patterns(*SOURCE_IGNORE),
+        ignore_dangling_symlinks=True,
+    )
+
+
+def node_version() -> str:
+    """Version de Node utilisée par les builds (modules natifs compilés pour elle)."""
+    node = shutil.which("node") or shutil.which("node.exe")
+    if not node:
+        return "none"
+    try:
+        return subprocess.run([node, "--version"], capture_output=True, text=True, timeout=10).stdout.strip() or "unknown"
+    except (OSError, subprocess.SubprocessError):
+        return "unknown"
+
+
+def dependency_signature(base: Path, node: str = "") -> str:
+    """Hash des dépendances déclarées, scripts d'installation, lockfiles et version de Node (pas des sources)."""
+    digest = hashlib.sha256(f"node={node}\0".encode())
+    for name in DEPENDENCY_FILES:
+        path = base / name
+        if not path.is_file():
+            continue
+        data = path.read_bytes()
+        if name == "package.json":
+            manifest = json.loads(data)
+            scripts = manifest.get("scripts") or {}
+            relevant = {field: manifest.get(field) for field in DEPENDENCY_FIELDS}
+            relevant["scripts"] = {k: scripts.get(k) for k in ("preinstall", "install", "postinstall", "prepare")}
+            data = json.dumps(relevant, sort_keys=True).encode()
+        digest.update(name.encode() + b"\0" + data + b"\0")
+    return digest.hexdigest()
+
+
+def _reflink_command(src: Path, dst: Path) -> Optional[list]:
+    if sys.platform == "darwin":
+        return ["cp", "-c", "-R", str(src), str(dst)]
+    if sys.platform.startswith("linux"):
+        return ["cp", "-a", "--reflink=always", str(src), str(dst)]
+    return None
+
+
+def _link_tree(src: Path, dst: Path) -> None:
+    """Dossiers recréés, fichiers en liens durs (copie si le lien est refusé), liens symboliques recopiés."""
+    for dirpath, dirnames, filenames in os.walk(src):
+        rel = os.path.relpath(dirpath, src)
+        target = dst if rel == "." else dst / rel
+        os.makedirs(target, exist_ok=True)
+        for name in list(dirnames):
+            path = os.path.join(dirpath, name)
+            if os.path.islink(path):
+                os.symlink(os.readlink(path), target / name)
+                dirnames.remove(name)
+        for name in filenames:
+            path = os.path.join(dirpath, name)
+            if os.path.islink(path):
+                os.symlink(os.readlink(path), target / name)
+                continue
+            try:
+                os.link(path, target / name)
+            except OSError:
+                shutil.copy2(path, target / name)
+
+
+def _tree_size(path: Path) -> int:
+    total = 0
+    for dirpath, _, filenames in os.walk(path):
+        for name in filenames:
+            try:
+                total += os.lstat(os.path.join(dirpath, name)).st_size
+            except OSError:
+                pass
+    return total
+
+
+def detach(path: Path) -> None:
+    """Remplace un fichier lié au snapshot (lien dur) par sa propre copie avant qu'il soit réécrit."""
+    try:
+        if path.is_symlink() or not path.is_file() or path.stat().st_nlink < 2:
+            return
+    except OSError:
+        return
+    tmp = path.with_name(f"{path.name}.detach")
+    shutil.copy2(path, tmp)
+    os.replace(tmp, path)
+
+
+class NodeModulesTemplates:
+    """Cache des node_modules installés, adressé par contenu: un snapshot par signature
+    (dépendances de package.json, lockfile, version de Node), cloné dans chaque build.
+
+    Au premier build qui suit un changement de signature, le snapshot
+    (BUILD_DIR/templates/<signature>) est créé: sources copiées puis install complet. Les
+    builds suivants reçoivent un clone de son node_modules en quelques secondes au lieu
+    d'un npm/yarn install. expo prebuild tourne avec --no-install; en mode "hardlink",
+    les fichiers d'état du gestionnaire de paquets sont détachés après chaque clone et les
+    builds ne doivent créer que des fichiers neufs dans node_modules (sorties Gradle). Sans
+    reflink, "auto" copie: aucun inode n'est partagé avec le snapshot.
+
+    templates/index.json garde taille, dernière utilisation et compteurs hit/miss: les
+    snapshots les moins récemment utilisés sont supprimés au-delà de max_bytes, et
+    n'importe quel worker de la machine peut lire les statistiques.
+
+    Un install (plusieurs minutes) ne bloque que les builds qui attendent la même
+    signature: _lock ne protège que l'index et les réservations. ensure() réserve le
+    snapshot renvoyé jusqu'au clone() qui suit: il ne peut pas être supprimé entre les deux.
+    """
+
+    def __init__(self, root: Path, max_bytes: int = int(DEPENDENCY_CACHE_MAX_GB * 1024 ** 3), clone_mode: str = CLONE_MODE):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.clone_mode = clone_mode
+        self._lock = threading.Lock()
+        # Un verrou par signature, pris pendant l'install du snapshot
+        self._installing: Dict[str, threading.Lock] = {}
+        # Résultat du premier essai reflink sur ce disque (None = pas encore essayé)
+        self._reflink_ok: Optional[bool] = None if clone_mode in ("auto", "reflink") else False
+        self.clones: Dict[str, int] = {}
+        # Snapshots réservés par ensure() jusqu'à la fin de clone(): jamais supprimés par _evict
+        self._cloning: Dict[Path, int] = {}
+        self.last_clone_seconds: Optional[float] = None
+
+    def _path(self, base: Path) -> Path:
+        return self.root / dependency_signature(base, node_version())[:16]
+
+    def is_ready(self, base: Path) -> bool:
+        return (self._path(base) / _READY).exists()
+
+    # -- Index (taille, dernière utilisation, hit/miss) ---------------------------------
+    def _read_index(self) -> Dict[str, Any]:
+        try:
+            with open(self.root / _INDEX, encoding="utf-8") as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            index = {}
+        index.setdefault("entries", {})
+        index.setdefault("hits", 0)
+        index.setdefault("misses", 0)
+        return index
+
+    def _write_index(self, index: Dict[str, Any]) -> None:
+        tmp = self.root / f".{_INDEX}.{os.getpid()}"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(index, f)
+        os.replace(tmp, self.root / _INDEX)
+
+    def ensure(self, base: Path, install: Callable[[Path], None]) -> Path:
+        """node_modules du snapshot correspondant aux dépendances de base (installé si absent),
+        réservé jusqu'à clone()."""
+        path = self._path(base)
+        while True:
+            with self._lock:
+                if (path / _READY).exists():
+                    self._reserve(path)
+                    self._record_hit(path)
+                    return path / "a" / "node_modules"
+                install_lock = self._installing.setdefault(path.name, threading.Lock())
+            with install_lock:
+                # Installé par un autre build pendant l'attente: c'est un hit
+                if (path / _READY).exists():
+                    continue
+                self._install(base, path, install)
+                return path / "a" / "node_modules"
+
+    def _reserve(self, path: Path) -> None:
+        self._cloning[path] = self._cloning.get(path, 0) + 1
+
+    def _release(self, path: Path) -> None:
+        with self._lock:
+            remaining = self._cloning.get(path, 0) - 1
+            if remaining > 0:
+                self._cloning[path] = remaining
+            else:
+                self._cloning.pop(path, None)
+
+    def _record_hit(self, path: Path) -> None:
+        self.root.mkdir(parents=True, exist_ok=True)
+        index = self._read_index()
+        if path.name not in index["entries"]:
+            index["entries"][path.name] = {"size": _tree_size(path), "created_at": time.time()}
+        entry = index["entries"][path.name]
+        entry["last_used"] = time.time()
+        entry["hits"] = entry.get("hits", 0) + 1
+        index["hits"] += 1
+        self._write_index(index)
+
+    def _install(self, base: Path, path: Path, install: Callable[[Path], None]) -> None:
+        """Install dans un dossier temporaire hors de _lock, publié d'un coup (os.replace)."""
+        self.root.mkdir(parents=True, exist_ok=True)
+        tmp = self.root / f".{path.name}-{os.getpid()}-{threading.get_ident()}"
+        shutil.rmtree(tmp, ignore_errors=True)
+        try:
+            copy_sources(base, tmp / "a")
+            install(tmp / "a")
+            (tmp / _READY).touch()
+            size = _tree_size(tmp)
+            with self._lock:
+                shutil.rmtree(path, ignore_errors=True)
+                os.replace(tmp, path)
+                self._reserve(path)
+                index = self._read_index()
+                now = time.time()
+                index["entries"][path.name] = {"size": size, "created_at": now, "last_used": now, "hits": 0}
+                index["misses"] += 1
+                evicted = self._evict(index, keep=path.name)
+                self._write_index(index)
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+        logger.info(f"node_modules template {path.name} ready ({size // 1024 ** 2} MB)")
+        # Suppression hors du verrou: les dossiers évincés sont déjà renommés
+        for trash in evicted:
+            shutil.rmtree(trash, ignore_errors=True)
+
+    def _evict(self, index: Dict[str, Any], keep: str) -> List[Path]:
+        """LRU: retire les snapshots les moins récemment utilisés tant que le total dépasse max_bytes.
+        Le snapshot courant et ceux réservés restent; les builds en cours ont leur propre clone.
+        Renvoie les dossiers renommés, à supprimer par l'appelant hors du verrou."""
+        entries = index["entries"]
+        # Dossiers présents sans entrée (index perdu) ou entrées sans dossier
+        for name in list(entries):
+            if not (self.root / name / _READY).exists():
+                del entries[name]
+        for path in self.root.iterdir():
+            if path.is_dir() and not path.name.startswith(".") and path.name not in entries:
+                entries[path.name] = {"size": _tree_size(path), "created_at": path.stat().st_mtime, "last_used": path.stat().st_mtime, "hits": 0}
+        total = sum(e.get("size", 0) for e in entries.values())
+        evicted = []
+        for name in sorted(entries, key=lambda n: entries[n].get("last_used", 0)):
+            if total <= self.max_bytes:
+                break
+            if name == keep or self._cloning.get(self.root / name):
+                continue
+            total -= entries.pop(name).get("size", 0)
+            trash = self.root / f".evicted-{name}-{os.getpid()}"
+            try:
+                os.replace(self.root / name, trash)
+            except OSError:
+                continue
+            evicted.append(trash)
+            logger.info(f"Evicted node_modules template {name}")
+        return evicted
+
+    def clone(self, node_modules: Path, dst: Path) -> str:
+        """Clone node_modules dans dst et libère la réservation prise par ensure();
+        renvoie la méthode utilisée (reflink, hardlink, copy)."""
+        started = time.monotonic()
+        template = node_modules.parent.parent
+        try:
+            method = self._clone(node_modules, dst)
+        finally:
+            self._release(template)
+        for name in PACKAGE_MANAGER_STATE:
+            detach(dst / name)
+        self.clones[method] = self.clones.get(method, 0) + 1
+        self.last_clone_seconds = round(time.monotonic() - started, 2)
+        logger.info(f"node_modules cloned ({method}) in {self.last_clone_seconds}s")
+        return method
+
+    def _clone(self, src: Path, dst: Path) -> str:
+        if self._reflink_ok is not False and self.clone_mode != "hardlink":
+            command = _reflink_command(src, dst)
+            if command is not None:
+                result = subprocess.run(command, capture_output=True, text=True)
+                if result.returncode == 0:
+                    self._reflink_ok = True
+                    return "reflink"
+                shutil.rmtree(dst, ignore_errors=True)
+                if self._reflink_ok is None:
+                    logger.info(f"Reflink not supported here, copying node_modules: {result.stderr.strip()[:200]}")
+            self._reflink_ok = False
+        if self.clone_mode == "hardlink":
+            _link_tree(src, dst)
+            return "hardlink"
+        shutil.copytree(src, dst, symlinks=True)
+        return "copy"
+
+    def cache_stats(self) -> Dict[str, Any]:
+        """Hit rate et taille du cache (index partagé par les workers de la machine)."""
+        index = self._read_index()
+        lookups = index["hits"] + index["misses"]
+        return {
+            "hits": index["hits"],
+            "misses": index["misses"],
+            "hit_rate": round(index["hits"] / lookups, 3) if lookups else None,
+            "entries": len(index["entries"]),
+            "size_bytes": sum(e.get("size", 0) for e in index["entries"].values()),
+            "max_bytes": self.max_bytes,
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self.cache_stats(),
+            "root": str(self.root),
+            "clone_mode": self.clone_mode,
+            "reflink": self._reflink_ok,
+            "clones": dict(self.clones),
+            "last_clone_seconds": self.last_clone_seconds,
+        }
@@ -0,0 +1,219 @@
+import json
+import os
+import threading
+import time
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import logging
+
+from services.tracing import SPAN_CLIENT, tracer
+
+logger = logging.getLogger(__name__)
+
+# Au-delà de cette durée (ms), un appel PostgREST est loggé en warning
+DB_SLOW_QUERY_MS = float(os.getenv("TAPTAPGO_DB_SLOW_QUERY_MS", "200"))
+# Au-delà de ce nombre d'appels dans une requête HTTP, le résumé est loggé en warning (N+1)
+DB_QUERY_WARN_COUNT = int(os.getenv("TAPTAPGO_DB_QUERY_WARN_COUNT", "20"))
+
+# Première méthode appelée après table(): nature de la requête
+QUERY_OPERATIONS = ("select", "insert", "update", "upsert", "delete")
+
+
+class RequestQueries:
+    """Appels base d'une requête HTTP (partagé avec les threads via le contexte copié)."""
+
+    __slots__ = ("path", "count", "total_ms", "queries")
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self.count = 0
+        self.total_ms = 0.0
+        self.queries: List[Tuple[str, str, float, Optional[int]]] = []
+
+    def add(self, table: str, operation: str, duration_ms: float, rows: Optional[int]) -> None:
+        self.count += 1
+        self.total_ms += duration_ms
+        self.queries.append((table, operation, duration_ms, rows))
+
+
+_current_queries: ContextVar[Optional[RequestQueries]] = ContextVar("current_queries", default=None)
+
+
+class QueryStats:
+    """Totaux par (table, opération) depuis le démarrage du worker."""
+
+    def __init__(self, slow_ms: float = DB_SLOW_QUERY_MS):
+        self.slow_ms = slow_ms
+        self._lock = threading.Lock()
+        self._tables: Dict[Tuple[str, str], List[float]] = {}  # -> [appels, ms total, ms max, erreurs]
+        self.slow = 0
+
+    def record(self, table: str, operation: str, duration_ms: float, rows: Optional[int], error: bool = False) -> None:
+        with self._lock:
+            entry = self._tables.setdefault((table, operation), [0, 0.0, 0.0, 0])
+            entry[0] += 1
+            entry[1] += duration_ms
+            entry[2] = max(entry[2], duration_ms)
+            entry[3] += 1 if error else 0
+        current = _current_queries.get()
+        if current is not None:
+            current.add(table, operation, duration_ms, rows)
+        if duration_ms >= self.slow_ms:
+            self.slow += 1
+            logger.warning(json.dumps({
+                "event": "slow_query",
+                "path": current.path if current is not None else None,
+                "table": table,
+                "operation": operation,
+                "duration_ms": round(duration_ms, 1),
+                "rows": rows,
+                "error": error,
+            }))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            tables = {
+                f"{table}.{operation}": {
+                    "calls": int(calls),
+                    "avg_ms": round(total / calls, 2) if calls else 0.0,
+                    "max_ms": round(worst, 2),
+                    "errors": int(errors),
+                }
+                for (table, operation), (calls, total, worst, errors) in sorted(self._tables.items())
+            }
+        return {"slow_query_ms": self.slow_ms, "slow_queries": self.slow, "tables": tables}
+
+
+class _QueryProxy:
+    """Enveloppe un query builder postgrest: chaque méthode renvoie un proxy, execute() est chronométré."""
+
+    __slots__ = ("_builder", "_table", "_operation", "_stats")
+
+    def __init__(self, builder: Any, table: str, operation: str, stats: QueryStats):
+        self._builder = builder
+        self._table = table
+        self._operation = operation
+        self._stats = stats
+
+    def execute(self) -> Any:
+        attributes = {"db.system": "postgresql", "db.collection.name": self._table, "db.operation.name": self._operation}
+        with tracer.span(f"{self._operation} {self._table}", SPAN_CLIENT, attributes) as span:
+            started = time.perf_counter()
+            try:
+                result = self._builder.execute()
+            except Exception:
+                self._stats.record(self._table, self._operation, (time.perf_counter() - started) * 1000, None, error=True)
+                raise
+            data = getattr(result, "data", None)
+            rows = len(data) if isinstance(data, list) else None
+            span.set_attribute("db.response.returned_rows", rows)
+            self._stats.record(self._table, self._operation, (time.perf_counter() - started) * 1000, rows)
+            return result
+
+    def __getattr__(self, name: str) -> Any:
+        attr = getattr(self._builder, name)
+        if not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            result = attr(*args, **kwargs)
+            if hasattr(result, "execute"):
+                operation = name if self._operation == "query" and name in QUERY_OPERATIONS else self._operation
+                return _QueryProxy(result, self._table, operation, self._stats)
+            return result
+
+        return call
+
+
+class InstrumentedClient:
+    """Client Supabase dont les appels table(...)...execute() et rpc(...).execute() sont mesurés.
+
+    Le reste (storage, auth...) est passé tel quel au client réel. Avec factory, le client
+    réel n'est construit qu'au premier appel (ou par connect() au démarrage de l'app):
+    importer le serveur ne charge pas supabase/httpx et n'ouvre aucune connexion.
+    """
+
+    def __init__(self, client: Any = None, stats: Optional[QueryStats] = None, factory: Optional[Callable[[], Any]] = None):
+        if client is None and factory is None:
+            raise ValueError("InstrumentedClient needs a client or a factory")
+        self._real = client
+        self._factory = factory
+        self._lock = threading.Lock()
+        self.query_stats = stats or QueryStats()
+
+    @property
+    def _client(self) -> Any:
+        if self._real is None:
+            with self._lock:
+                if self._real is None:
+                    self._real = self._factory()
+        return self._real
+
+    def connect(self) -> None:
+        """Construit le client réel maintenant plutôt qu'au premier appel."""
+        self._client
+
+    def reset_after_fork(self) -> None:
+        """Dans un worker forké: oublie le client du master (connexions HTTP partagées)."""
+        self._lock = threading.Lock()
+        if self._factory is not None:
+            self._real = None
+
+    def table(self, name: str) -> _QueryProxy:
+        return _QueryProxy(self._client.table(name), name, "query", self.query_stats)
+
+    def from_(self, name: str) -> _QueryProxy:
+        return self.table(name)
+
+    def rpc(self, fn: str, params: Optional[Dict[str, Any]] = None, *args, **kwargs) -> _QueryProxy:
+        return _QueryProxy(self._client.rpc(fn, params or {}, *args, **kwargs), f"rpc:{fn}", "rpc", self.query_stats)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._client, name)
+
+
+class QueryTimingMiddleware:
+    """Middleware ASGI: compte les appels base de chaque requête, ajoute Server-Timing
+    (db;dur=<ms total>;desc="<n> queries") et logge un résumé JSON."""
+
+    def __init__(self, app: Callable, warn_count: int = DB_QUERY_WARN_COUNT):
+        self.app = app
+        self.warn_count = warn_count
+
+    async def __call__(self, scope: Dict[str, Any], receive: Callable, send: Callable) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        queries = RequestQueries(scope.get("path"))
+        token = _current_queries.set(queries)
+
+        async def send_wrapper(message: Dict[str, Any]) -> None:
+            if message["type"] == "http.response.start":
+                timing = f'db;dur={queries.total_ms:.1f};desc="{queries.count} queries"'
+                message["headers"] = list(message.get("headers", [])) + [(b"server-timing", timing.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current_queries.reset(token)
+            self._log(scope, queries)
+
+    def _log(self, scope: Dict[str, Any], queries: RequestQueries) -> None:
+        if not queries.count:
+            return
+        level = logging.WARNING if queries.count >= self.warn_count else logging.DEBUG
+        if not logger.isEnabledFor(level):
+            return
+        per_table: Dict[str, int] = {}
+        for table, operation, _, _ in queries.queries:
+            key = f"{table}.{operation}"
+            per_table[key] = per_table.get(key, 0) + 1
+        logger.log(level, json.dumps({
+            "event": "request_queries",
+            "method": scope.get("method"),
+            "path": scope.get("path"),
+            "queries": queries.count,
+            "db_ms": round(queries.total_ms, 1),
+            "by_table": per_table,
+        }))
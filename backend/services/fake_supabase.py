@@ -0,0 +1,425 @@
+"""Faux client Supabase en mémoire (tests, benchmarks, simulateur).
+
+Couvre le sous-ensemble du query-builder PostgREST utilisé par le backend:
+select/eq/neq/in_/or_/is_/gt/gte/lt/lte/order/limit, insert/update/upsert/delete,
+count="exact" et storage.from_(bucket).upload/get_public_url.
+
+Activé par TAPTAPGO_FAKE_SUPABASE=1: le serveur démarre sans projet Supabase
+(SUPABASE_URL / SUPABASE_KEY ignorés), tables chargées depuis TAPTAPGO_FAKE_SUPABASE_SEED.
+"""
+import copy
+import json
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Deque, Dict, Iterable, List, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+FAKE_SUPABASE = os.getenv("TAPTAPGO_FAKE_SUPABASE", "0") == "1"
+# Fichier JSON {table: [lignes]} chargé au démarrage (défaut: benchmarks/seed.json)
+FAKE_SUPABASE_SEED = (os.getenv("TAPTAPGO_FAKE_SUPABASE_SEED") or "").strip()
+# Latence simulée par appel execute() (ms), pour des benchmarks réalistes
+FAKE_SUPABASE_LATENCY_MS = float(os.getenv("TAPTAPGO_FAKE_SUPABASE_LATENCY_MS", "0"))
+# Derniers appels (table, opération) gardés dans client.calls (0 = pas d'enregistrement)
+FAKE_SUPABASE_CALL_LOG = int(os.getenv("TAPTAPGO_FAKE_SUPABASE_CALL_LOG", "10000"))
+
+DEFAULT_SEED = Path(__file__).resolve().parent.parent / "benchmarks" / "seed.json"
+
+# Tables d'utilisateurs -> user_type, comme les triggers de migrations/add_user_identities.sql
+IDENTITY_TABLES = {
+    "passengers": "passenger",
+    "drivers": "driver",
+    "admins": "admin",
+    "subadmins": "subadmin",
+    "superadmins": "superadmin",
+}
+# Colonnes qui alimentent user_identities: un update qui n'y touche pas ne change rien
+IDENTITY_COLUMNS = {"id", "phone", "email"}
+
+
+class FakeAPIResponse:
+    """Même forme que postgrest.APIResponse (data + count)."""
+
+    def __init__(self, data: List[Dict[str, Any]], count: Optional[int] = None):
+        self.data = data
+        self.count = count
+
+    def __repr__(self) -> str:
+        return f"FakeAPIResponse(data={len(self.data)} rows, count={self.count})"
+
+
+def _coerce(raw: str) -> Any:
+    """Convertit une valeur de filtre PostgREST (texte) en valeur Python."""
+    if raw == "null":
+        return None
+    if raw == "true":
+        return True
+    if raw == "false":
+        return False
+    return raw
+
+
+def _same(a: Any, b: Any) -> bool:
+    if a is None or b is None:
+        return a is b
+    if isinstance(a, bool) or isinstance(b, bool):
+        return a is b or str(a).lower() == str(b).lower()
+    if isinstance(a, (int, float)) and not isinstance(b, (int, float)):
+        try:
+            return float(a) == float(b)
+        except (TypeError, ValueError):
+            return False
+    if isinstance(b, (int, float)) and not isinstance(a, (int, float)):
+        try:
+            return float(a) == float(b)
+        except (TypeError, ValueError):
+            return False
+    return a == b if type(a) is type(b) else str(a) == str(b)
+
+
+def _compare(a: Any, b: Any) -> Optional[int]:
+    if a is None or b is None:
+        return None
+    try:
+        fa, fb = float(a), float(b)
+        return (fa > fb) - (fa < fb)
+    except (TypeError, ValueError):
+        sa, sb = str(a), str(b)
+        return (sa > sb) - (sa < sb)
+
+
+def _split_top_level(expr: str) -> List[str]:
+    """Découpe 'a.eq.1,and(b.eq.2,c.is.null)' sur les virgules de premier niveau."""
+    parts, depth, current = [], 0, []
+    for ch in expr:
+        if ch == "(":
+            depth += 1
+        elif ch == ")":
+            depth -= 1
+        if ch == "," and depth == 0:
+            parts.append("".join(current))
+            current = []
+            continue
+        current.append(ch)
+    if current:
+        parts.append("".join(current))
+    return [p.strip() for p in parts if p.strip()]
+
+
+def _parse_condition(expr: str) -> Callable[[Dict[str, Any]], bool]:
+    """Compile une condition PostgREST (syntaxe or_/and) en prédicat."""
+    expr = expr.strip()
+    for group in ("and", "or"):
+        if expr.startswith(f"{group}(") and expr.endswith(")"):
+            preds = [_parse_condition(p) for p in _split_top_level(expr[len(group) + 1:-1])]
+            if group == "and":
+                return lambda row: all(p(row) for p in preds)
+            return lambda row: any(p(row) for p in preds)
+    column, op, value = expr.split(".", 2)
+    if op == "eq":
+        expected = _coerce(value)
+        return lambda row: _same(row.get(column), expected)
+    if op == "neq":
+        expected = _coerce(value)
+        return lambda row: not _same(row.get(column), expected)
+    if op == "is":
+        expected = _coerce(value)
+        return lambda row: row.get(column) is expected if expected is None else _same(row.get(column), expected)
+    if op == "in":
+        values = [_coerce(v.strip().strip('"')) for v in value.strip("()").split(",")]
+        return lambda row: any(_same(row.get(column), v) for v in values)
+    if op in ("gt", "gte", "lt", "lte"):
+        expected = _coerce(value)
+        ok = {"gt": lambda c: c > 0, "gte": lambda c: c >= 0, "lt": lambda c: c < 0, "lte": lambda c: c <= 0}[op]
+
+        def _pred(row: Dict[str, Any]) -> bool:
+            c = _compare(row.get(column), expected)
+            return c is not None and ok(c)
+
+        return _pred
+    raise ValueError(f"Opérateur PostgREST non supporté par le faux client: {op}")
+
+
+class FakeQueryBuilder:
+    """Query-builder chaînable; rien n'est exécuté avant execute()."""
+
+    def __init__(self, backend: "FakeSupabaseClient", table: str):
+        self._backend = backend
+        self._table = table
+        self._op = "select"
+        self._columns = "*"
+        self._count: Optional[str] = None
+        self._filters: List[Callable[[Dict[str, Any]], bool]] = []
+        self._order: List[tuple] = []
+        self._limit: Optional[int] = None
+        self._payload: Any = None
+        self._on_conflict: Optional[str] = None
+
+    # -- Opérations ----------------------------------------------------------------
+    def select(self, columns: str = "*", count: Optional[str] = None) -> "FakeQueryBuilder":
+        self._op = "select"
+        self._columns = columns or "*"
+        self._count = count
+        return self
+
+    def insert(self, payload: Any, **_: Any) -> "FakeQueryBuilder":
+        self._op = "insert"
+        self._payload = payload
+        return self
+
+    def update(self, payload: Dict[str, Any], **_: Any) -> "FakeQueryBuilder":
+        self._op = "update"
+        self._payload = payload
+        return self
+
+    def upsert(self, payload: Any, on_conflict: str = "", **_: Any) -> "FakeQueryBuilder":
+        self._op = "upsert"
+        self._payload = payload
+        self._on_conflict = on_conflict or "id"
+        return self
+
+    def delete(self, **_: Any) -> "FakeQueryBuilder":
+        self._op = "delete"
+        return self
+
+    # -- Filtres -------------------------------------------------------------------
+    def eq(self, column: str, value: Any) -> "FakeQueryBuilder":
+        self._filters.append(lambda row: _same(row.get(column), value))
+        return self
+
+    def neq(self, column: str, value: Any) -> "FakeQueryBuilder":
+        self._filters.append(lambda row: not _same(row.get(column), value))
+        return self
+
+    def in_(self, column: str, values: Iterable[Any]) -> "FakeQueryBuilder":
+        values = list(values)
+        self._filters.append(lambda row: any(_same(row.get(column), v) for v in values))
+        return self
+
+    def is_(self, column: str, value: Any) -> "FakeQueryBuilder":
+        expected = _coerce(value) if isinstance(value, str) else value
+        if expected is None:
+            self._filters.append(lambda row: row.get(column) is None)
+        else:
+            self._filters.append(lambda row: _same(row.get(column), expected))
+        return self
+
+    def or_(self, filters: str, **_: Any) -> "FakeQueryBuilder":
+        self._filters.append(_parse_condition(f"or({filters})"))
+        return self
+
+    def _range(self, op: str, column: str, value: Any) -> "FakeQueryBuilder":
+        self._filters.append(_parse_condition(f"{column}.{op}.{value}"))
+        return self
+
+    def gt(self, column: str, value: Any) -> "FakeQueryBuilder":
+        return self._range("gt", column, value)
+
+    def gte(self, column: str, value: Any) -> "FakeQueryBuilder":
+        return self._range("gte", column, value)
+
+    def lt(self, column: str, value: Any) -> "FakeQueryBuilder":
+        return self._range("lt", column, value)
+
+    def lte(self, column: str, value: Any) -> "FakeQueryBuilder":
+        return self._range("lte", column, value)
+
+    def order(self, column: str, desc: bool = False, **_: Any) -> "FakeQueryBuilder":
+        self._order.append((column, desc))
+        return self
+
+    def limit(self, size: int, **_: Any) -> "FakeQueryBuilder":
+        self._limit = size
+        return self
+
+    # -- Exécution -----------------------------------------------------------------
+    def _matches(self, row: Dict[str, Any]) -> bool:
+        return all(f(row) for f in self._filters)
+
+    def _project(self, row: Dict[str, Any]) -> Dict[str, Any]:
+        cols = [c.strip() for c in self._columns.split(",") if c.strip()]
+        if not cols or "*" in cols:
+            return copy.deepcopy(row)
+        return {c: copy.deepcopy(row.get(c)) for c in cols}
+
+    def execute(self) -> FakeAPIResponse:
+        self._backend._simulate_latency()
+        with self._backend._lock:
+            if self._backend.calls.maxlen:
+                self._backend.calls.append((self._table, self._op))
+            response = self._execute_locked()
+            if self._table in IDENTITY_TABLES and self._touches_identities(response):
+                self._backend._sync_identities(self._table)
+            return response
+
+    def _touches_identities(self, response: FakeAPIResponse) -> bool:
+        """Comme les triggers: seules les écritures qui changent phone/email/id (ou des lignes) resynchronisent."""
+        if self._op == "select" or not response.data:
+            return False
+        if self._op == "update":
+            return bool(IDENTITY_COLUMNS & set(self._payload or {}))
+        return True
+
+    def _execute_locked(self) -> FakeAPIResponse:
+        rows = self._backend._tables.setdefault(self._table, [])
+        if self._op == "select":
+            matched = [r for r in rows if self._matches(r)]
+            for column, desc in reversed(self._order):
+                matched.sort(key=lambda r: (r.get(column) is None, str(r.get(column)) if not isinstance(r.get(column), (int, float)) else r.get(column)), reverse=desc)
+            count = len(matched) if self._count else None
+            if self._limit is not None:
+                matched = matched[: self._limit]
+            return FakeAPIResponse([self._project(r) for r in matched], count)
+        if self._op == "insert":
+            payload = self._payload if isinstance(self._payload, list) else [self._payload]
+            created = [self._backend._with_defaults(self._table, dict(p)) for p in payload]
+            rows.extend(created)
+            return FakeAPIResponse(copy.deepcopy(created))
+        if self._op == "update":
+            changed = []
+            for r in rows:
+                if self._matches(r):
+                    r.update(copy.deepcopy(self._payload))
+                    changed.append(copy.deepcopy(r))
+            return FakeAPIResponse(changed)
+        if self._op == "upsert":
+            payload = self._payload if isinstance(self._payload, list) else [self._payload]
+            keys = [k.strip() for k in self._on_conflict.split(",")]
+            out = []
+            for p in payload:
+                existing = next((r for r in rows if all(_same(r.get(k), p.get(k)) for k in keys)), None)
+                if existing is not None:
+                    existing.update(copy.deepcopy(p))
+                    out.append(copy.deepcopy(existing))
+                else:
+                    created = self._backend._with_defaults(self._table, dict(p))
+                    rows.append(created)
+                    out.append(copy.deepcopy(created))
+            return FakeAPIResponse(out)
+        if self._op == "delete":
+            kept, removed = [], []
+            for r in rows:
+                (removed if self._matches(r) else kept).append(r)
+            self._backend._tables[self._table] = kept
+            return FakeAPIResponse(removed)
+        raise ValueError(f"Opération inconnue: {self._op}")
+
+
+class FakeStorageBucket:
+    def __init__(self, storage: "FakeStorage", bucket: str):
+        self._storage = storage
+        self._bucket = bucket
+
+    def upload(self, path: str, file: Any, file_options: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        data = file.read() if hasattr(file, "read") else bytes(file)
+        self._storage.objects[(self._bucket, path)] = data
+        return {"Key": f"{self._bucket}/{path}"}
+
+    def get_public_url(self, path: str) -> str:
+        return f"memory://{self._bucket}/{path}"
+
+
+class FakeStorage:
+    def __init__(self):
+        self.objects: Dict[tuple, bytes] = {}
+
+    def from_(self, bucket: str) -> FakeStorageBucket:
+        return FakeStorageBucket(self, bucket)
+
+
+class FakeSupabaseClient:
+    """Remplaçant de supabase.Client adossé à des tables en mémoire.
+
+    latency_ms simule l'aller-retour réseau vers PostgREST pour chaque execute();
+    call_log borne l'historique calls (0 = désactivé).
+    """
+
+    def __init__(
+        self,
+        tables: Optional[Dict[str, List[Dict[str, Any]]]] = None,
+        latency_ms: float = 0.0,
+        call_log: int = FAKE_SUPABASE_CALL_LOG,
+    ):
+        self._tables: Dict[str, List[Dict[str, Any]]] = {k: [dict(r) for r in v] for k, v in (tables or {}).items()}
+        self._lock = threading.RLock()
+        self.latency_ms = latency_ms
+        self.storage = FakeStorage()
+        # Borné: un simulateur ou un benchmark de longue durée ne fait pas grossir la mémoire
+        self.calls: Deque[tuple] = deque(maxlen=max(call_log, 0))
+
+    @classmethod
+    def from_seed_file(cls, path: Path, latency_ms: float = 0.0) -> "FakeSupabaseClient":
+        """Charge un fichier JSON {table: [rows]}."""
+        with open(path, "r", encoding="utf-8") as f:
+            tables = json.load(f)
+        client = cls(latency_ms=latency_ms)
+        for name, rows in tables.items():
+            client.seed(name, rows)
+        return client
+
+    def table(self, name: str) -> FakeQueryBuilder:
+        return FakeQueryBuilder(self, name)
+
+    from_ = table
+
+    def rows(self, name: str) -> List[Dict[str, Any]]:
+        """Accès direct (copie) au contenu d'une table, pour les assertions et le seed."""
+        with self._lock:
+            return copy.deepcopy(self._tables.get(name, []))
+
+    def seed(self, name: str, rows: Iterable[Dict[str, Any]]) -> None:
+        with self._lock:
+            self._tables.setdefault(name, []).extend(self._with_defaults(name, dict(r)) for r in rows)
+            if name in IDENTITY_TABLES:
+                self._sync_identities(name)
+
+    def _sync_identities(self, table: str) -> None:
+        """Reconstruit user_identities pour une table d'utilisateurs (équivalent des triggers)."""
+        user_type = IDENTITY_TABLES[table]
+        identities = [i for i in self._tables.get("user_identities", []) if i.get("user_type") != user_type]
+        for row in self._tables.get(table, []):
+            for kind in ("phone", "email"):
+                value = (row.get(kind) or "").strip()
+                if value:
+                    identities.append({
+                        "identifier": value.lower() if kind == "email" else value,
+                        "kind": kind,
+                        "user_type": user_type,
+                        "user_table": table,
+                        "user_id": row.get("id"),
+                    })
+        self._tables["user_identities"] = identities
+
+    def reset_calls(self) -> None:
+        with self._lock:
+            self.calls.clear()
+
+    def _simulate_latency(self) -> None:
+        if self.latency_ms > 0:
+            time.sleep(self.latency_ms / 1000.0)
+
+    def _with_defaults(self, table: str, row: Dict[str, Any]) -> Dict[str, Any]:
+        if table != "landing_content" or "key" not in row:
+            row.setdefault("id", str(uuid.uuid4()))
+        row.setdefault("created_at", datetime.utcnow().isoformat())
+        return row
+
+
+def create_fake_client_from_env() -> FakeSupabaseClient:
+    """Client utilisé par server.py quand TAPTAPGO_FAKE_SUPABASE=1."""
+    seed = Path(FAKE_SUPABASE_SEED) if FAKE_SUPABASE_SEED else DEFAULT_SEED
+    if seed.is_file():
+        client = FakeSupabaseClient.from_seed_file(seed, latency_ms=FAKE_SUPABASE_LATENCY_MS)
+    else:
+        client = FakeSupabaseClient(latency_ms=FAKE_SUPABASE_LATENCY_MS)
+    logger.warning(
+        f"Using in-memory fake Supabase (seed={seed if seed.is_file() else 'none'}, "
+        f"latency={FAKE_SUPABASE_LATENCY_MS}ms): data is lost on restart"
+    )
+    return client
@@ -0,0 +1,96 @@
+from typing import Any, Dict, List, Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+USER_TABLES = {
+    "passenger": "passengers",
+    "driver": "drivers",
+    "admin": "admins",
+    "subadmin": "subadmins",
+    "superadmin": "superadmins",
+}
+
+# Colonnes renvoyées au login (user + password_hash). Les documents du chauffeur
+# (permis, papiers, casier) ne sont lus que par les écrans admin: pas au login.
+LOGIN_COLUMNS = {
+    "passenger": (
+        "id,full_name,phone,email,city,password_hash,profile_photo,admin_id,"
+        "moncash_enabled,moncash_phone,natcash_enabled,natcash_phone,wallet_balance,"
+        "is_verified,is_active,created_at,updated_at"
+    ),
+    "driver": (
+        "id,full_name,phone,email,city,password_hash,vehicle_type,vehicle_brand,vehicle_model,"
+        "vehicle_color,plate_number,vehicle_photo,profile_photo,status,is_online,is_verified,"
+        "is_active,current_lat,current_lng,rating,total_rides,wallet_balance,moncash_enabled,"
+        "moncash_phone,natcash_enabled,natcash_phone,bank_enabled,bank_name,bank_account_name,"
+        "bank_account_number,default_method,admin_id,created_at,updated_at"
+    ),
+    "admin": (
+        "id,full_name,phone,email,password_hash,cities,brand_name,logo,primary_color,"
+        "secondary_color,tertiary_color,commission_rate,is_active,created_at,updated_at"
+    ),
+    "subadmin": (
+        "id,admin_id,full_name,phone,email,password_hash,force_password_change,is_active,"
+        "created_at,updated_at"
+    ),
+    "superadmin": "id,full_name,phone,email,password_hash,is_active,created_at,updated_at",
+}
+
+
+def normalize_identifier(value: str) -> Tuple[str, str]:
+    """(kind, identifier) tel que stocké dans user_identities."""
+    value = (value or "").strip()
+    if "@" in value:
+        return "email", value.lower()
+    return "phone", value
+
+
+class IdentityDirectory:
+    """Résout un téléphone / email en (user_type, table, user_id) via user_identities.
+
+    La table est remplie par les triggers de migrations/add_user_identities.sql. Si elle
+    n'existe pas (migration non appliquée), ready reste False et les appelants gardent
+    l'ancienne recherche or_() sur la table du type demandé.
+    """
+
+    def __init__(self, supabase_client: Any):
+        self.supabase = supabase_client
+        self.ready = False
+        self.lookups = 0
+        self.misses = 0
+
+    def check(self) -> bool:
+        try:
+            self.supabase.table("user_identities").select("user_id").limit(1).execute()
+            self.ready = True
+        except Exception as e:
+            logger.warning(f"user_identities unavailable, using per-table lookups: {e}")
+            self.ready = False
+        return self.ready
+
+    def resolve(self, value: str, user_types: List[str], kind: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Première identité trouvée dans l'ordre de user_types (ex. admin puis subadmin)."""
+        value_kind, identifier = normalize_identifier(value)
+        if not identifier or (kind and kind != value_kind):
+            return None
+        query = (
+            self.supabase.table("user_identities")
+            .select("user_type,user_table,user_id")
+            .eq("identifier", identifier)
+        )
+        if len(user_types) == 1:
+            query = query.eq("user_type", user_types[0])
+        else:
+            query = query.in_("user_type", user_types)
+        rows = query.execute().data or []
+        self.lookups += 1
+        for user_type in user_types:
+            for row in rows:
+                if row.get("user_type") == user_type:
+                    return row
+        self.misses += 1
+        return None
+
+    def stats(self) -> Dict[str, Any]:
+        return {"ready": self.ready, "lookups": self.lookups, "misses": self.misses}
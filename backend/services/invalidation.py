@@ -0,0 +1,433 @@
+import asyncio
+import itertools
+import json
+import os
+import socket
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import logging
+
+from services.redis_client import get_async_redis, redis_available
+
+logger = logging.getLogger(__name__)
+
+# Dossier partagé par les workers d'une même machine: un socket Unix (datagramme) par worker.
+# Rempli par serve.py avec plusieurs workers; ignoré si Redis est configuré.
+BUS_DIR = (os.getenv("TAPTAPGO_BUS_DIR") or "").strip()
+# Durée de vie max d'une entrée de cache, même sans invalidation reçue (filet de sécurité)
+CACHE_TTL_SECONDS = float(os.getenv("TAPTAPGO_CACHE_TTL_SECONDS", "300"))
+# Canal Redis des invalidations
+BUS_CHANNEL = "taptapgo:invalidate"
+# Attente avant de se réabonner après une coupure Redis (secondes, doublée jusqu'au max)
+RECONNECT_MAX_SECONDS = 30.0
+# Publications Redis en attente d'envoi au-delà desquelles les plus récentes sont abandonnées
+REDIS_SEND_QUEUE_MAX = 10000
+
+_SOCKET_PREFIX = "bus_"
+_SOCKET_SUFFIX = ".sock"
+_HOST = socket.gethostname()
+
+# handler(key, version): key None = tout le topic
+Handler = Callable[[Optional[str], float], None]
+# handler(key, data) des messages (send): (None, None) = messages possiblement perdus, tout recharger
+MessageHandler = Callable[[Optional[str], Optional[Dict[str, Any]]], None]
+
+
+def _origin() -> str:
+    # Calculé à chaque appel: le bus est créé dans le master avant le fork des workers
+    return f"{_HOST}:{os.getpid()}"
+
+
+class InvalidationBus:
+    """Invalidations de caches en mémoire entre les workers.
+
+    publish(topic, key) appelle les handlers du topic sur tous les workers (key=None =
+    tout le topic). L'événement porte une version (epoch, précision ms) prise au moment
+    de l'écriture: un handler peut ignorer ce qu'il a chargé après. Le worker qui publie
+    applique l'invalidation lui-même avant l'envoi; les autres la reçoivent en quelques ms.
+
+    send(topic, key, data) transporte un changement complet (ex. une course) vers les
+    autres workers seulement: l'appelant l'a déjà appliqué chez lui.
+
+    Chaque événement envoyé porte un numéro de séquence par origine: un récepteur qui voit
+    un trou (événement perdu) invalide tous les topics et prévient les handlers de messages.
+
+    Cette classe n'envoie rien aux autres process: un seul worker (dev) ou tests.
+    """
+
+    backend = "local"
+
+    def __init__(self):
+        self._handlers: Dict[str, List[Handler]] = {}
+        self._message_handlers: Dict[str, List[MessageHandler]] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._seq = itertools.count(1)
+        # Numérotation et envoi atomiques: deux threads ne peuvent pas inverser l'ordre des séquences
+        self._send_lock = threading.Lock()
+        # Dernière séquence reçue par origine (host:pid)
+        self._last_seq: Dict[str, int] = {}
+        self.gaps = 0
+        self.published = 0
+        self.messages_sent = 0
+        self.received = 0
+        self.send_errors = 0
+        self.handler_errors = 0
+        self.last_delay_ms: Optional[float] = None
+        self.max_delay_ms = 0.0
+
+    def subscribe(self, topic: str, handler: Handler) -> None:
+        self._handlers.setdefault(topic, []).append(handler)
+
+    def publish(self, topic: str, key: Optional[str] = None, version: Optional[float] = None) -> float:
+        if version is None:
+            version = time.time()
+        self.published += 1
+        self._dispatch(topic, key, version)
+        if self._loop is not None:
+            self._emit({"topic": topic, "key": key, "version": version})
+        return version
+
+    def on_message(self, topic: str, handler: MessageHandler) -> None:
+        self._message_handlers.setdefault(topic, []).append(handler)
+
+    def send(self, topic: str, key: Optional[str], data: Dict[str, Any]) -> None:
+        """Message pour les autres workers (pas de dispatch local)."""
+        self.messages_sent += 1
+        if self._loop is not None:
+            self._emit({"topic": topic, "key": key, "data": data})
+
+    def _emit(self, event: Dict[str, Any]) -> None:
+        with self._send_lock:
+            event.update(origin=_origin(), seq=next(self._seq), sent_at=time.time())
+            self._send(json.dumps(event, default=str).encode())
+
+    def _deliver(self, topic: str, key: Optional[str], data: Optional[Dict[str, Any]]) -> None:
+        for handler in self._message_handlers.get(topic, ()):
+            try:
+                handler(key, data)
+            except Exception as e:
+                self.handler_errors += 1
+                logger.error(f"Message handler error ({topic}): {e}")
+
+    def _dispatch(self, topic: str, key: Optional[str], version: float) -> None:
+        for handler in self._handlers.get(topic, ()):
+            try:
+                handler(key, version)
+            except Exception as e:
+                self.handler_errors += 1
+                logger.error(f"Invalidation handler error ({topic}): {e}")
+
+    def _dispatch_all(self) -> None:
+        """Événements possiblement perdus (coupure): tout invalider."""
+        for topic in list(self._handlers):
+            self._dispatch(topic, None, time.time())
+        for topic in list(self._message_handlers):
+            self._deliver(topic, None, None)
+
+    def _receive(self, raw: Any) -> None:
+        try:
+            event = json.loads(raw)
+        except (TypeError, ValueError):
+            return
+        origin = event.get("origin")
+        if origin == _origin():
+            return
+        self.received += 1
+        seq = event.get("seq")
+        if isinstance(seq, int):
+            last = self._last_seq.get(origin)
+            if last is not None and seq > last + 1:
+                # Événements perdus (file pleine, envoi en échec): ce qu'ils invalidaient est inconnu
+                self.gaps += 1
+                logger.warning(f"Invalidation events lost from {origin} ({seq - last - 1}), invalidating everything")
+                self._dispatch_all()
+            if last is None or seq > last:
+                self._last_seq[origin] = seq
+        delay = max(0.0, (time.time() - float(event.get("sent_at") or 0)) * 1000)
+        self.last_delay_ms = round(delay, 2)
+        self.max_delay_ms = max(self.max_delay_ms, self.last_delay_ms)
+        if "data" in event:
+            self._deliver(event.get("topic"), event.get("key"), event.get("data"))
+            return
+        self._dispatch(event.get("topic"), event.get("key"), float(event.get("version") or time.time()))
+
+    def _send(self, data: bytes) -> None:
+        pass
+
+    async def start(self) -> None:
+        """À appeler depuis la boucle du worker (lifespan): avant, publish() reste local."""
+        self._loop = asyncio.get_running_loop()
+
+    async def stop(self) -> None:
+        self._loop = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": self.backend,
+            "topics": sorted(self._handlers),
+            "message_topics": sorted(self._message_handlers),
+            "published": self.published,
+            "messages_sent": self.messages_sent,
+            "received": self.received,
+            "send_errors": self.send_errors,
+            "gaps": self.gaps,
+            "handler_errors": self.handler_errors,
+            "last_delay_ms": self.last_delay_ms,
+            "max_delay_ms": round(self.max_delay_ms, 2),
+        }
+
+
+class UnixSocketBus(InvalidationBus):
+    """Workers d'une même machine: chacun écoute sur BUS_DIR/bus_<pid>.sock (datagrammes).
+
+    publish() envoie l'événement à tous les sockets du dossier; le socket d'un worker mort
+    est supprimé au premier envoi refusé. Les envois ne bloquent jamais la boucle: si la
+    file d'un worker est pleine, le datagramme est abandonné et le destinataire voit le
+    trou de séquence au message suivant (tout est invalidé chez lui).
+    """
+
+    backend = "unix"
+
+    def __init__(self, directory: str = BUS_DIR):
+        super().__init__()
+        self.directory = directory
+        self._sock: Optional[socket.socket] = None
+        self.dropped = 0
+        self._path: Optional[str] = None
+
+    async def start(self) -> None:
+        await super().start()
+        os.makedirs(self.directory, exist_ok=True)
+        self._path = os.path.join(self.directory, f"{_SOCKET_PREFIX}{os.getpid()}{_SOCKET_SUFFIX}")
+        if os.path.exists(self._path):
+            os.remove(self._path)
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._sock.bind(self._path)
+        self._sock.setblocking(False)
+        self._loop.add_reader(self._sock.fileno(), self._on_readable)
+
+    def _on_readable(self) -> None:
+        while True:
+            try:
+                data = self._sock.recv(65536)
+            except (BlockingIOError, InterruptedError):
+                return
+            self._receive(data)
+
+    def _send(self, data: bytes) -> None:
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return
+        for name in names:
+            if not (name.startswith(_SOCKET_PREFIX) and name.endswith(_SOCKET_SUFFIX)):
+                continue
+            path = os.path.join(self.directory, name)
+            if path == self._path:
+                continue
+            try:
+                self._sock.sendto(data, path)
+            except (ConnectionRefusedError, FileNotFoundError):
+                # Worker arrêté sans nettoyer son socket
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            except (BlockingIOError, InterruptedError):
+                # File pleine: le destinataire est occupé, il rattrapera par le trou de séquence
+                self.dropped += 1
+            except OSError as e:
+                self.send_errors += 1
+                logger.warning(f"Invalidation send to {name} failed: {e}")
+
+    async def stop(self) -> None:
+        if self._sock is not None:
+            self._loop.remove_reader(self._sock.fileno())
+            self._sock.close()
+            self._sock = None
+            try:
+                os.remove(self._path)
+            except OSError:
+                pass
+        await super().stop()
+
+    def stats(self) -> Dict[str, Any]:
+        return {**super().stats(), "directory": self.directory, "dropped": self.dropped}
+
+
+class RedisInvalidationBus(InvalidationBus):
+    """Workers sur plusieurs machines: pub/sub Redis sur BUS_CHANNEL.
+
+    Les publications partent dans l'ordre, une à la fois, depuis une seule tâche (file
+    asyncio): des envois concurrents sur plusieurs connexions du pool arriveraient
+    désordonnés et passeraient pour des trous de séquence. Après une coupure de
+    l'abonnement, des événements ont pu être perdus: tous les topics sont invalidés à la
+    reconnexion.
+    """
+
+    backend = "redis"
+
+    def __init__(self, client: Any, channel: str = BUS_CHANNEL):
+        super().__init__()
+        self._redis = client
+        self.channel = channel
+        self._task: Optional[asyncio.Task] = None
+        self._sender: Optional[asyncio.Task] = None
+        self._outbox: Optional[asyncio.Queue] = None
+        self.reconnects = 0
+
+    async def start(self) -> None:
+        await super().start()
+        self._outbox = asyncio.Queue(maxsize=REDIS_SEND_QUEUE_MAX)
+        self._sender = asyncio.create_task(self._drain())
+        self._task = asyncio.create_task(self._listen())
+
+    async def _listen(self) -> None:
+        delay = 1.0
+        connected_once = False
+        while True:
+            pubsub = self._redis.pubsub()
+            try:
+                await pubsub.subscribe(self.channel)
+                if connected_once:
+                    self.reconnects += 1
+                    self._dispatch_all()
+                connected_once = True
+                delay = 1.0
+                async for message in pubsub.listen():
+                    if message.get("type") == "message":
+                        self._receive(message.get("data"))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Invalidation bus disconnected: {e}")
+            finally:
+                try:
+                    await pubsub.close()
+                except Exception:
+                    pass
+            await asyncio.sleep(delay)
+            delay = min(RECONNECT_MAX_SECONDS, delay * 2)
+
+    def _send(self, data: bytes) -> None:
+        # publish() peut venir d'un thread (handlers sync): la publication part sur la boucle
+        try:
+            self._loop.call_soon_threadsafe(self._enqueue, data)
+        except RuntimeError:
+            self.send_errors += 1
+
+    def _enqueue(self, data: bytes) -> None:
+        try:
+            self._outbox.put_nowait(data)
+        except asyncio.QueueFull:
+            # Redis injoignable depuis longtemps: les récepteurs verront le trou de séquence
+            self.send_errors += 1
+
+    async def _drain(self) -> None:
+        while True:
+            data = await self._outbox.get()
+            try:
+                await self._redis.publish(self.channel, data)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.send_errors += 1
+                logger.warning(f"Invalidation publish failed: {e}")
+            finally:
+                self._outbox.task_done()
+
+    async def stop(self) -> None:
+        if self._sender is not None:
+            try:
+                await asyncio.wait_for(self._outbox.join(), timeout=5)
+            except asyncio.TimeoutError:
+                pass
+            self._sender.cancel()
+            try:
+                await self._sender
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._sender = None
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._task = None
+        await super().stop()
+
+    def stats(self) -> Dict[str, Any]:
+        return {**super().stats(), "channel": self.channel, "reconnects": self.reconnects}
+
+
+def create_invalidation_bus() -> InvalidationBus:
+    if redis_available():
+        client = get_async_redis()
+        if client is not None:
+            return RedisInvalidationBus(client)
+    if BUS_DIR and hasattr(socket, "AF_UNIX"):
+        return UnixSocketBus(BUS_DIR)
+    return InvalidationBus()
+
+
+class InvalidatedCache:
+    """Cache en mémoire d'un topic du bus (villes, tarifs...): get_or_load(key, loader) lit
+    la base au premier appel puis sert la copie jusqu'à une invalidation du topic, sur
+    n'importe quel worker, ou au plus ttl secondes.
+
+    Les valeurs sont partagées entre requêtes: ne pas les modifier.
+    """
+
+    def __init__(self, bus: InvalidationBus, topic: str, ttl: float = CACHE_TTL_SECONDS, max_size: int = 1024):
+        self.topic = topic
+        self.ttl = ttl
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        # Incrémenté à chaque invalidation: une lecture commencée avant n'est pas gardée
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        bus.subscribe(topic, self.invalidate)
+
+    def get_or_load(self, key: str, loader: Callable[[], Any]) -> Any:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            generation = self._generation
+        value = loader()
+        with self._lock:
+            if generation == self._generation:
+                self._entries[key] = (now + self.ttl, value)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+        return value
+
+    def invalidate(self, key: Optional[str] = None, version: Optional[float] = None) -> None:
+        with self._lock:
+            self._generation += 1
+            self.invalidations += 1
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "topic": self.topic,
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "ttl": self.ttl,
+            }
@@ -0,0 +1,281 @@
+import asyncio
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+try:
+    import brotli  # dépendance optionnelle (pip install brotli)
+except ImportError:
+    brotli = None
+
+# Intervalle min entre deux vérifications du mtime de index.html (secondes)
+LANDING_CHECK_SECONDS = float(os.getenv("TAPTAPGO_LANDING_CHECK_SECONDS", "2"))
+# Intervalle entre deux parcours de landing/ (assets ajoutés ou modifiés), hors requêtes
+LANDING_ASSET_CHECK_SECONDS = float(os.getenv("TAPTAPGO_LANDING_ASSET_CHECK_SECONDS", "10"))
+
+PRODUCTION_ORIGIN = "https://taptapgoht.com"
+# En localhost, les liens du site pointent vers l'app front
+LOCAL_FRONT_ORIGIN = "http://localhost:8081"
+# Images relatives de index.html -> servies par le backend sous /landing-assets
+ASSET_REWRITES = (
+    ('src="images/', 'src="/landing-assets/images/'),
+    ('href="images/', 'href="/landing-assets/images/'),
+    ("url('images/", "url('/landing-assets/images/"),
+    ('url("images/', 'url("/landing-assets/images/'),
+)
+
+
+ASSETS_URL_PREFIX = "/landing-assets/"
+# Assets fingerprintés (hash du contenu dans le nom): un an, jamais revalidés
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# Variantes pré-compressées cherchées à côté de chaque fichier (foo.png.br, foo.png.gz)
+PRECOMPRESSED = (("br", ".br"), ("gzip", ".gz"))
+_ASSET_REF = re.compile(r"/landing-assets/([^\"'()\s?#]+)")
+
+
+def render_landing(html: str, local: bool, manifest: Optional["AssetManifest"] = None) -> str:
+    if local:
+        html = html.replace(PRODUCTION_ORIGIN, LOCAL_FRONT_ORIGIN)
+    for old, new in ASSET_REWRITES:
+        html = html.replace(old, new)
+    if manifest is not None:
+        html = manifest.fingerprint_html(html)
+    return html
+
+
+def is_local_host(host: str) -> bool:
+    return "localhost" in host or "127.0.0.1" in host
+
+
+def accepted_encodings(header: str) -> Dict[str, float]:
+    """Accept-Encoding -> {encodage: q}."""
+    accepted = {}
+    for part in header.split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        if name:
+            accepted[name.strip().lower()] = q
+    return accepted
+
+
+class RenderedPage:
+    """Une variante (production ou localhost): octets bruts, gzip et brotli, avec leur ETag."""
+
+    __slots__ = ("bodies", "etags")
+
+    def __init__(self, html: str):
+        raw = html.encode("utf-8")
+        digest = hashlib.sha256(raw).hexdigest()[:20]
+        self.bodies = {"identity": raw, "gzip": gzip.compress(raw, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            self.bodies["br"] = brotli.compress(raw, quality=11, mode=brotli.MODE_TEXT)
+        # Un ETag par encodage: les représentations diffèrent octet par octet
+        self.etags = {
+            encoding: f'"{digest}"' if encoding == "identity" else f'"{digest}-{encoding}"'
+            for encoding in self.bodies
+        }
+
+    def select(self, accept_encoding: str) -> Tuple[str, bytes, str]:
+        accepted = accepted_encodings(accept_encoding)
+        for encoding in ("br", "gzip"):
+            if encoding in self.bodies and accepted.get(encoding, accepted.get("*", 0)) > 0:
+                return encoding, self.bodies[encoding], self.etags[encoding]
+        return "identity", self.bodies["identity"], self.etags["identity"]
+
+    def matches(self, if_none_match: str) -> bool:
+        tags = {t.strip().removeprefix("W/") for t in if_none_match.split(",")}
+        return "*" in tags or any(etag in tags for etag in self.etags.values())
+
+
+class Asset:
+    """Un fichier de landing/: nom fingerprinté, ETag (hash du contenu) et variantes .br/.gz."""
+
+    __slots__ = ("path", "fingerprinted", "digest", "media_type", "variants")
+
+    def __init__(self, path: Path, rel: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self.digest = hashlib.sha256(f.read()).hexdigest()[:16]
+        stem, dot, ext = rel.rpartition(".")
+        self.fingerprinted = f"{stem}.{self.digest[:12]}.{ext}" if dot and "/" not in ext else f"{rel}.{self.digest[:12]}"
+        self.media_type = mimetypes.guess_type(rel)[0] or "application/octet-stream"
+        self.variants = {
+            encoding: Path(f"{path}{suffix}") for encoding, suffix in PRECOMPRESSED if os.path.isfile(f"{path}{suffix}")
+        }
+
+    def select(self, accept_encoding: str, immutable: bool) -> Tuple[Path, Dict[str, str]]:
+        """Fichier à envoyer et en-têtes (ETag, Cache-Control, Content-Encoding, Vary)."""
+        headers = {"Cache-Control": IMMUTABLE_CACHE_CONTROL if immutable else "no-cache"}
+        path, etag = self.path, f'"{self.digest}"'
+        if self.variants:
+            headers["Vary"] = "Accept-Encoding"
+            accepted = accepted_encodings(accept_encoding)
+            for encoding in ("br", "gzip"):
+                if encoding in self.variants and accepted.get(encoding, accepted.get("*", 0)) > 0:
+                    path, etag = self.variants[encoding], f'"{self.digest}-{encoding}"'
+                    headers["Content-Encoding"] = encoding
+                    break
+        headers["ETag"] = etag
+        return path, headers
+
+
+class AssetManifest:
+    """Assets de landing/ (hors index.html) indexés par chemin relatif et par nom fingerprinté."""
+
+    def __init__(self, root: Path, files: List[Tuple[str, Path]]):
+        self.root = root
+        self.by_path: Dict[str, Asset] = {}
+        self.by_fingerprint: Dict[str, Asset] = {}
+        for rel, path in files:
+            try:
+                asset = Asset(path, rel)
+            except OSError:
+                continue
+            self.by_path[rel] = asset
+            self.by_fingerprint[asset.fingerprinted] = asset
+
+    def fingerprint_html(self, html: str) -> str:
+        """/landing-assets/images/logo.png -> /landing-assets/images/logo.<hash>.png (assets connus)."""
+        def replace(match: "re.Match[str]") -> str:
+            asset = self.by_path.get(match.group(1))
+            return f"{ASSETS_URL_PREFIX}{asset.fingerprinted}" if asset else match.group(0)
+        return _ASSET_REF.sub(replace, html)
+
+    def resolve(self, rel: str) -> Optional[Tuple[Asset, bool]]:
+        """(asset, immuable) pour un chemin demandé; seuls les fichiers du manifeste sont servis."""
+        asset = self.by_fingerprint.get(rel)
+        if asset is not None:
+            return asset, True
+        asset = self.by_path.get(rel)
+        return (asset, False) if asset is not None else None
+
+
+def _scan_assets(root: Path, index_name: str) -> List[Tuple[str, Path, int, int]]:
+    files = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = [d for d in dirnames if not d.startswith(".")]
+        for name in filenames:
+            if name.startswith(".") or name.endswith(tuple(s for _, s in PRECOMPRESSED)):
+                continue
+            path = Path(dirpath) / name
+            rel = path.relative_to(root).as_posix()
+            if rel == index_name:
+                continue
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            files.append((rel, path, st.st_mtime_ns, st.st_size))
+    files.sort()
+    return files
+
+
+class LandingPage:
+    """landing/index.html rendue une fois (production + localhost) et gardée compressée en mémoire,
+    avec le manifeste des assets: les références d'images pointent vers leur nom fingerprinté.
+
+    Rechargée quand index.html change (un stat de index.html au plus toutes les
+    LANDING_CHECK_SECONDS, seul travail fait pendant une requête) ou quand un asset change
+    (refresh_loop parcourt landing/ dans un thread toutes les LANDING_ASSET_CHECK_SECONDS).
+    """
+
+    def __init__(self, index_path: Path, check_seconds: float = LANDING_CHECK_SECONDS):
+        self.index_path = index_path
+        self.check_seconds = check_seconds
+        self._lock = threading.Lock()
+        self._pages: Dict[bool, RenderedPage] = {}
+        self.manifest = AssetManifest(index_path.parent, [])
+        self._signature: Optional[Tuple[Any, ...]] = None
+        self._index_signature: Optional[Tuple[int, int]] = None
+        self._loaded = False
+        self._checked_at = 0.0
+        self.renders = 0
+
+    def _stat_index(self) -> Optional[Tuple[int, int]]:
+        try:
+            st = os.stat(self.index_path)
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def _stat(self) -> Optional[Tuple[Any, ...]]:
+        index = self._stat_index()
+        if index is None:
+            return None
+        assets = tuple((rel, mtime, size) for rel, _, mtime, size in _scan_assets(self.index_path.parent, self.index_path.name))
+        return index + (assets,)
+
+    def is_stale(self) -> bool:
+        """Vrai si index.html a changé depuis le dernier rendu (ou n'a jamais été rendu).
+        Un seul stat: les assets sont vérifiés par refresh_loop."""
+        now = time.monotonic()
+        if self._loaded and now - self._checked_at < self.check_seconds:
+            return False
+        self._checked_at = now
+        return not self._loaded or self._stat_index() != self._index_signature
+
+    def refresh(self) -> bool:
+        """Parcours complet (index + assets); recharge si quelque chose a changé. Bloquant: hors boucle."""
+        if self._stat() == self._signature and self._pages:
+            return False
+        self.load()
+        return True
+
+    async def refresh_loop(self, interval: float = LANDING_ASSET_CHECK_SECONDS) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                if await asyncio.to_thread(self.refresh):
+                    logger.info("Landing page reloaded (files changed)")
+            except Exception as e:
+                logger.warning(f"Landing refresh error: {e}")
+
+    def load(self) -> None:
+        with self._lock:
+            signature = self._stat()
+            if signature is not None and signature == self._signature and self._pages:
+                return
+            pages: Dict[bool, RenderedPage] = {}
+            root = self.index_path.parent
+            manifest = AssetManifest(root, [(rel, path) for rel, path, _, _ in _scan_assets(root, self.index_path.name)])
+            if signature is not None:
+                html = self.index_path.read_text(encoding="utf-8")
+                pages = {local: RenderedPage(render_landing(html, local, manifest)) for local in (False, True)}
+                self.renders += 1
+            self.manifest = manifest
+            self._pages = pages
+            self._signature = signature
+            self._index_signature = signature[:2] if signature is not None else None
+            self._loaded = True
+            self._checked_at = time.monotonic()
+
+    def page(self, host: str) -> Optional[RenderedPage]:
+        return self._pages.get(is_local_host(host))
+
+    def asset(self, rel: str) -> Optional[Tuple[Asset, bool]]:
+        return self.manifest.resolve(rel)
+
+    def stats(self) -> Dict[str, Any]:
+        page = self._pages.get(False)
+        return {
+            "loaded": bool(self._pages),
+            "renders": self.renders,
+            "brotli": brotli is not None,
+            "assets": len(self.manifest.by_path),
+            "sizes": {encoding: len(body) for encoding, body in page.bodies.items()} if page else {},
+        }
@@ -0,0 +1,197 @@
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+from typing import Any, Dict, List, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Période de mesure du lag (ms): la tâche dort ce temps et mesure son retard au réveil
+LOOP_LAG_INTERVAL_MS = float(os.getenv("TAPTAPGO_LOOP_LAG_INTERVAL_MS", "100"))
+# Au-delà de ce retard (ms), la boucle est considérée bloquée: pile capturée et loggée
+LOOP_LAG_THRESHOLD_MS = float(os.getenv("TAPTAPGO_LOOP_LAG_THRESHOLD_MS", "250"))
+# Bornes de l'histogramme du lag (secondes), exporté sur /metrics
+LOOP_LAG_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+# Frames gardées par pile capturée
+STACK_LIMIT = 30
+# Blocages récents gardés pour GET /api/superadmin/runtime
+RECENT_BLOCKS = 20
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Enveloppes sans intérêt comme "site" bloquant: on remonte jusqu'à leur appelant
+_WRAPPER_FILES = ("db_instrumentation.py",)
+
+
+def _frame_route(frame: Any) -> Optional[str]:
+    """Route de la requête en cours: scope ASGI trouvé en remontant la pile de la boucle.
+
+    Les coroutines imbriquées (middlewares -> handler) sont toutes sur la pile pendant
+    qu'elles s'exécutent; la plus interne qui porte un scope HTTP connaît la route.
+    """
+    while frame is not None:
+        scope = frame.f_locals.get("scope") if "scope" in frame.f_code.co_varnames else None
+        if isinstance(scope, dict) and scope.get("type") == "http":
+            route = getattr(scope.get("route"), "path", None)
+            return f"{scope.get('method')} {route or scope.get('path')}"
+        frame = frame.f_back
+    return None
+
+
+def _short_path(filename: str) -> str:
+    return os.path.relpath(filename, BACKEND_DIR) if filename.startswith(BACKEND_DIR) else filename
+
+
+def _format_stack(frame: Any) -> List[str]:
+    stack = []
+    while frame is not None and len(stack) < STACK_LIMIT:
+        stack.append(f"{_short_path(frame.f_code.co_filename)}:{frame.f_lineno} {frame.f_code.co_name}")
+        frame = frame.f_back
+    return stack
+
+
+def _blocking_site(frame: Any) -> Optional[str]:
+    """Frame du code de l'app (server.py, services/) la plus proche de la feuille: l'appel bloquant."""
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if (
+            filename.startswith(BACKEND_DIR)
+            and "site-packages" not in filename
+            and not filename.endswith(_WRAPPER_FILES)
+        ):
+            return f"{_short_path(filename)}:{frame.f_lineno} {frame.f_code.co_name}"
+        frame = frame.f_back
+    return None
+
+
+class LoopMonitor:
+    """Mesure en continu le lag de la boucle asyncio du worker et repère les appels bloquants.
+
+    Une tâche asyncio dort LOOP_LAG_INTERVAL_MS et mesure son retard au réveil. Un thread
+    de garde surveille cette tâche: si elle n'a pas pu se réveiller depuis plus de
+    LOOP_LAG_THRESHOLD_MS, la boucle exécute du code bloquant et le thread capture la pile
+    de la boucle à ce moment (l'appel fautif et la route). Au réveil, la tâche logge le
+    blocage complet (event_loop_blocked, JSON) avec sa durée.
+    """
+
+    def __init__(self, interval_ms: float = LOOP_LAG_INTERVAL_MS, threshold_ms: float = LOOP_LAG_THRESHOLD_MS):
+        self.interval = interval_ms / 1000
+        self.threshold = threshold_ms / 1000
+        self.buckets = [0] * (len(LOOP_LAG_BUCKETS) + 1)  # dernier = +Inf
+        self.total = 0.0
+        self.count = 0
+        self.max_lag = 0.0
+        self.last_lag = 0.0
+        self.blocked = 0
+        self.sites: Counter = Counter()
+        self.recent: deque = deque(maxlen=RECENT_BLOCKS)
+        self._loop_thread: Optional[int] = None
+        self._expected_wake = 0.0
+        self._tick = 0
+        self._capture: Optional[Dict[str, Any]] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stop = threading.Event()
+        self._watchdog: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        """À appeler depuis la boucle (startup)."""
+        self._loop_thread = threading.get_ident()
+        self._expected_wake = time.monotonic() + self.interval
+        self._stop.clear()
+        self._task = asyncio.create_task(self._run())
+        self._watchdog = threading.Thread(target=self._watch, name="taptapgo-loop-watchdog", daemon=True)
+        self._watchdog.start()
+
+    def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+        self._stop.set()
+        if self._watchdog:
+            self._watchdog.join(timeout=1)
+
+    async def _run(self) -> None:
+        while True:
+            self._expected_wake = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, time.monotonic() - self._expected_wake)
+            self._record(lag)
+            capture, self._capture = self._capture, None
+            if capture is not None and capture["tick"] != self._tick:
+                capture = None
+            self._tick += 1
+            if lag >= self.threshold:
+                self._report(lag, capture)
+
+    def _record(self, lag: float) -> None:
+        index = len(LOOP_LAG_BUCKETS)
+        for i, bound in enumerate(LOOP_LAG_BUCKETS):
+            if lag <= bound:
+                index = i
+                break
+        self.buckets[index] += 1
+        self.total += lag
+        self.count += 1
+        self.last_lag = lag
+        self.max_lag = max(self.max_lag, lag)
+
+    def _watch(self) -> None:
+        check_every = min(self.interval, self.threshold) / 2
+        while not self._stop.wait(check_every):
+            tick = self._tick
+            captured = self._capture
+            if (captured is not None and captured["tick"] == tick) or time.monotonic() - self._expected_wake < self.threshold:
+                continue
+            frame = sys._current_frames().get(self._loop_thread)
+            if frame is None:
+                continue
+            capture = {
+                "tick": tick,
+                "route": _frame_route(frame),
+                "site": _blocking_site(frame),
+                "stack": _format_stack(frame),
+            }
+            # La boucle a pu se réveiller entre-temps: la pile serait celle d'un autre travail
+            if tick == self._tick:
+                self._capture = capture
+
+    def _report(self, lag: float, capture: Optional[Dict[str, Any]]) -> None:
+        self.blocked += 1
+        event = {
+            "event": "event_loop_blocked",
+            "lag_ms": round(lag * 1000, 1),
+            "route": capture["route"] if capture else None,
+            "site": capture["site"] if capture else None,
+            "stack": capture["stack"] if capture else None,
+        }
+        self.sites[(event["route"], event["site"])] += 1
+        self.recent.append({**event, "at": time.time(), "stack": (event["stack"] or [])[:8]})
+        logger.warning(json.dumps(event))
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Histogramme du lag, agrégé par MetricsRegistry avec les autres workers."""
+        return {
+            "bounds": list(LOOP_LAG_BUCKETS),
+            "buckets": list(self.buckets),
+            "sum": self.total,
+            "count": self.count,
+            "max": self.max_lag,
+            "last": self.last_lag,
+            "blocked": self.blocked,
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "interval_ms": self.interval * 1000,
+            "threshold_ms": self.threshold * 1000,
+            "last_lag_ms": round(self.last_lag * 1000, 1),
+            "max_lag_ms": round(self.max_lag * 1000, 1),
+            "avg_lag_ms": round(self.total / self.count * 1000, 2) if self.count else 0.0,
+            "blocked": self.blocked,
+            "top_blocking_sites": [
+                {"route": route, "site": site, "count": n} for (route, site), n in self.sites.most_common(10)
+            ],
+            "recent": list(self.recent),
+        }
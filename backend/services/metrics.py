@@ -0,0 +1,279 @@
+import asyncio
+import json
+import os
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Bornes des histogrammes de latence (secondes)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Dossier partagé par les workers uvicorn (--workers N) pour agréger /metrics. Vide = ce process seul
+METRICS_DIR = (os.getenv("TAPTAPGO_METRICS_DIR") or "").strip()
+# Intervalle d'écriture du snapshot de chaque worker dans METRICS_DIR (secondes)
+METRICS_FLUSH_SECONDS = float(os.getenv("TAPTAPGO_METRICS_FLUSH_SECONDS", "5"))
+# Si défini, /metrics exige "Authorization: Bearer <token>"
+METRICS_TOKEN = (os.getenv("TAPTAPGO_METRICS_TOKEN") or "").strip()
+
+UNMATCHED_ROUTE = "<unmatched>"
+
+
+class RouteStats:
+    __slots__ = ("statuses", "buckets", "total", "count")
+
+    def __init__(self):
+        self.statuses: Dict[str, int] = {}
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)  # dernier = +Inf
+        self.total = 0.0
+        self.count = 0
+
+
+class MetricsRegistry:
+    """Compteurs par route (méthode + chemin déclaré, pas le chemin brut) pour ce worker.
+
+    Mis à jour uniquement depuis la boucle asyncio du worker, donc sans verrou. Avec
+    plusieurs workers, chacun écrit son snapshot dans METRICS_DIR et /metrics additionne
+    les snapshots récents (au plus METRICS_FLUSH_SECONDS de retard pour les autres workers).
+    """
+
+    def __init__(self, metrics_dir: str = METRICS_DIR, flush_seconds: float = METRICS_FLUSH_SECONDS, loop_monitor: Optional[Any] = None):
+        self.metrics_dir = metrics_dir
+        self.flush_seconds = flush_seconds
+        self.started_at = time.time()
+        self._routes: Dict[Tuple[str, str], RouteStats] = {}
+        # Requêtes en cours, toutes routes confondues (la route n'est connue qu'après le routage)
+        self.in_flight = 0
+        # LoopMonitor du worker: son histogramme de lag est ajouté au snapshot
+        self.loop_monitor = loop_monitor
+
+    def _stats(self, method: str, route: str) -> RouteStats:
+        key = (method, route)
+        stats = self._routes.get(key)
+        if stats is None:
+            stats = self._routes[key] = RouteStats()
+        return stats
+
+    def start(self) -> None:
+        self.in_flight += 1
+
+    def finish(self, method: str, route: str, status: int, duration: float) -> None:
+        self.in_flight -= 1
+        stats = self._stats(method, route)
+        status_class = f"{status // 100}xx"
+        stats.statuses[status_class] = stats.statuses.get(status_class, 0) + 1
+        index = len(LATENCY_BUCKETS)
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if duration <= bound:
+                index = i
+                break
+        stats.buckets[index] += 1
+        stats.total += duration
+        stats.count += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "pid": os.getpid(),
+            "loop_lag": self.loop_monitor.snapshot() if self.loop_monitor is not None else None,
+            "started_at": self.started_at,
+            "in_flight": self.in_flight,
+            "routes": [
+                {
+                    "method": method,
+                    "route": route,
+                    "statuses": dict(s.statuses),
+                    "buckets": list(s.buckets),
+                    "sum": s.total,
+                    "count": s.count,
+                }
+                for (method, route), s in list(self._routes.items())
+            ],
+        }
+
+    # --- Agrégation multi-workers ---
+
+    def _snapshot_path(self, pid: int) -> str:
+        return os.path.join(self.metrics_dir, f"metrics_{pid}.json")
+
+    def write_snapshot(self) -> None:
+        if not self.metrics_dir:
+            return
+        os.makedirs(self.metrics_dir, exist_ok=True)
+        path = self._snapshot_path(os.getpid())
+        tmp = f"{path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.snapshot(), f)
+        os.replace(tmp, path)
+
+    def collect(self) -> List[Dict[str, Any]]:
+        """Snapshot de ce worker + snapshots récents des autres workers."""
+        snapshots = [self.snapshot()]
+        if not self.metrics_dir or not os.path.isdir(self.metrics_dir):
+            return snapshots
+        own = os.path.basename(self._snapshot_path(os.getpid()))
+        # Un worker arrêté n'écrit plus: son fichier vieillit et sort de l'agrégat
+        max_age = max(self.flush_seconds * 3, 15)
+        now = time.time()
+        for name in os.listdir(self.metrics_dir):
+            if not name.startswith("metrics_") or not name.endswith(".json") or name == own:
+                continue
+            path = os.path.join(self.metrics_dir, name)
+            try:
+                if now - os.path.getmtime(path) > max_age:
+                    continue
+                with open(path) as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        return snapshots
+
+    async def flush_loop(self) -> None:
+        while True:
+            try:
+                await asyncio.to_thread(self.write_snapshot)
+            except Exception as e:
+                logger.warning(f"Metrics snapshot error: {e}")
+            await asyncio.sleep(self.flush_seconds)
+
+    def remove_snapshot(self) -> None:
+        if self.metrics_dir:
+            try:
+                os.remove(self._snapshot_path(os.getpid()))
+            except OSError:
+                pass
+
+    # --- Format Prometheus ---
+
+    def render(self) -> str:
+        snapshots = self.collect()
+        merged: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        for snap in snapshots:
+            for r in snap.get("routes", []):
+                m = merged.setdefault((r["method"], r["route"]), {
+                    "statuses": {}, "buckets": [0] * (len(LATENCY_BUCKETS) + 1),
+                    "sum": 0.0, "count": 0,
+                })
+                for status_class, n in r["statuses"].items():
+                    m["statuses"][status_class] = m["statuses"].get(status_class, 0) + n
+                m["buckets"] = [a + b for a, b in zip(m["buckets"], r["buckets"])]
+                m["sum"] += r["sum"]
+                m["count"] += r["count"]
+
+        lines = [
+            "# HELP taptapgo_http_requests_total Requests by route and status class.",
+            "# TYPE taptapgo_http_requests_total counter",
+        ]
+        for (method, route), m in sorted(merged.items()):
+            for status_class, n in sorted(m["statuses"].items()):
+                lines.append(f'taptapgo_http_requests_total{{{_labels(method, route)},status="{status_class}"}} {n}')
+        lines += [
+            "# HELP taptapgo_http_requests_in_flight Requests being processed.",
+            "# TYPE taptapgo_http_requests_in_flight gauge",
+        ]
+        lines.append(f"taptapgo_http_requests_in_flight {sum(snap.get('in_flight', 0) for snap in snapshots)}")
+        lines += [
+            "# HELP taptapgo_http_request_duration_seconds Request latency by route.",
+            "# TYPE taptapgo_http_request_duration_seconds histogram",
+        ]
+        for (method, route), m in sorted(merged.items()):
+            if not m["count"]:
+                continue
+            labels = _labels(method, route)
+            cumulative = 0
+            for bound, n in zip(LATENCY_BUCKETS, m["buckets"]):
+                cumulative += n
+                lines.append(f'taptapgo_http_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'taptapgo_http_request_duration_seconds_bucket{{{labels},le="+Inf"}} {m["count"]}')
+            lines.append(f"taptapgo_http_request_duration_seconds_sum{{{labels}}} {m['sum']:.6f}")
+            lines.append(f"taptapgo_http_request_duration_seconds_count{{{labels}}} {m['count']}")
+        lines += _render_loop_lag(snapshots)
+        lines += [
+            "# HELP taptapgo_workers Worker processes included in this scrape.",
+            "# TYPE taptapgo_workers gauge",
+            f"taptapgo_workers {len(snapshots)}",
+        ]
+        return "\n".join(lines) + "\n"
+
+
+def _render_loop_lag(snapshots: List[Dict[str, Any]]) -> List[str]:
+    """Lag de la boucle asyncio: histogramme additionné, max et blocages par worker."""
+    workers = [(snap.get("pid"), snap["loop_lag"]) for snap in snapshots if snap.get("loop_lag")]
+    if not workers:
+        return []
+    bounds = workers[0][1]["bounds"]
+    buckets = [0] * (len(bounds) + 1)
+    total, count = 0.0, 0
+    for _, lag in workers:
+        buckets = [a + b for a, b in zip(buckets, lag["buckets"])]
+        total += lag["sum"]
+        count += lag["count"]
+    lines = [
+        "# HELP taptapgo_event_loop_lag_seconds Delay of the event loop waking a periodic task.",
+        "# TYPE taptapgo_event_loop_lag_seconds histogram",
+    ]
+    cumulative = 0
+    for bound, n in zip(bounds, buckets):
+        cumulative += n
+        lines.append(f'taptapgo_event_loop_lag_seconds_bucket{{le="{bound}"}} {cumulative}')
+    lines.append(f'taptapgo_event_loop_lag_seconds_bucket{{le="+Inf"}} {count}')
+    lines.append(f"taptapgo_event_loop_lag_seconds_sum {total:.6f}")
+    lines.append(f"taptapgo_event_loop_lag_seconds_count {count}")
+    lines += [
+        "# HELP taptapgo_event_loop_lag_max_seconds Worst event loop lag since the worker started.",
+        "# TYPE taptapgo_event_loop_lag_max_seconds gauge",
+    ]
+    lines += [f'taptapgo_event_loop_lag_max_seconds{{pid="{pid}"}} {lag["max"]:.6f}' for pid, lag in workers]
+    lines += [
+        "# HELP taptapgo_event_loop_blocked_total Event loop stalls above the blocking threshold.",
+        "# TYPE taptapgo_event_loop_blocked_total counter",
+    ]
+    lines += [f'taptapgo_event_loop_blocked_total{{pid="{pid}"}} {lag["blocked"]}' for pid, lag in workers]
+    return lines
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(method: str, route: str) -> str:
+    return f'method="{_escape(method)}",route="{_escape(route)}"'
+
+
+def _route_label(scope: Dict[str, Any]) -> str:
+    """Chemin déclaré de la route (/api/rides/{ride_id}), renseigné par le routeur Starlette."""
+    route = scope.get("route")
+    path = getattr(route, "path", None)
+    if path:
+        return path
+    endpoint = scope.get("endpoint")
+    if endpoint is not None:
+        return getattr(endpoint, "__name__", UNMATCHED_ROUTE)
+    return UNMATCHED_ROUTE
+
+
+class MetricsMiddleware:
+    """Middleware ASGI: compte et chronomètre chaque requête HTTP par route."""
+
+    def __init__(self, app: Callable, registry: MetricsRegistry, exclude_paths: Tuple[str, ...] = ("/metrics",)):
+        self.app = app
+        self.registry = registry
+        self.exclude_paths = exclude_paths
+
+    async def __call__(self, scope: Dict[str, Any], receive: Callable, send: Callable) -> None:
+        if scope["type"] != "http" or scope["path"] in self.exclude_paths:
+            await self.app(scope, receive, send)
+            return
+        method = scope["method"]
+        status_holder = [500]
+
+        async def send_wrapper(message: Dict[str, Any]) -> None:
+            if message["type"] == "http.response.start":
+                status_holder[0] = message["status"]
+            await send(message)
+
+        self.registry.start()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            self.registry.finish(method, _route_label(scope), status_holder[0], time.perf_counter() - started)
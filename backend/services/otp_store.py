@@ -0,0 +1,243 @@
+import asyncio
+import hashlib
+import hmac
+import os
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional, Set
+import logging
+
+from services.redis_client import get_async_redis, redis_available
+
+logger = logging.getLogger(__name__)
+
+# Durée de validité d'un code (secondes)
+OTP_TTL_SECONDS = int(os.getenv("TAPTAPGO_OTP_TTL_SECONDS", "600"))
+# Essais faux avant blocage du code (il faut en redemander un)
+OTP_MAX_ATTEMPTS = int(os.getenv("TAPTAPGO_OTP_MAX_ATTEMPTS", "5"))
+# Copie des codes dans la table otp_codes (audit), écrite hors requête. 0 = désactivé
+OTP_AUDIT_ENABLED = os.getenv("TAPTAPGO_OTP_AUDIT", "1") != "0"
+# Intervalle de purge des lignes expirées de otp_codes (secondes)
+OTP_PURGE_SECONDS = int(os.getenv("TAPTAPGO_OTP_PURGE_SECONDS", "3600"))
+# Nombre max de codes en mémoire avant purge des expirés
+OTP_MAX_ENTRIES = 100_000
+
+# Résultats de verify()
+OTP_OK = "ok"
+OTP_INVALID = "invalid"
+OTP_MISSING = "missing"  # pas de code actif (jamais envoyé, expiré ou déjà utilisé)
+OTP_LOCKED = "locked"
+
+
+@dataclass(frozen=True)
+class OTPRecord:
+    id: str
+    phone: str
+    code: str
+    expires_at: datetime
+
+
+def _digest(code: str) -> str:
+    """Le code n'est gardé que sous forme de hash."""
+    return hashlib.sha256(code.encode()).hexdigest()
+
+
+def _new_record(phone: str, code: str, ttl: int) -> OTPRecord:
+    return OTPRecord(str(uuid.uuid4()), phone, code, datetime.utcnow() + timedelta(seconds=ttl))
+
+
+class MemoryOTPStore:
+    """Un code actif par téléphone, en mémoire du process, expiré après ttl.
+
+    Usage unique: un code vérifié est supprimé. Après max_attempts essais faux,
+    le code est bloqué jusqu'à son expiration ou l'envoi d'un nouveau code.
+    """
+
+    def __init__(self, max_attempts: int = OTP_MAX_ATTEMPTS, max_entries: int = OTP_MAX_ENTRIES):
+        self.max_attempts = max_attempts
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._codes: Dict[str, Dict[str, Any]] = {}  # phone -> {id, digest, expires, attempts}
+        self.issued = 0
+        self.verified = 0
+        self.failed = 0
+        self.locked = 0
+
+    async def issue(self, phone: str, code: str, ttl: int = OTP_TTL_SECONDS) -> OTPRecord:
+        record = _new_record(phone, code, ttl)
+        with self._lock:
+            self._codes[phone] = {
+                "id": record.id,
+                "digest": _digest(code),
+                "expires": time.time() + ttl,
+                "attempts": 0,
+            }
+            self.issued += 1
+            if len(self._codes) > self.max_entries:
+                self._purge_locked(time.time())
+        return record
+
+    async def verify(self, phone: str, code: str) -> Dict[str, Any]:
+        """{"status": OTP_*, "id": id du code si trouvé}."""
+        now = time.time()
+        with self._lock:
+            entry = self._codes.get(phone)
+            if entry is None or entry["expires"] <= now:
+                self._codes.pop(phone, None)
+                return {"status": OTP_MISSING, "id": None}
+            if entry["attempts"] >= self.max_attempts:
+                self.locked += 1
+                return {"status": OTP_LOCKED, "id": entry["id"]}
+            if hmac.compare_digest(entry["digest"], _digest(code)):
+                del self._codes[phone]
+                self.verified += 1
+                return {"status": OTP_OK, "id": entry["id"]}
+            entry["attempts"] += 1
+            self.failed += 1
+            return {"status": OTP_INVALID, "id": entry["id"]}
+
+    def _purge_locked(self, now: float) -> None:
+        for phone in [p for p, e in self._codes.items() if e["expires"] <= now]:
+            del self._codes[phone]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "backend": "memory",
+                "active": len(self._codes),
+                "issued": self.issued,
+                "verified": self.verified,
+                "failed": self.failed,
+                "locked": self.locked,
+            }
+
+
+class RedisOTPStore:
+    """Même contrat dans Redis (TTL natif), partagé entre workers."""
+
+    def __init__(self, client: Any, max_attempts: int = OTP_MAX_ATTEMPTS, prefix: str = "taptapgo:otp:"):
+        self._redis = client
+        self.max_attempts = max_attempts
+        self._prefix = prefix
+
+    async def issue(self, phone: str, code: str, ttl: int = OTP_TTL_SECONDS) -> OTPRecord:
+        record = _new_record(phone, code, ttl)
+        key = self._prefix + phone
+        pipe = self._redis.pipeline()
+        pipe.delete(key)
+        pipe.hset(key, mapping={"id": record.id, "digest": _digest(code), "attempts": 0})
+        pipe.expire(key, ttl)
+        await pipe.execute()
+        return record
+
+    async def verify(self, phone: str, code: str) -> Dict[str, Any]:
+        key = self._prefix + phone
+        entry = await self._redis.hgetall(key)
+        if not entry:
+            return {"status": OTP_MISSING, "id": None}
+        if int(entry.get("attempts") or 0) >= self.max_attempts:
+            return {"status": OTP_LOCKED, "id": entry.get("id")}
+        if hmac.compare_digest(entry.get("digest") or "", _digest(code)):
+            # DEL renvoie 0 si un autre worker a consommé le code entre-temps
+            if await self._redis.delete(key):
+                return {"status": OTP_OK, "id": entry.get("id")}
+            return {"status": OTP_MISSING, "id": None}
+        await self._redis.hincrby(key, "attempts", 1)
+        return {"status": OTP_INVALID, "id": entry.get("id")}
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": "redis"}
+
+
+def create_otp_store():
+    if redis_available():
+        client = get_async_redis()
+        if client is not None:
+            logger.info("OTP: backend Redis")
+            return RedisOTPStore(client)
+    return MemoryOTPStore()
+
+
+class OTPAuditSink:
+    """Écrit les codes émis / utilisés dans otp_codes sans bloquer la requête, et purge les expirés.
+
+    La table n'est plus lue pour vérifier un code: elle sert d'historique.
+    """
+
+    def __init__(self, supabase_client: Any, enabled: bool = OTP_AUDIT_ENABLED):
+        self.supabase = supabase_client
+        self.enabled = enabled
+        self._tasks: Set[asyncio.Task] = set()
+        self.errors = 0
+        self.purged = 0
+
+    def _spawn(self, fn, *args) -> None:
+        if not self.enabled:
+            return
+        task = asyncio.get_running_loop().create_task(self._run(fn, *args))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, fn, *args) -> None:
+        try:
+            await asyncio.to_thread(fn, *args)
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Could not write OTP audit row: {e}")
+
+    def issued(self, record: OTPRecord) -> None:
+        self._spawn(self._insert, record)
+
+    def used(self, otp_id: Optional[str]) -> None:
+        if otp_id:
+            self._spawn(self._mark_used, otp_id)
+
+    def _insert(self, record: OTPRecord) -> None:
+        self.supabase.table("otp_codes").insert({
+            "id": record.id,
+            "phone": record.phone,
+            "code": record.code,
+            "expires_at": record.expires_at.isoformat(),
+            "is_used": False,
+        }).execute()
+
+    def _mark_used(self, otp_id: str) -> None:
+        self.supabase.table("otp_codes").update({"is_used": True}).eq("id", otp_id).execute()
+
+    def purge_expired(self) -> int:
+        """Supprime les lignes expirées (synchrone, à lancer dans un thread)."""
+        result = (
+            self.supabase.table("otp_codes")
+            .delete()
+            .lt("expires_at", datetime.utcnow().isoformat())
+            .execute()
+        )
+        count = len(result.data or [])
+        self.purged += count
+        return count
+
+    async def purge_loop(self, interval: int = OTP_PURGE_SECONDS) -> None:
+        while True:
+            try:
+                count = await asyncio.to_thread(self.purge_expired)
+                if count:
+                    logger.info(f"Purged {count} expired OTP codes")
+            except Exception as e:
+                logger.warning(f"OTP purge error: {e}")
+            await asyncio.sleep(interval)
+
+    async def drain(self) -> None:
+        """Attend les écritures en cours (arrêt du serveur)."""
+        if self._tasks:
+            await asyncio.gather(*list(self._tasks), return_exceptions=True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "audit_enabled": self.enabled,
+            "audit_pending": len(self._tasks),
+            "audit_errors": self.errors,
+            "purged": self.purged,
+        }
@@ -0,0 +1,124 @@
+import asyncio
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, Optional
+import logging
+
+import bcrypt
+
+from services.tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+
+def _default_workers() -> int:
+    return max(1, min(4, os.cpu_count() or 1))
+
+
+# Nombre de process bcrypt (0 = thread pool, utile si les process sont indisponibles)
+BCRYPT_WORKERS = int(os.getenv("TAPTAPGO_BCRYPT_WORKERS", str(_default_workers())))
+# Appels acceptés en même temps (en cours + en file); au-delà on attend un slot
+BCRYPT_MAX_PENDING = int(os.getenv("TAPTAPGO_BCRYPT_MAX_PENDING", str(max(1, BCRYPT_WORKERS) * 8)))
+# Attente max d'un slot avant de répondre 503 (backpressure)
+BCRYPT_QUEUE_TIMEOUT = float(os.getenv("TAPTAPGO_BCRYPT_QUEUE_TIMEOUT", "5"))
+
+
+class PasswordHasherBusy(Exception):
+    """File bcrypt saturée: l'appelant doit répondre 503 + Retry-After."""
+    pass
+
+
+def _hash(password: str) -> str:
+    return bcrypt.hashpw(password.encode(), bcrypt.gensalt()).decode()
+
+
+def _verify(password: str, hashed: str) -> bool:
+    return bcrypt.checkpw(password.encode(), hashed.encode())
+
+
+class PasswordHasher:
+    """bcrypt hors de la boucle asyncio, dans un ProcessPoolExecutor borné.
+
+    Le pool est créé au premier appel (donc dans le worker qui l'utilise, après un
+    éventuel fork). Au plus max_pending appels sont admis; les suivants attendent
+    un slot jusqu'à queue_timeout puis lèvent PasswordHasherBusy.
+    """
+
+    def __init__(
+        self,
+        workers: int = BCRYPT_WORKERS,
+        max_pending: int = BCRYPT_MAX_PENDING,
+        queue_timeout: float = BCRYPT_QUEUE_TIMEOUT,
+    ):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.queue_timeout = queue_timeout
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._executor_lock = threading.Lock()
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._in_flight = 0
+        self._waiting = 0
+        self._completed = 0
+        self._rejected = 0
+
+    def _get_executor(self) -> Optional[ProcessPoolExecutor]:
+        if self.workers <= 0:
+            return None
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    self._executor = ProcessPoolExecutor(max_workers=self.workers)
+                    logger.info(f"bcrypt process pool: {self.workers} workers")
+        return self._executor
+
+    async def _run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_pending)
+        self._waiting += 1
+        try:
+            await asyncio.wait_for(self._slots.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            self._rejected += 1
+            raise PasswordHasherBusy("bcrypt queue full")
+        finally:
+            self._waiting -= 1
+        self._in_flight += 1
+        try:
+            executor = self._get_executor()
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(executor, fn, *args)
+        finally:
+            self._in_flight -= 1
+            self._completed += 1
+            self._slots.release()
+
+    def reset_after_fork(self) -> None:
+        """Dans un worker forké: le pool et la file du master ne sont pas utilisables ici."""
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        self._slots = None
+        self._in_flight = self._waiting = self._completed = self._rejected = 0
+
+    async def hash(self, password: str) -> str:
+        with tracer.span("bcrypt.hash"):
+            return await self._run(_hash, password)
+
+    async def verify(self, password: str, hashed: str) -> bool:
+        with tracer.span("bcrypt.verify"):
+            return await self._run(_verify, password, hashed)
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "max_pending": self.max_pending,
+            "in_flight": self._in_flight,
+            "waiting": self._waiting,
+            "completed": self._completed,
+            "rejected": self._rejected,
+        }
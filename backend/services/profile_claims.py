@@ -0,0 +1,110 @@
+import math
+import os
+import threading
+import time
+from typing import Any, Dict, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Au-delà de cet âge (secondes), le claim "profile" n'est plus utilisé et le token est rafraîchi
+PROFILE_CLAIMS_MAX_AGE = int(os.getenv("TAPTAPGO_PROFILE_CLAIMS_MAX_AGE", "3600"))
+
+# Attributs stables copiés dans le token, par type d'utilisateur
+PROFILE_FIELDS = {
+    "passenger": ("admin_id", "city", "full_name", "phone"),
+    "driver": ("admin_id", "vehicle_type", "city"),
+    "admin": ("cities", "brand_name"),
+    "subadmin": ("admin_id", "cities", "brand_name"),
+}
+
+
+def build_profile(user_type: str, row: Dict[str, Any], admin_row: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+    """Claim "profile" à partir de la ligne utilisateur (et de l'admin pour un sous-admin)."""
+    fields = PROFILE_FIELDS.get(user_type)
+    if not fields:
+        return None
+    source = dict(row or {})
+    if user_type == "subadmin":
+        source["cities"] = (admin_row or {}).get("cities")
+        source["brand_name"] = (admin_row or {}).get("brand_name")
+    profile = {k: source.get(k) for k in fields}
+    if "cities" in profile:
+        profile["cities"] = profile["cities"] or []
+    return profile
+
+
+class ProfileVersions:
+    """Dates de dernière modification des profils et des scopes admin.
+
+    Le token porte pv = date (epoch, en secondes) à laquelle son claim "profile" a été lu. Un
+    profil modifié après pv (utilisateur, ou admin pour les scopes cities/brand_name)
+    rend le claim périmé: le serveur l'ignore et relit la base. En mémoire par worker,
+    tenu à jour entre workers par le bus d'invalidation (la date de la modification voyage
+    avec l'événement). Un process qui démarre (ou un worker forké) ne connaît pas les
+    modifications passées: les claims antérieurs à son démarrage sont relus une fois.
+    """
+
+    def __init__(self, max_age: int = PROFILE_CLAIMS_MAX_AGE):
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._users: Dict[str, float] = {}
+        self._admins: Dict[str, float] = {}
+        # Tous les claims antérieurs sont périmés: démarrage du process, événements du bus perdus
+        self._floor = self.now()
+        self.stale = 0
+
+    def reset_after_fork(self) -> None:
+        """Worker forké (ou relancé): les modifications faites avant son démarrage lui sont inconnues."""
+        self._lock = threading.Lock()
+        self._floor = self.now()
+
+    @staticmethod
+    def now() -> float:
+        """Valeur du claim pv, à prendre AVANT de lire la ligne en base (précision ms)."""
+        return math.floor(time.time() * 1000) / 1000
+
+    def bump_user(self, user_id: Optional[str], at: Optional[float] = None) -> None:
+        if user_id:
+            with self._lock:
+                self._users[user_id] = max(self._users.get(user_id, 0), at or self.now())
+
+    def bump_admin(self, admin_id: Optional[str], at: Optional[float] = None) -> None:
+        """Scope admin modifié (villes, marque, suppression): admin, sous-admins, chauffeurs."""
+        if admin_id:
+            with self._lock:
+                self._admins[admin_id] = max(self._admins.get(admin_id, 0), at or self.now())
+
+    def bump_all(self, at: Optional[float] = None) -> None:
+        with self._lock:
+            self._floor = max(self._floor, at or self.now())
+
+    def is_current(self, claims: Dict[str, Any]) -> bool:
+        profile = claims.get("profile")
+        pv = claims.get("pv")
+        if not isinstance(profile, dict) or pv is None:
+            return False
+        pv = float(pv)
+        if time.time() - pv > self.max_age:
+            return False
+        user_id = claims.get("user_id")
+        admin_id = user_id if claims.get("user_type") == "admin" else profile.get("admin_id")
+        with self._lock:
+            changed = max(self._floor, self._users.get(user_id or "", 0), self._admins.get(admin_id or "", 0))
+        if pv < changed:
+            return self._mark_stale()
+        return True
+
+    def _mark_stale(self) -> bool:
+        self.stale += 1
+        return False
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "users_changed": len(self._users),
+                "admins_changed": len(self._admins),
+                "stale_claims": self.stale,
+                "max_age": self.max_age,
+                "floor": self._floor,
+            }
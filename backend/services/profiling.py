@@ -0,0 +1,267 @@
+import asyncio
+import fnmatch
+import os
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Dossier des profils (un fichier .collapsed par requête profilée)
+PROFILE_DIR = (os.getenv("TAPTAPGO_PROFILE_DIR") or os.path.join(tempfile.gettempdir(), "taptapgo-profiles")).strip()
+# Mode échantillonné: 1 requête sur N des routes PROFILE_ROUTES est profilée (0 = désactivé)
+PROFILE_SAMPLE_RATE = int(os.getenv("TAPTAPGO_PROFILE_SAMPLE_RATE", "0"))
+# Chemins concernés par le mode échantillonné, motifs fnmatch séparés par des virgules (ex. /api/rides*)
+PROFILE_ROUTES = tuple(p.strip() for p in (os.getenv("TAPTAPGO_PROFILE_ROUTES") or "").split(",") if p.strip())
+# Intervalle entre deux échantillons de pile (ms)
+PROFILE_INTERVAL_MS = float(os.getenv("TAPTAPGO_PROFILE_INTERVAL_MS", "5"))
+# Nombre max de fichiers gardés dans PROFILE_DIR (les plus anciens sont supprimés)
+PROFILE_KEEP = int(os.getenv("TAPTAPGO_PROFILE_KEEP", "200"))
+# Profils simultanés max par worker (chaque profil = un thread d'échantillonnage)
+PROFILE_MAX_ACTIVE = 2
+
+PROFILE_HEADER = "x-profile"
+PROFILE_QUERY_FLAG = "__profile"
+PROFILE_SUFFIX = ".collapsed"
+
+# Feuilles de pile où la boucle asyncio attend des événements: pas du travail
+_IDLE_FRAMES = {("selectors.py", "select"), ("base_events.py", "_run_once")}
+_UNSAFE_NAME = re.compile(r"[^A-Za-z0-9_.-]+")
+
+
+def _frame_label(code: Any) -> str:
+    filename = code.co_filename
+    parts = filename.replace("\\", "/").rsplit("/", 2)
+    short = "/".join(parts[-2:]) if len(parts) > 1 else filename
+    # ";" sépare les frames dans le format collapsed
+    return f"{code.co_name} ({short}:{code.co_firstlineno})".replace(";", ":")
+
+
+class StackSampler:
+    """Échantillonne la pile Python d'un thread (la boucle asyncio du worker) dans un thread à part.
+
+    Les handlers tournent sur la boucle et appellent Supabase en synchrone: la pile de ce
+    thread montre donc où part le temps de la requête. Les autres requêtes servies en même
+    temps par la boucle apparaissent aussi dans le profil.
+    """
+
+    def __init__(self, thread_id: int, interval: float):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.idle = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="taptapgo-profiler", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            self.samples += 1
+            leaf = frame.f_code
+            if (os.path.basename(leaf.co_filename), leaf.co_name) in _IDLE_FRAMES:
+                self.idle += 1
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(_frame_label(frame.f_code))
+                frame = frame.f_back
+            stack.reverse()
+            self.stacks[";".join(stack)] += 1
+
+    def collapsed(self) -> str:
+        """Format "frame;frame;frame count" (flamegraph.pl, speedscope, inferno)."""
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+class RequestProfiler:
+    """Profils de requêtes à la demande (superadmin) ou échantillonnés (1 sur N), écrits sur disque."""
+
+    def __init__(
+        self,
+        profile_dir: str = PROFILE_DIR,
+        sample_rate: int = PROFILE_SAMPLE_RATE,
+        routes: Tuple[str, ...] = PROFILE_ROUTES,
+        interval_ms: float = PROFILE_INTERVAL_MS,
+        keep: int = PROFILE_KEEP,
+        max_active: int = PROFILE_MAX_ACTIVE,
+    ):
+        self.profile_dir = profile_dir
+        self.sample_rate = sample_rate
+        self.routes = routes
+        self.interval = interval_ms / 1000
+        self.keep = keep
+        self.max_active = max_active
+        self.active = 0
+        self.written = 0
+        self.skipped = 0
+        self.last: Optional[Dict[str, Any]] = None
+
+    def should_sample(self, path: str) -> bool:
+        if self.sample_rate <= 0 or not any(fnmatch.fnmatch(path, pattern) for pattern in self.routes):
+            return False
+        return random.randrange(self.sample_rate) == 0
+
+    def start(self) -> Optional[StackSampler]:
+        if self.active >= self.max_active:
+            self.skipped += 1
+            return None
+        self.active += 1
+        sampler = StackSampler(threading.get_ident(), self.interval)
+        sampler.start()
+        return sampler
+
+    def finish(self, sampler: StackSampler, method: str, path: str, status: int, duration: float, mode: str) -> str:
+        """Arrête l'échantillonnage. Renvoie le nom du fichier (écrit ensuite par write())."""
+        sampler.stop()
+        self.active -= 1
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S")
+        slug = _UNSAFE_NAME.sub("_", path.strip("/"))[:80] or "root"
+        name = f"{stamp}_{int(duration * 1000)}ms_{method}_{slug}_{os.getpid()}_{random.randrange(16 ** 6):06x}{PROFILE_SUFFIX}"
+        self.last = {
+            "name": name,
+            "mode": mode,
+            "method": method,
+            "path": path,
+            "status": status,
+            "duration_ms": round(duration * 1000, 1),
+            "samples": sampler.samples,
+            "idle_samples": sampler.idle,
+        }
+        return name
+
+    def write(self, name: str, sampler: StackSampler) -> None:
+        """Écriture disque (appelée hors boucle) puis rotation des vieux fichiers."""
+        os.makedirs(self.profile_dir, exist_ok=True)
+        path = os.path.join(self.profile_dir, name)
+        tmp = f"{path}.tmp"
+        with open(tmp, "w") as f:
+            f.write(sampler.collapsed())
+        os.replace(tmp, path)
+        self.written += 1
+        self._rotate()
+
+    def _rotate(self) -> None:
+        profiles = self.list_profiles()
+        for entry in profiles[self.keep:]:
+            try:
+                os.remove(os.path.join(self.profile_dir, entry["name"]))
+            except OSError:
+                pass
+
+    def list_profiles(self) -> List[Dict[str, Any]]:
+        """Profils de PROFILE_DIR (tous les workers qui partagent le dossier), plus récents d'abord."""
+        if not os.path.isdir(self.profile_dir):
+            return []
+        entries = []
+        for name in os.listdir(self.profile_dir):
+            if not name.endswith(PROFILE_SUFFIX):
+                continue
+            try:
+                st = os.stat(os.path.join(self.profile_dir, name))
+            except OSError:
+                continue
+            entries.append({"name": name, "size": st.st_size, "created_at": st.st_mtime})
+        entries.sort(key=lambda e: e["created_at"], reverse=True)
+        return entries
+
+    def profile_path(self, name: str) -> Optional[str]:
+        """Chemin d'un profil par son nom (sans sortir de PROFILE_DIR)."""
+        if os.path.basename(name) != name or not name.endswith(PROFILE_SUFFIX):
+            return None
+        path = os.path.join(self.profile_dir, name)
+        return path if os.path.isfile(path) else None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "profile_dir": self.profile_dir,
+            "sample_rate": self.sample_rate,
+            "routes": list(self.routes),
+            "active": self.active,
+            "written": self.written,
+            "skipped_busy": self.skipped,
+            "last": self.last,
+        }
+
+
+def _profile_requested(scope: Dict[str, Any]) -> Optional[str]:
+    """Token Bearer de la requête si elle demande un profil (X-Profile: 1 ou ?__profile=1)."""
+    headers = dict(scope.get("headers") or [])
+    flag = headers.get(PROFILE_HEADER.encode(), b"").decode("latin-1").strip().lower()
+    if flag not in ("1", "true"):
+        query = scope.get("query_string", b"").decode("latin-1")
+        if f"{PROFILE_QUERY_FLAG}=1" not in query.split("&"):
+            return None
+    auth = headers.get(b"authorization", b"").decode("latin-1")
+    if not auth.lower().startswith("bearer "):
+        return None
+    return auth[7:].strip()
+
+
+class ProfilingMiddleware:
+    """Middleware ASGI: profile la requête si un superadmin le demande ou si elle est tirée
+    au sort, puis ajoute X-Profile-Id (nom du fichier dans PROFILE_DIR) à la réponse."""
+
+    def __init__(self, app: Callable, profiler: RequestProfiler, authorize: Callable[[str], bool]):
+        self.app = app
+        self.profiler = profiler
+        # authorize(token) -> True si le token est celui d'un superadmin
+        self.authorize = authorize
+
+    async def __call__(self, scope: Dict[str, Any], receive: Callable, send: Callable) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        mode = None
+        token = _profile_requested(scope)
+        if token and self.authorize(token):
+            mode = "on_demand"
+        elif self.profiler.should_sample(scope["path"]):
+            mode = "sampled"
+        sampler = self.profiler.start() if mode else None
+        if sampler is None:
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status_holder = [500]
+        name_holder: List[str] = []
+
+        async def send_wrapper(message: Dict[str, Any]) -> None:
+            if message["type"] == "http.response.start":
+                status_holder[0] = message["status"]
+                # Le profil couvre le handler jusqu'aux en-têtes (le streaming n'est pas inclus)
+                name = self.profiler.finish(
+                    sampler, scope["method"], scope["path"], message["status"], time.perf_counter() - started, mode
+                )
+                name_holder.append(name)
+                message["headers"] = list(message.get("headers", [])) + [(b"x-profile-id", name.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            if not name_holder:
+                name_holder.append(self.profiler.finish(
+                    sampler, scope["method"], scope["path"], status_holder[0], time.perf_counter() - started, mode
+                ))
+            try:
+                await asyncio.to_thread(self.profiler.write, name_holder[0], sampler)
+            except Exception as e:
+                logger.warning(f"Profile write error: {e}")
@@ -0,0 +1,278 @@
+import json
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+import logging
+
+from services.redis_client import get_async_redis, redis_available
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMIT_ENABLED = os.getenv("TAPTAPGO_RATE_LIMIT_ENABLED", "1") != "0"
+# Nombre de reverse proxies de confiance devant l'API (0 = IP de la connexion). L'IP cliente
+# est l'entrée de X-Forwarded-For ajoutée par le proxy le plus proche de l'internet: la
+# N-ième en partant de la droite. Les entrées à gauche viennent du client et ne comptent pas.
+RATE_LIMIT_TRUST_PROXY = int(os.getenv("TAPTAPGO_TRUST_PROXY", "0") or 0)
+# Taille max du corps lu pour extraire l'identifiant (téléphone, email): au-delà, le reste
+# est transmis à l'application sans être gardé en mémoire
+RATE_LIMIT_MAX_BODY = 64 * 1024
+# Nombre max de clés en mémoire: au-delà, les moins récemment utilisées sont oubliées
+RATE_LIMIT_MAX_KEYS = 100_000
+
+Limit = Tuple[int, float]  # (requêtes, fenêtre en secondes)
+
+
+@dataclass(frozen=True)
+class RateLimitRule:
+    """Limite d'un endpoint: par IP et, si identifier_fields, par identifiant du corps JSON."""
+    name: str
+    path: str
+    per_ip: Limit
+    per_identifier: Optional[Limit] = None
+    identifier_fields: Tuple[str, ...] = ()
+    method: str = "POST"
+
+
+def _sliding_estimate(previous: int, current: int, elapsed: float, window: float) -> float:
+    return previous * (1 - elapsed / window) + current
+
+
+def _retry_after(previous: int, current: int, elapsed: float, window: float, limit: int) -> int:
+    """Secondes avant que l'estimation repasse sous la limite."""
+    if previous > 0 and current < limit:
+        wait = window * (1 - (limit - current - 1) / previous) - elapsed
+    else:
+        wait = window - elapsed + (window if current >= limit else 0)
+    return max(1, int(math.ceil(wait)))
+
+
+class MemoryRateLimitBackend:
+    """Compteur à fenêtre glissante (fenêtre courante + précédente pondérée), par process.
+
+    Les clés sont gardées dans l'ordre d'utilisation (LRU): une avalanche d'identifiants
+    distincts ne fait oublier que les compteurs inactifs, jamais ceux qui bloquent.
+    """
+
+    def __init__(self, max_keys: int = RATE_LIMIT_MAX_KEYS):
+        self.max_keys = max_keys
+        self._lock = threading.Lock()
+        # key -> (n° fenêtre, courant, précédent, fenêtre), du moins au plus récemment utilisé
+        self._buckets: "OrderedDict[str, Tuple[int, int, int, float]]" = OrderedDict()
+        self.evicted = 0
+
+    async def hit(self, key: str, limit: int, window: float) -> Tuple[bool, int]:
+        now = time.time()
+        slot = int(now // window)
+        elapsed = now - slot * window
+        with self._lock:
+            bucket_slot, current, previous, _ = self._buckets.get(key, (slot, 0, 0, window))
+            if bucket_slot != slot:
+                previous = current if bucket_slot == slot - 1 else 0
+                current = 0
+            if _sliding_estimate(previous, current, elapsed, window) + 1 > limit:
+                self._buckets[key] = (slot, current, previous, window)
+                self._buckets.move_to_end(key)
+                return False, _retry_after(previous, current, elapsed, window, limit)
+            self._buckets[key] = (slot, current + 1, previous, window)
+            self._buckets.move_to_end(key)
+            if len(self._buckets) > self.max_keys:
+                self._purge_locked(now)
+        return True, 0
+
+    def _purge_locked(self, now: float) -> None:
+        # Les plus anciennes d'abord: expirées (plus de deux fenêtres), puis les moins récentes
+        while self._buckets:
+            key, (slot, _, _, window) = next(iter(self._buckets.items()))
+            if slot >= int(now // window) - 1 and len(self._buckets) <= self.max_keys:
+                break
+            self._buckets.popitem(last=False)
+            self.evicted += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": "memory", "keys": len(self._buckets), "evicted": self.evicted}
+
+
+class RedisRateLimitBackend:
+    """Même algorithme dans Redis, partagé entre workers et machines."""
+
+    def __init__(self, client: Any, prefix: str = "taptapgo:rl:"):
+        self._redis = client
+        self._prefix = prefix
+
+    async def hit(self, key: str, limit: int, window: float) -> Tuple[bool, int]:
+        now = time.time()
+        slot = int(now // window)
+        elapsed = now - slot * window
+        cur_key = f"{self._prefix}{key}:{slot}"
+        prev_key = f"{self._prefix}{key}:{slot - 1}"
+        pipe = self._redis.pipeline()
+        pipe.get(prev_key)
+        pipe.incr(cur_key)
+        pipe.expire(cur_key, int(window * 2) + 1)
+        previous, current, _ = await pipe.execute()
+        previous = int(previous or 0)
+        current = int(current)
+        if _sliding_estimate(previous, current - 1, elapsed, window) + 1 > limit:
+            await self._redis.decr(cur_key)
+            return False, _retry_after(previous, current - 1, elapsed, window, limit)
+        return True, 0
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": "redis"}
+
+
+def create_rate_limit_backend():
+    if redis_available():
+        client = get_async_redis()
+        if client is not None:
+            logger.info("Rate limiting: backend Redis")
+            return RedisRateLimitBackend(client)
+    return MemoryRateLimitBackend()
+
+
+def _client_ip(scope: Dict[str, Any], trust_proxy: int) -> str:
+    if trust_proxy > 0:
+        hops: List[str] = []
+        for name, value in scope.get("headers") or []:
+            if name == b"x-forwarded-for":
+                hops.extend(h.strip() for h in value.decode("latin-1").split(",") if h.strip())
+        if len(hops) >= trust_proxy:
+            return hops[-trust_proxy]
+    client = scope.get("client")
+    return client[0] if client else "unknown"
+
+
+async def _buffer_body(
+    receive: Callable[[], Awaitable[dict]], max_size: int = RATE_LIMIT_MAX_BODY
+) -> Tuple[Optional[bytes], Callable[[], Awaitable[dict]]]:
+    """Lit le corps de la requête (au plus max_size octets) et renvoie un receive qui rejoue
+    à l'application les messages lus, puis la suite. Corps plus grand: None."""
+    replay: List[dict] = []
+    size = 0
+    complete = False
+    while size <= max_size:
+        message = await receive()
+        replay.append(message)
+        if message["type"] != "http.request":
+            # Déconnexion avant la fin du corps: l'application la verra aussi
+            break
+        size += len(message.get("body", b""))
+        if not message.get("more_body", False):
+            complete = size <= max_size
+            break
+    body = b"".join(m.get("body", b"") for m in replay if m["type"] == "http.request") if complete else None
+
+    async def replay_receive() -> dict:
+        if replay:
+            return replay.pop(0)
+        return await receive()
+
+    return body, replay_receive
+
+
+def _extract_identifier(body: bytes, fields: Tuple[str, ...]) -> Optional[str]:
+    if not body or len(body) > RATE_LIMIT_MAX_BODY:
+        return None
+    try:
+        data = json.loads(body)
+    except (ValueError, UnicodeDecodeError):
+        return None
+    if not isinstance(data, dict):
+        return None
+    for field in fields:
+        value = data.get(field)
+        if isinstance(value, str) and value.strip():
+            return value.strip().lower()
+    return None
+
+
+class RateLimiter:
+    """Règles + backend + statistiques; partagé par le middleware et l'endpoint de stats."""
+
+    def __init__(
+        self,
+        rules: List[RateLimitRule],
+        backend: Any = None,
+        enabled: bool = RATE_LIMIT_ENABLED,
+        trust_proxy: int = RATE_LIMIT_TRUST_PROXY,
+    ):
+        self.rules = {(r.method, r.path): r for r in rules}
+        self.backend = backend or create_rate_limit_backend()
+        self.enabled = enabled
+        self.trust_proxy = trust_proxy
+        self.rejected: Dict[str, int] = {}
+        self._backend_errors = 0
+
+    async def check(self, scope: Dict[str, Any], receive: Callable) -> Tuple[int, Callable]:
+        """Retourne (retry_after, receive). retry_after > 0: requête refusée."""
+        rule = self.rules.get((scope["method"], scope["path"])) if self.enabled else None
+        if rule is None:
+            return 0, receive
+        # Par IP d'abord: une IP déjà bloquée ne fait pas lire son corps
+        retry_after = await self._hit(rule, f"{rule.name}:ip:{_client_ip(scope, self.trust_proxy)}", rule.per_ip)
+        if retry_after or not (rule.per_identifier and rule.identifier_fields):
+            return retry_after, receive
+        body, receive = await _buffer_body(receive)
+        identifier = _extract_identifier(body, rule.identifier_fields)
+        if identifier:
+            retry_after = await self._hit(rule, f"{rule.name}:id:{identifier}", rule.per_identifier)
+        return retry_after, receive
+
+    async def _hit(self, rule: RateLimitRule, key: str, limit_window: Limit) -> int:
+        limit, window = limit_window
+        try:
+            allowed, retry_after = await self.backend.hit(key, limit, window)
+        except Exception as e:
+            # Backend partagé indisponible: on laisse passer plutôt que de bloquer le login
+            self._backend_errors += 1
+            if self._backend_errors % 100 == 1:
+                logger.warning(f"Rate limit backend error: {e}")
+            return 0
+        if not allowed:
+            self.rejected[rule.name] = self.rejected.get(rule.name, 0) + 1
+            return retry_after
+        return 0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self.backend.stats(),
+            "enabled": self.enabled,
+            "rules": sorted(r.name for r in self.rules.values()),
+            "rejected": dict(self.rejected),
+            "backend_errors": self._backend_errors,
+        }
+
+
+class RateLimitMiddleware:
+    """Middleware ASGI: refuse (429 + Retry-After) avant que le handler ne touche la base,
+    bcrypt ou SMTP. Seuls les endpoints listés dans les règles du limiter sont concernés."""
+
+    def __init__(self, app: Callable, limiter: RateLimiter):
+        self.app = app
+        self.limiter = limiter
+
+    async def __call__(self, scope: Dict[str, Any], receive: Callable, send: Callable) -> None:
+        if scope["type"] == "http":
+            retry_after, receive = await self.limiter.check(scope, receive)
+            if retry_after:
+                await self._reject(send, retry_after)
+                return
+        await self.app(scope, receive, send)
+
+    @staticmethod
+    async def _reject(send: Callable, retry_after: int) -> None:
+        body = json.dumps({"detail": f"Twòp tantativ. Eseye ankò nan {retry_after} segonn."}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 429,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(retry_after).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,242 @@
+import asyncio
+import itertools
+import json
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, List, Optional, Set, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Nombre d'événements gardés par utilisateur pour la reprise via Last-Event-ID
+REALTIME_BUFFER_SIZE = int(os.getenv("TAPTAPGO_SSE_BUFFER_SIZE", "100"))
+# Durée de reprise via Last-Event-ID: au-delà, le buffer d'un utilisateur sans connexion est libéré
+REALTIME_REPLAY_SECONDS = float(os.getenv("TAPTAPGO_SSE_REPLAY_SECONDS", "600"))
+# Intervalle min entre deux purges des buffers inactifs (secondes)
+REALTIME_SWEEP_SECONDS = 60.0
+# Intervalle du heartbeat (garde la connexion ouverte derrière les proxies)
+REALTIME_HEARTBEAT_SECONDS = float(os.getenv("TAPTAPGO_SSE_HEARTBEAT_SECONDS", "20"))
+# Délai de reconnexion suggéré au client (champ SSE "retry")
+REALTIME_RETRY_MS = 3000
+
+
+class _Subscriber:
+    """Connexion SSE ouverte: réveillée par publish() depuis n'importe quel thread."""
+
+    __slots__ = ("loop", "wakeup", "resync")
+
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self.wakeup = asyncio.Event()
+        # Des événements ont pu être perdus (relais entre workers interrompu)
+        self.resync = False
+
+    def notify(self) -> None:
+        try:
+            self.loop.call_soon_threadsafe(self.wakeup.set)
+        except RuntimeError:
+            # Boucle fermée: la connexion est déjà partie
+            pass
+
+
+class EventBroker:
+    """Diffusion d'événements par utilisateur (notifications, courses, wallet).
+
+    Chaque utilisateur a un buffer circulaire des derniers événements: un client qui se
+    reconnecte avec Last-Event-ID reçoit ce qu'il a manqué. Un id est "<epoch>:<n>":
+    l'epoch identifie le process (pid + heure de démarrage), n est croissant. Un id d'un
+    autre epoch (redémarrage, autre worker) ne correspond à aucun historique: le client
+    reçoit resync. Le buffer d'un utilisateur sans connexion est libéré après
+    replay_seconds. L'état est local au process (un worker uvicorn = un broker): server.py
+    relaie chaque événement aux autres workers par le bus d'invalidation.
+    """
+
+    def __init__(self, buffer_size: int = REALTIME_BUFFER_SIZE, replay_seconds: float = REALTIME_REPLAY_SECONDS):
+        self._buffer_size = buffer_size
+        self._replay_seconds = replay_seconds
+        self._lock = threading.Lock()
+        self._init_state()
+
+    def _init_state(self) -> None:
+        self.epoch = f"{os.getpid()}.{int(time.time() * 1000)}"
+        self._ids = itertools.count(1)
+        self._events: Dict[str, Deque[Tuple[int, str, str]]] = {}
+        self._last_publish: Dict[str, float] = {}
+        # Plus grand id sorti du buffer plein d'un utilisateur: les ids sont partagés par tous
+        # les utilisateurs, donc espacés dans un même buffer
+        self._overflowed: Dict[str, int] = {}
+        self._subscribers: Dict[str, Set[_Subscriber]] = {}
+        self._published = 0
+        self._swept_at = time.monotonic()
+        self.evicted = 0
+
+    def reset_after_fork(self) -> None:
+        """Worker forké: nouvel epoch (les ids du master ne doivent pas être repris)."""
+        self._lock = threading.Lock()
+        self._init_state()
+
+    def format_id(self, seq: int) -> str:
+        return f"{self.epoch}:{seq}"
+
+    def publish(self, user_id: Optional[str], event: str, data: Dict[str, Any]) -> Optional[int]:
+        """Ajoute un événement au flux de l'utilisateur et réveille ses connexions."""
+        if not user_id:
+            return None
+        payload = json.dumps(data, default=str, ensure_ascii=False)
+        with self._lock:
+            event_id = next(self._ids)
+            buf = self._events.get(user_id)
+            if buf is None:
+                buf = self._events[user_id] = deque(maxlen=self._buffer_size)
+            if len(buf) == buf.maxlen:
+                self._overflowed[user_id] = buf[0][0]
+            buf.append((event_id, event, payload))
+            now = time.monotonic()
+            self._last_publish[user_id] = now
+            subscribers = list(self._subscribers.get(user_id, ()))
+            self._published += 1
+            if now - self._swept_at >= REALTIME_SWEEP_SECONDS:
+                self._sweep_locked(now)
+        for sub in subscribers:
+            sub.notify()
+        return event_id
+
+    def _sweep_locked(self, now: float) -> None:
+        """Libère les buffers des utilisateurs sans connexion dont le dernier événement a dépassé la fenêtre de reprise."""
+        self._swept_at = now
+        for user_id, published_at in list(self._last_publish.items()):
+            if now - published_at > self._replay_seconds and user_id not in self._subscribers:
+                del self._last_publish[user_id]
+                self._events.pop(user_id, None)
+                self._overflowed.pop(user_id, None)
+                self.evicted += 1
+
+    def resync_all(self) -> None:
+        """Relais interrompu: chaque connexion ouverte reçoit resync (le client recharge)."""
+        with self._lock:
+            subscribers = [sub for subs in self._subscribers.values() for sub in subs]
+        for sub in subscribers:
+            sub.resync = True
+            sub.notify()
+
+    def subscribe(self, user_id: str) -> _Subscriber:
+        sub = _Subscriber(asyncio.get_running_loop())
+        with self._lock:
+            self._subscribers.setdefault(user_id, set()).add(sub)
+        return sub
+
+    def unsubscribe(self, user_id: str, sub: _Subscriber) -> None:
+        with self._lock:
+            subs = self._subscribers.get(user_id)
+            if subs is None:
+                return
+            subs.discard(sub)
+            if not subs:
+                del self._subscribers[user_id]
+
+    def resolve(self, last_event_id: Optional[Tuple[str, int]]) -> Tuple[Optional[int], bool]:
+        """Last-Event-ID parsé -> (n local, trou). Un autre epoch: historique inconnu ici."""
+        if last_event_id is None:
+            return None, False
+        epoch, seq = last_event_id
+        if epoch != self.epoch:
+            return None, True
+        return seq, False
+
+    def events_since(self, user_id: str, last_id: Optional[int]) -> Tuple[List[Tuple[int, str, str]], bool]:
+        """Événements après last_id. Le booléen indique un trou (buffer dépassé ou id inconnu)."""
+        if last_id is None:
+            return [], False
+        with self._lock:
+            buf = list(self._events.get(user_id, ()))
+            overflowed = self._overflowed.get(user_id, 0)
+        # Buffer vide alors que le client a déjà reçu des événements: libéré par _sweep_locked
+        gap = not buf and last_id > 0
+        if buf:
+            # Trou seulement si un événement que le client n'a pas reçu est sorti du buffer
+            gap = gap or last_id < overflowed or last_id > buf[-1][0]
+        return [e for e in buf if e[0] > last_id], gap
+
+    def last_event_id(self, user_id: str) -> Optional[int]:
+        with self._lock:
+            buf = self._events.get(user_id)
+            return buf[-1][0] if buf else None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "connections": sum(len(s) for s in self._subscribers.values()),
+                "users_connected": len(self._subscribers),
+                "users_buffered": len(self._events),
+                "buffers_evicted": self.evicted,
+                "events_published": self._published,
+                "epoch": self.epoch,
+            }
+
+
+def format_sse(event: str, data: str, event_id: Optional[str] = None) -> str:
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event}")
+    for chunk in data.splitlines() or [""]:
+        lines.append(f"data: {chunk}")
+    return "\n".join(lines) + "\n\n"
+
+
+def parse_last_event_id(raw: Optional[str]) -> Optional[Tuple[str, int]]:
+    """"<epoch>:<n>" -> (epoch, n). Un ancien id sans epoch donne un epoch vide (resync)."""
+    if not raw:
+        return None
+    epoch, _, seq = raw.strip().rpartition(":")
+    try:
+        return epoch, int(seq)
+    except ValueError:
+        return None
+
+
+async def stream_events(
+    broker: EventBroker,
+    user_id: str,
+    last_event_id: Optional[Tuple[str, int]],
+    is_disconnected: Callable[[], Awaitable[bool]],
+) -> AsyncIterator[str]:
+    """Générateur SSE: rattrapage Last-Event-ID, puis événements en direct + heartbeat.
+
+    is_disconnected: coroutine (Request.is_disconnected) pour arrêter proprement.
+    """
+    sub = broker.subscribe(user_id)
+    try:
+        yield f"retry: {REALTIME_RETRY_MS}\n\n"
+        cursor, gap = broker.resolve(last_event_id)
+        if cursor is not None:
+            missed, gap = broker.events_since(user_id, cursor)
+            for event_id, event, payload in missed:
+                yield format_sse(event, payload, broker.format_id(event_id))
+                cursor = event_id
+        if gap:
+            # Le client doit recharger via GET /notifications et GET /rides
+            yield format_sse("resync", json.dumps({"reason": "history_unavailable"}))
+        if cursor is None:
+            cursor = broker.last_event_id(user_id) or 0
+        yield format_sse("ready", json.dumps({"last_event_id": broker.format_id(cursor)}))
+        while True:
+            try:
+                await asyncio.wait_for(sub.wakeup.wait(), timeout=REALTIME_HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                if await is_disconnected():
+                    break
+                yield ": ping\n\n"
+                continue
+            sub.wakeup.clear()
+            missed, _ = broker.events_since(user_id, cursor)
+            for event_id, event, payload in missed:
+                yield format_sse(event, payload, broker.format_id(event_id))
+                cursor = event_id
+            if sub.resync:
+                sub.resync = False
+                yield format_sse("resync", json.dumps({"reason": "relay_interrupted"}))
+    finally:
+        broker.unsubscribe(user_id, sub)
@@ -0,0 +1,45 @@
+import os
+from typing import Any, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Redis partagé entre workers (rate limiting, OTP...). Vide = état en mémoire par process.
+REDIS_URL = (os.getenv("TAPTAPGO_REDIS_URL") or "").strip()
+
+redis = None
+redis_asyncio = None
+# Import seulement si Redis est configuré: le module n'est pas chargé pour rien au démarrage
+if REDIS_URL:
+    try:
+        import redis
+        import redis.asyncio as redis_asyncio
+    except ImportError:  # dépendance optionnelle
+        redis = None
+        redis_asyncio = None
+
+
+def redis_available() -> bool:
+    return bool(REDIS_URL) and redis is not None
+
+
+def get_sync_redis(url: Optional[str] = None) -> Optional[Any]:
+    """Client Redis synchrone, ou None si non configuré / module absent."""
+    url = url or REDIS_URL
+    if not url:
+        return None
+    if redis is None:
+        logger.warning("TAPTAPGO_REDIS_URL défini mais le module redis n'est pas installé (pip install redis)")
+        return None
+    return redis.Redis.from_url(url, decode_responses=True)
+
+
+def get_async_redis(url: Optional[str] = None) -> Optional[Any]:
+    """Client Redis asyncio, ou None si non configuré / module absent."""
+    url = url or REDIS_URL
+    if not url:
+        return None
+    if redis_asyncio is None:
+        logger.warning("TAPTAPGO_REDIS_URL défini mais le module redis n'est pas installé (pip install redis)")
+        return None
+    return redis_asyncio.Redis.from_url(url, decode_responses=True)
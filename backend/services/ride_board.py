@@ -0,0 +1,214 @@
+import itertools
+import os
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Resynchronisation périodique avec la table rides (filet de sécurité multi-workers)
+RIDE_BOARD_RESYNC_SECONDS = float(os.getenv("TAPTAPGO_RIDE_BOARD_RESYNC_SECONDS", "60"))
+# Durée de vie du scope chauffeur (admin_id, vehicle_type, city) gardé en mémoire
+DRIVER_SCOPE_TTL_SECONDS = float(os.getenv("TAPTAPGO_DRIVER_SCOPE_TTL_SECONDS", "300"))
+
+PartitionKey = Tuple[Optional[str], Optional[str], Optional[str]]
+
+
+def _new_epoch() -> str:
+    return f"{os.getpid()}.{int(time.time() * 1000)}"
+
+
+def is_open_ride(ride: Dict[str, Any]) -> bool:
+    """Course visible par les chauffeurs du scope: en attente et sans chauffeur."""
+    return ride.get("status") == "pending" and not ride.get("driver_id")
+
+
+def partition_key(ride: Dict[str, Any]) -> PartitionKey:
+    return (ride.get("admin_id"), ride.get("vehicle_type"), ride.get("city"))
+
+
+class PendingRideBoard:
+    """Tableau en mémoire des courses en attente non assignées.
+
+    Partitions (admin_id, vehicle_type, city). Chaque mutation prend un numéro dans un
+    compteur global; la version d'un scope (admin_id, vehicle_type) est le max de ses
+    partitions, ce qui permet au chauffeur de demander "quoi de neuf depuis N" sans
+    requête. Le compteur est propre au process: feed_version le préfixe par epoch, pour
+    qu'une version reçue d'un autre worker ne soit jamais prise pour la nôtre. Tant que
+    load() n'a pas réussi, ready est False et l'appelant retombe sur la base.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.epoch = _new_epoch()
+        self._seq = itertools.count(1)
+        self._version = 0
+        self._partitions: Dict[PartitionKey, Dict[str, Dict[str, Any]]] = {}
+        self._partition_versions: Dict[PartitionKey, int] = {}
+        self._scope_cities: Dict[Tuple[Optional[str], Optional[str]], Set[Optional[str]]] = {}
+        self._ride_keys: Dict[str, PartitionKey] = {}
+        # Dernière mutation locale par course: une resync lancée avant ne l'écrase pas
+        self._touched: Dict[str, int] = {}
+        self._driver_scopes: Dict[str, Tuple[float, Dict[str, Any]]] = {}
+        self.ready = False
+        self.last_sync_at: Optional[float] = None
+
+    def reset_after_fork(self) -> None:
+        """Worker forké: nouvel epoch (tableau rechargé par le lifespan du worker)."""
+        self._lock = threading.Lock()
+        self.epoch = _new_epoch()
+
+    def mark_stale(self) -> None:
+        """Changements d'autres workers possiblement perdus: la prochaine lecture recharge depuis la base."""
+        self.ready = False
+
+    # -- Mutations -----------------------------------------------------------------
+    def _bump(self, key: PartitionKey) -> int:
+        self._version = next(self._seq)
+        self._partition_versions[key] = self._version
+        self._scope_cities.setdefault(key[:2], set()).add(key[2])
+        return self._version
+
+    def _remove_locked(self, ride_id: str) -> bool:
+        key = self._ride_keys.pop(ride_id, None)
+        if key is None:
+            return False
+        self._partitions.get(key, {}).pop(ride_id, None)
+        self._bump(key)
+        return True
+
+    def apply(self, ride: Dict[str, Any]) -> None:
+        """Intègre l'état courant d'une course (création, acceptation, changement de statut)."""
+        ride_id = ride.get("id")
+        if not ride_id:
+            return
+        with self._lock:
+            if is_open_ride(ride):
+                key = partition_key(ride)
+                old_key = self._ride_keys.get(ride_id)
+                if old_key is not None and old_key != key:
+                    self._remove_locked(ride_id)
+                self._partitions.setdefault(key, {})[ride_id] = dict(ride)
+                self._ride_keys[ride_id] = key
+                self._bump(key)
+            else:
+                self._remove_locked(ride_id)
+            self._touched[ride_id] = self._version
+
+    def remove(self, ride_id: str) -> None:
+        with self._lock:
+            self._remove_locked(ride_id)
+            self._touched[ride_id] = self._version
+
+    def drop_admin(self, admin_id: str) -> None:
+        """Retire toutes les courses d'un admin (suppression de la marque)."""
+        with self._lock:
+            for ride_id, key in list(self._ride_keys.items()):
+                if key[0] == admin_id:
+                    self._remove_locked(ride_id)
+                    self._touched[ride_id] = self._version
+
+    def begin_sync(self) -> int:
+        """Repère à passer à load(): les mutations postérieures restent prioritaires."""
+        with self._lock:
+            return self._version
+
+    def load(self, rides: Iterable[Dict[str, Any]], as_of: int = 0) -> None:
+        """Remplace le contenu par les courses lues en base (démarrage et resync)."""
+        fresh: Dict[str, Dict[str, Any]] = {r["id"]: r for r in rides if r.get("id") and is_open_ride(r)}
+        with self._lock:
+            for ride_id, seq in list(self._touched.items()):
+                if seq <= as_of:
+                    del self._touched[ride_id]
+                    continue
+                # Course modifiée localement pendant la lecture: garder l'état mémoire
+                fresh.pop(ride_id, None)
+                key = self._ride_keys.get(ride_id)
+                if key is not None:
+                    fresh[ride_id] = self._partitions[key][ride_id]
+            for ride_id in list(self._ride_keys):
+                current = self._partitions[self._ride_keys[ride_id]][ride_id]
+                new = fresh.get(ride_id)
+                if new is None or partition_key(new) != self._ride_keys[ride_id]:
+                    self._remove_locked(ride_id)
+                elif new is not current:
+                    self._partitions[self._ride_keys[ride_id]][ride_id] = {**current, **new}
+            for ride_id, ride in fresh.items():
+                if ride_id not in self._ride_keys:
+                    key = partition_key(ride)
+                    self._partitions.setdefault(key, {})[ride_id] = dict(ride)
+                    self._ride_keys[ride_id] = key
+                    self._bump(key)
+            self.ready = True
+            self.last_sync_at = time.time()
+
+    # -- Lecture -------------------------------------------------------------------
+    def scope_version(self, admin_id: Optional[str], vehicle_type: Optional[str], city: Optional[str] = None) -> int:
+        with self._lock:
+            return self._scope_version_locked(admin_id, vehicle_type, city)
+
+    def feed_version(self, version: int) -> str:
+        return f"{self.epoch}:{version}"
+
+    def _scope_cities_locked(self, admin_id, vehicle_type, city) -> Set[Optional[str]]:
+        cities = self._scope_cities.get((admin_id, vehicle_type), set())
+        if city is not None:
+            # Courses sans ville (anciennes, créées avant city sur rides): visibles partout
+            cities = {c for c in cities if c == city or c is None}
+        return cities
+
+    def _scope_version_locked(self, admin_id, vehicle_type, city) -> int:
+        cities = self._scope_cities_locked(admin_id, vehicle_type, city)
+        return max((self._partition_versions.get((admin_id, vehicle_type, c), 0) for c in cities), default=0)
+
+    def snapshot(
+        self, admin_id: Optional[str], vehicle_type: Optional[str], city: Optional[str] = None
+    ) -> Tuple[int, List[Dict[str, Any]]]:
+        """(version, courses) du scope; city=None couvre toutes les villes du scope, sinon
+        la ville du chauffeur et les courses sans ville."""
+        with self._lock:
+            cities = self._scope_cities_locked(admin_id, vehicle_type, city)
+            rides: List[Dict[str, Any]] = []
+            for c in cities:
+                rides.extend(dict(r) for r in self._partitions.get((admin_id, vehicle_type, c), {}).values())
+            version = self._scope_version_locked(admin_id, vehicle_type, city)
+        rides.sort(key=lambda r: str(r.get("created_at") or ""), reverse=True)
+        return version, rides
+
+    def get(self, ride_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            key = self._ride_keys.get(ride_id)
+            return dict(self._partitions[key][ride_id]) if key is not None else None
+
+    # -- Scope chauffeur -------------------------------------------------------------
+    def driver_scope(self, driver_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._driver_scopes.get(driver_id)
+            if entry is None or entry[0] < time.time():
+                return None
+            return entry[1]
+
+    def remember_driver(self, driver_id: str, scope: Dict[str, Any]) -> None:
+        with self._lock:
+            self._driver_scopes[driver_id] = (time.time() + DRIVER_SCOPE_TTL_SECONDS, dict(scope))
+
+    def forget_driver(self, driver_id: Optional[str]) -> None:
+        """driver_id None: oublie tous les chauffeurs."""
+        with self._lock:
+            if driver_id is None:
+                self._driver_scopes.clear()
+            else:
+                self._driver_scopes.pop(driver_id, None)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "ready": self.ready,
+                "epoch": self.epoch,
+                "version": self._version,
+                "pending_rides": len(self._ride_keys),
+                "partitions": sum(1 for p in self._partitions.values() if p),
+                "driver_scopes": len(self._driver_scopes),
+                "last_sync_at": self.last_sync_at,
+            }
@@ -0,0 +1,104 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Nombre max de tokens vérifiés gardés en mémoire (LRU)
+TOKEN_CACHE_SIZE = int(os.getenv("TAPTAPGO_TOKEN_CACHE_SIZE", "10000"))
+
+
+def token_key(token: str) -> str:
+    """Clé de cache: on ne garde jamais le token lui-même en mémoire."""
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+class TokenCache:
+    """Cache LRU des JWT déjà vérifiés (claims décodés), valable jusqu'à exp.
+
+    Révocation: revoke(token) met le token en liste noire jusqu'à son exp;
+    revoke_user(user_id) invalide tous les tokens émis avant maintenant (claim iat).
+    """
+
+    def __init__(self, max_size: int = TOKEN_CACHE_SIZE):
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._revoked: Dict[str, float] = {}
+        self._revoked_users: Dict[str, float] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, token: str) -> Optional[Dict[str, Any]]:
+        key = token_key(token)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= now:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return dict(entry[1])
+
+    def put(self, token: str, claims: Dict[str, Any]) -> None:
+        exp = claims.get("exp")
+        if not exp:
+            return
+        key = token_key(token)
+        with self._lock:
+            self._entries[key] = (float(exp), dict(claims))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def is_revoked(self, token: str, claims: Dict[str, Any]) -> bool:
+        with self._lock:
+            if self._revoked and token_key(token) in self._revoked:
+                return True
+            cutoff = self._revoked_users.get(claims.get("user_id") or "")
+        return cutoff is not None and float(claims.get("iat") or 0) < cutoff
+
+    def revoke(self, token: str, exp: Optional[float] = None) -> None:
+        """Révoque un token (logout). exp borne la durée de la liste noire."""
+        key = token_key(token)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            until = exp or (entry[0] if entry else now + 30 * 86400)
+            self._revoked[key] = float(until)
+            self._purge_revoked_locked(now)
+
+    def revoke_user(self, user_id: str) -> None:
+        """Invalide tous les tokens déjà émis pour cet utilisateur."""
+        with self._lock:
+            # iat est en secondes entières: un token émis dans la même seconde est aussi révoqué
+            self._revoked_users[user_id] = time.time()
+            for key in [k for k, (_, c) in self._entries.items() if c.get("user_id") == user_id]:
+                del self._entries[key]
+
+    def _purge_revoked_locked(self, now: float) -> None:
+        for key in [k for k, until in self._revoked.items() if until <= now]:
+            del self._revoked[key]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+                "evictions": self.evictions,
+                "revoked_tokens": len(self._revoked),
+                "revoked_users": len(self._revoked_users),
+            }
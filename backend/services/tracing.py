@@ -0,0 +1,355 @@
+import json
+import os
+import queue
+import random
+import threading
+import time
+import urllib.request
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator, List, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+# "" = tracing désactivé, "file" = OTLP/JSON dans TRACING_FILE, "otlp" = POST OTLP/HTTP JSON vers un collecteur
+TRACING_EXPORTER = (os.getenv("TAPTAPGO_TRACING_EXPORTER") or "").strip().lower()
+# Fichier du mode "file": une ligne JSON par lot (format du receiver otlpjsonfile du collecteur)
+TRACING_FILE = os.getenv("TAPTAPGO_TRACING_FILE", "traces.jsonl")
+# Collecteur OpenTelemetry (les spans partent vers <endpoint>/v1/traces)
+OTLP_ENDPOINT = (
+    os.getenv("TAPTAPGO_OTLP_ENDPOINT") or os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT") or "http://localhost:4318"
+).rstrip("/")
+# Part des traces gardées (décidée à la racine, suivie par tous les spans de la trace)
+TRACING_SAMPLE_RATIO = float(os.getenv("TAPTAPGO_TRACING_SAMPLE_RATIO", "1"))
+SERVICE_NAME = os.getenv("TAPTAPGO_SERVICE_NAME") or os.getenv("OTEL_SERVICE_NAME") or "taptapgo-api"
+# Export par lots: au plus BATCH_SIZE spans, au moins toutes les FLUSH_SECONDS secondes
+BATCH_SIZE = 512
+FLUSH_SECONDS = 2.0
+# Spans en attente d'export au-delà desquels les nouveaux sont abandonnés
+MAX_QUEUE = 10_000
+
+SPAN_INTERNAL = 1
+SPAN_SERVER = 2
+SPAN_CLIENT = 3
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+
+class SpanContext:
+    __slots__ = ("trace_id", "span_id", "sampled")
+
+    def __init__(self, trace_id: str, span_id: str, sampled: bool):
+        self.trace_id = trace_id
+        self.span_id = span_id
+        self.sampled = sampled
+
+
+_current: ContextVar[Optional[SpanContext]] = ContextVar("current_span", default=None)
+
+
+class Span:
+    __slots__ = ("name", "kind", "context", "parent_id", "start_ns", "end_ns", "attributes", "status", "status_message")
+
+    def __init__(self, name: str, kind: int, context: SpanContext, parent_id: Optional[str], attributes: Optional[Dict[str, Any]]):
+        self.name = name
+        self.kind = kind
+        self.context = context
+        self.parent_id = parent_id
+        self.start_ns = time.time_ns()
+        self.end_ns = 0
+        self.attributes: Dict[str, Any] = dict(attributes or {})
+        self.status = 0
+        self.status_message = ""
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def set_error(self, error: BaseException) -> None:
+        self.status = STATUS_ERROR
+        self.status_message = f"{type(error).__name__}: {error}"[:500]
+
+    def to_otlp(self) -> Dict[str, Any]:
+        span = {
+            "traceId": self.context.trace_id,
+            "spanId": self.context.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": _otlp_attributes(self.attributes),
+            "status": {"code": self.status, "message": self.status_message} if self.status else {},
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+
+class _NoopSpan:
+    """Span non enregistré (tracing coupé ou trace non échantillonnée)."""
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        pass
+
+    def set_error(self, error: BaseException) -> None:
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _otlp_attributes(attributes: Dict[str, Any]) -> List[Dict[str, Any]]:
+    return [{"key": k, "value": _otlp_value(v)} for k, v in attributes.items() if v is not None]
+
+
+def parse_traceparent(header: Optional[str]) -> Optional[SpanContext]:
+    """En-tête W3C traceparent (00-<trace_id>-<span_id>-<flags>) d'un appelant."""
+    if not header:
+        return None
+    parts = header.strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    try:
+        int(parts[1], 16), int(parts[2], 16)
+        sampled = bool(int(parts[3], 16) & 1)
+    except ValueError:
+        return None
+    if parts[1] == "0" * 32 or parts[2] == "0" * 16:
+        return None
+    return SpanContext(parts[1], parts[2], sampled)
+
+
+class SpanExporter:
+    """Export par lots dans un thread: fichier OTLP/JSON ou POST OTLP/HTTP vers un collecteur."""
+
+    def __init__(self, mode: str, path: str = TRACING_FILE, endpoint: str = OTLP_ENDPOINT, service_name: str = SERVICE_NAME):
+        self.mode = mode
+        self.path = path
+        self.url = f"{endpoint}/v1/traces"
+        self.service_name = service_name
+        self._queue: "queue.Queue[Optional[Span]]" = queue.Queue(maxsize=MAX_QUEUE)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self.exported = 0
+        self.dropped = 0
+        self.failed = 0
+        self._last_error_log = 0.0
+
+    def submit(self, span: Span) -> None:
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="taptapgo-span-exporter", daemon=True)
+                    self._thread.start()
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self) -> None:
+        batch: List[Span] = []
+        deadline = time.monotonic() + FLUSH_SECONDS
+        while True:
+            try:
+                span = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                span = False
+            if span is None:  # shutdown
+                self._export(batch)
+                return
+            if span:
+                batch.append(span)
+            if len(batch) >= BATCH_SIZE or time.monotonic() >= deadline:
+                self._export(batch)
+                batch = []
+                deadline = time.monotonic() + FLUSH_SECONDS
+
+    def _export(self, batch: List[Span]) -> None:
+        if not batch:
+            return
+        payload = {
+            "resourceSpans": [{
+                # pid lu à l'export: un worker forké ne reprend pas celui du parent
+                "resource": {"attributes": _otlp_attributes({"service.name": self.service_name, "process.pid": os.getpid()})},
+                "scopeSpans": [{"scope": {"name": "taptapgo"}, "spans": [s.to_otlp() for s in batch]}],
+            }]
+        }
+        try:
+            if self.mode == "otlp":
+                request = urllib.request.Request(
+                    self.url, data=json.dumps(payload).encode(), headers={"Content-Type": "application/json"}, method="POST"
+                )
+                with urllib.request.urlopen(request, timeout=5) as response:
+                    response.read()
+            else:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(payload) + "\n")
+            self.exported += len(batch)
+        except Exception as e:
+            self.failed += len(batch)
+            now = time.monotonic()
+            if now - self._last_error_log > 60:
+                self._last_error_log = now
+                logger.warning(f"Span export failed ({self.mode}): {e}")
+
+    def reset_after_fork(self) -> None:
+        """Dans un worker forké: le thread d'export du master n'existe pas ici."""
+        self._queue = queue.Queue(maxsize=MAX_QUEUE)
+        self._thread = None
+        self._lock = threading.Lock()
+        self.exported = self.dropped = self.failed = 0
+
+    def shutdown(self) -> None:
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join(timeout=10)
+            self._thread = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "exporter": self.mode,
+            "target": self.url if self.mode == "otlp" else self.path,
+            "queued": self._queue.qsize(),
+            "exported": self.exported,
+            "dropped": self.dropped,
+            "failed": self.failed,
+        }
+
+
+class Tracer:
+    """Spans façon OpenTelemetry (trace_id / span_id / parent, attributs, statut) sans dépendance.
+
+    Le span courant est dans un ContextVar: asyncio.to_thread et les tâches créées pendant
+    une requête héritent de la trace. Désactivé (TAPTAPGO_TRACING_EXPORTER vide), span()
+    ne coûte qu'une comparaison.
+    """
+
+    def __init__(self, exporter: Optional[SpanExporter] = None, sample_ratio: float = TRACING_SAMPLE_RATIO):
+        self.exporter = exporter
+        self.sample_ratio = sample_ratio
+
+    @property
+    def enabled(self) -> bool:
+        return self.exporter is not None
+
+    def _start(self, name: str, kind: int, attributes: Optional[Dict[str, Any]], parent: Optional[SpanContext]) -> Optional[Span]:
+        if parent is not None:
+            if not parent.sampled:
+                return None
+            context = SpanContext(parent.trace_id, random.getrandbits(64).to_bytes(8, "big").hex(), True)
+            return Span(name, kind, context, parent.span_id, attributes)
+        sampled = self.sample_ratio >= 1 or random.random() < self.sample_ratio
+        context = SpanContext(random.getrandbits(128).to_bytes(16, "big").hex(), random.getrandbits(64).to_bytes(8, "big").hex(), sampled)
+        return Span(name, kind, context, None, attributes) if sampled else None
+
+    @contextmanager
+    def span(
+        self,
+        name: str,
+        kind: int = SPAN_INTERNAL,
+        attributes: Optional[Dict[str, Any]] = None,
+        parent: Optional[SpanContext] = None,
+        root: bool = False,
+    ) -> Iterator[Any]:
+        """Span enfant du span courant (ou de parent, ou nouvelle trace si root)."""
+        if self.exporter is None:
+            yield NOOP_SPAN
+            return
+        if parent is None and not root:
+            parent = _current.get()
+        span = self._start(name, kind, attributes, parent)
+        if span is None:
+            # Trace non échantillonnée: les enfants ne doivent pas ouvrir de nouvelle trace
+            token = _current.set(parent or SpanContext("", "", False))
+            try:
+                yield NOOP_SPAN
+            finally:
+                _current.reset(token)
+            return
+        token = _current.set(span.context)
+        try:
+            yield span
+        except BaseException as e:
+            span.set_error(e)
+            raise
+        finally:
+            _current.reset(token)
+            span.end_ns = time.time_ns()
+            self.exporter.submit(span)
+
+    def current_trace_id(self) -> Optional[str]:
+        context = _current.get()
+        return context.trace_id if context is not None and context.sampled else None
+
+    def reset_after_fork(self) -> None:
+        if self.exporter is not None:
+            self.exporter.reset_after_fork()
+
+    def shutdown(self) -> None:
+        if self.exporter is not None:
+            self.exporter.shutdown()
+
+    def stats(self) -> Dict[str, Any]:
+        if self.exporter is None:
+            return {"enabled": False}
+        return {"enabled": True, "sample_ratio": self.sample_ratio, **self.exporter.stats()}
+
+
+def create_tracer() -> Tracer:
+    if TRACING_EXPORTER in ("file", "otlp"):
+        return Tracer(SpanExporter(TRACING_EXPORTER))
+    if TRACING_EXPORTER:
+        logger.warning(f"Unknown TAPTAPGO_TRACING_EXPORTER={TRACING_EXPORTER!r}, tracing disabled")
+    return Tracer()
+
+
+# Tracer du process, partagé par le serveur, l'instrumentation Supabase, bcrypt et les builds
+tracer = create_tracer()
+
+
+class TracingMiddleware:
+    """Middleware ASGI: un span SERVER par requête HTTP, nommé d'après la route déclarée.
+
+    Reprend la trace de l'appelant (traceparent) et renvoie X-Trace-Id.
+    """
+
+    def __init__(self, app: Callable, tracer: Tracer = tracer):
+        self.app = app
+        self.tracer = tracer
+
+    async def __call__(self, scope: Dict[str, Any], receive: Callable, send: Callable) -> None:
+        if scope["type"] != "http" or not self.tracer.enabled:
+            await self.app(scope, receive, send)
+            return
+        headers = dict(scope.get("headers") or [])
+        parent = parse_traceparent(headers.get(b"traceparent", b"").decode("latin-1"))
+        attributes = {"http.request.method": scope["method"], "url.path": scope["path"]}
+        with self.tracer.span(scope["method"], SPAN_SERVER, attributes, parent=parent, root=parent is None) as span:
+            trace_id = self.tracer.current_trace_id()
+
+            async def send_wrapper(message: Dict[str, Any]) -> None:
+                if message["type"] == "http.response.start":
+                    span.set_attribute("http.response.status_code", message["status"])
+                    if message["status"] >= 500 and isinstance(span, Span):
+                        span.status = STATUS_ERROR
+                    if trace_id:
+                        message["headers"] = list(message.get("headers", [])) + [(b"x-trace-id", trace_id.encode())]
+                await send(message)
+
+            try:
+                await self.app(scope, receive, send_wrapper)
+            finally:
+                route = getattr(scope.get("route"), "path", None)
+                if isinstance(span, Span):
+                    span.name = f"{scope['method']} {route or scope['path']}"
+                    span.set_attribute("http.route", route)
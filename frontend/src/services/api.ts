@@ -1,6 +1,7 @@
 import axios from 'axios/dist/browser/axios.cjs';
 import type { InternalAxiosRequestConfig } from 'axios';
 import { Platform } from 'react-native';
+import AsyncStorage from '@react-native-async-storage/async-storage';
 import { useAuthStore } from '../store/authStore';
 
 const DEFAULT_ANDROID_URL = 'http://10.0.2.2:8000';
@@ -62,6 +63,16 @@ api.interceptors.request.use((config: InternalAxiosRequestConfig) => {
   return config;
 });
 
+// Token rafraîchi par le backend (claims de profil périmés ou profil modifié)
+api.interceptors.response.use((response: any) => {
+  const refreshed = response?.headers?.['x-refreshed-token'];
+  if (refreshed && refreshed !== useAuthStore.getState().token) {
+    useAuthStore.getState().setToken(refreshed);
+    AsyncStorage.setItem('auth_token', refreshed).catch(() => {});
+  }
+  return response;
+});
+
 // Auth APIs
 export const authAPI = {
   sendOTP: (phone: string) => api.post('/otp/send', { phone }),
@@ -0,0 +1,38 @@
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+# Les modules du backend s'importent comme dans server.py ("from services... import")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+# Base en mémoire chargée depuis backend/benchmarks/seed.json: aucun projet Supabase requis.
+# À fixer avant l'import de server (lu une fois au chargement des services)
+os.environ["TAPTAPGO_FAKE_SUPABASE"] = "1"
+os.environ.setdefault("JWT_SECRET", "taptapgo-tests-only-jwt-secret-0123456789")
+
+
+@pytest.fixture(scope="session")
+def server():
+    import server as app_module
+    return app_module
+
+
+@pytest.fixture(scope="session")
+def client(server):
+    from fastapi.testclient import TestClient
+
+    with TestClient(server.app) as test_client:
+        yield test_client
+
+
+@pytest.fixture
+def fresh_limits(server):
+    """Compteurs de rate limiting vides (partagés sinon par tous les tests de la session)."""
+    from services.rate_limit import MemoryRateLimitBackend
+
+    previous = server.rate_limiter.backend
+    server.rate_limiter.backend = MemoryRateLimitBackend()
+    yield server.rate_limiter
+    server.rate_limiter.backend = previous
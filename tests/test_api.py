@@ -0,0 +1,103 @@
+"""Parcours HTTP de bout en bout sur la base en mémoire (TAPTAPGO_FAKE_SUPABASE=1, seed des benchmarks)."""
+import pytest
+
+ADMIN_ID = "00000000-0000-4000-8000-00000000a001"
+PASSENGER_ID = "00000000-0000-4000-8000-0000000d0001"
+PASSENGER_PHONE = "+50931000001"
+MOTO_DRIVER_ID = "00000000-0000-4000-8000-0000000f0001"
+OTHER_CITY_DRIVER_ID = "00000000-0000-4000-8000-0000000f0005"
+
+
+def _auth(server, user_id, user_type):
+    return {"Authorization": f"Bearer {server.create_token(user_id, user_type, ADMIN_ID)}"}
+
+
+def _open_ride(server, **fields):
+    ride = {
+        "passenger_id": PASSENGER_ID,
+        "pickup_lat": 18.54, "pickup_lng": -72.34, "pickup_address": "Pickup",
+        "destination_lat": 18.51, "destination_lng": -72.29, "destination_address": "Destination",
+        "vehicle_type": "moto", "status": "pending", "estimated_price": 150,
+        "payment_method": "cash", "admin_id": ADMIN_ID, "city": "Port-au-Prince",
+        **fields,
+    }
+    created = server.supabase.table("rides").insert(ride).execute().data[0]
+    server._track_ride(created)
+    return created
+
+
+def test_login_returns_token(client):
+    response = client.post("/api/auth/login", json={
+        "phone_or_email": PASSENGER_PHONE, "password": "password123", "user_type": "passenger",
+    })
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["token"]
+    assert body["user"]["id"] == PASSENGER_ID
+
+
+def test_login_rejects_wrong_password(client):
+    response = client.post("/api/auth/login", json={
+        "phone_or_email": PASSENGER_PHONE, "password": "wrong", "user_type": "passenger",
+    })
+
+    assert response.status_code == 401
+
+
+def test_pending_feed_reports_unchanged_then_new_ride(client, server):
+    headers = _auth(server, MOTO_DRIVER_ID, "driver")
+    first = client.get("/api/rides/pending-feed", headers=headers).json()
+
+    unchanged = client.get("/api/rides/pending-feed", params={"since": first["version"]}, headers=headers).json()
+    ride = _open_ride(server)
+    changed = client.get("/api/rides/pending-feed", params={"since": first["version"]}, headers=headers).json()
+
+    assert first["changed"] is True
+    assert unchanged == {"version": first["version"], "changed": False, "rides": []}
+    assert changed["changed"] is True
+    assert changed["version"] != first["version"]
+    assert ride["id"] in [r["id"] for r in changed["rides"]]
+
+
+def test_pending_feed_is_scoped_to_the_driver_city(client, server):
+    server.supabase.table("drivers").update({"city": "Cap-Haïtien"}).eq("id", OTHER_CITY_DRIVER_ID).execute()
+    server.profile_changed(user_id=OTHER_CITY_DRIVER_ID)
+    ride = _open_ride(server)
+    legacy = _open_ride(server, city=None)
+
+    visible = [r["id"] for r in client.get(
+        "/api/rides/pending-feed", headers=_auth(server, OTHER_CITY_DRIVER_ID, "driver")
+    ).json()["rides"]]
+
+    assert ride["id"] not in visible
+    assert legacy["id"] in visible
+
+
+def test_otp_send_is_rate_limited_per_phone(client, fresh_limits):
+    phone = "+50937000042"
+    statuses = [client.post("/api/otp/send", json={"phone": phone}).status_code for _ in range(6)]
+
+    assert statuses == [200] * 5 + [429]
+    rejected = client.post("/api/otp/send", json={"phone": phone})
+    assert int(rejected.headers["retry-after"]) > 0
+    # Un autre numéro passe encore (limite par IP non atteinte)
+    assert client.post("/api/otp/send", json={"phone": "+50937000043"}).status_code == 200
+
+
+def test_otp_code_is_single_use(client, server, fresh_limits, monkeypatch):
+    # 123456 est accepté par le mode de démonstration: jamais tiré ici
+    monkeypatch.setattr(server, "generate_otp", lambda: "482913")
+    phone = "+50937000077"
+    code = client.post("/api/otp/send", json={"phone": phone}).json()["otp"]
+
+    first = client.post("/api/otp/verify", json={"phone": phone, "code": code})
+    second = client.post("/api/otp/verify", json={"phone": phone, "code": code})
+
+    assert first.status_code == 200
+    assert second.status_code == 400
+
+
+@pytest.mark.parametrize("path", ["/api/rides/pending-feed"])
+def test_driver_only_endpoints_reject_passengers(client, server, path):
+    assert client.get(path, headers=_auth(server, PASSENGER_ID, "passenger")).status_code == 403
@@ -0,0 +1,155 @@
+import asyncio
+import json
+import random
+import socket
+import time
+
+from services import invalidation
+from services.invalidation import InvalidatedCache, InvalidationBus, RedisInvalidationBus, UnixSocketBus
+
+
+def _remote(topic, key=None, seq=None, **fields):
+    event = {"topic": topic, "key": key, "origin": "other-host:1", "sent_at": 0, **fields}
+    if seq is not None:
+        event["seq"] = seq
+    return json.dumps(event).encode()
+
+
+def _loader(values):
+    def load():
+        values.append(len(values))
+        return values[-1]
+    return load
+
+
+def test_publish_calls_handlers_and_invalidates_cache():
+    bus = InvalidationBus()
+    seen = []
+    bus.subscribe("cities", lambda key, version: seen.append((key, version)))
+    cache = InvalidatedCache(bus, "cities")
+    loads = []
+
+    assert cache.get_or_load("all", _loader(loads)) == 0
+    assert cache.get_or_load("all", _loader(loads)) == 0
+    version = bus.publish("cities", "all", 123.0)
+
+    assert version == 123.0
+    assert seen == [("all", 123.0)]
+    assert cache.stats()["invalidations"] == 1
+    assert cache.get_or_load("all", _loader(loads)) == 1
+
+
+def test_load_started_before_invalidation_is_not_kept():
+    bus = InvalidationBus()
+    cache = InvalidatedCache(bus, "pricing")
+
+    def stale_loader():
+        # Écriture sur un autre worker pendant la lecture en base
+        bus.publish("pricing", "moto")
+        return "stale"
+
+    assert cache.get_or_load("moto", stale_loader) == "stale"
+    assert cache.get_or_load("moto", lambda: "fresh") == "fresh"
+    assert cache.get_or_load("moto", lambda: "unused") == "fresh"
+
+
+def test_remote_event_reaches_handlers():
+    bus = InvalidationBus()
+    cache = InvalidatedCache(bus, "landing")
+    messages = []
+    bus.on_message("ride_board", lambda key, data: messages.append((key, data)))
+    cache.get_or_load("page", lambda: "v1")
+
+    bus._receive(_remote("landing", "page", seq=1, version=1.0))
+    bus._receive(_remote("ride_board", "r1", seq=2, data={"op": "remove"}))
+
+    assert cache.get_or_load("page", lambda: "v2") == "v2"
+    assert messages == [("r1", {"op": "remove"})]
+    assert bus.stats()["received"] == 2
+
+
+def test_own_events_are_ignored():
+    bus = InvalidationBus()
+    seen = []
+    bus.subscribe("cities", lambda key, version: seen.append(key))
+    event = json.dumps({"topic": "cities", "key": "x", "version": 1.0, "origin": invalidation._origin(), "seq": 1})
+
+    bus._receive(event.encode())
+
+    assert seen == []
+
+
+def test_sequence_gap_invalidates_everything():
+    bus = InvalidationBus()
+    cache = InvalidatedCache(bus, "cities")
+    messages = []
+    bus.on_message("ride_board", lambda key, data: messages.append((key, data)))
+    cache.get_or_load("north", lambda: "old")
+
+    bus._receive(_remote("pricing", "moto", seq=1, version=1.0))
+    # Événements 2 et 3 perdus
+    bus._receive(_remote("pricing", "auto", seq=4, version=2.0))
+
+    assert bus.stats()["gaps"] == 1
+    assert messages == [(None, None)]
+    assert cache.get_or_load("north", lambda: "new") == "new"
+
+
+def test_first_event_from_an_origin_is_not_a_gap():
+    bus = InvalidationBus()
+    messages = []
+    bus.on_message("events", lambda key, data: messages.append((key, data)))
+
+    bus._receive(_remote("events", "u1", seq=57, data={"event": "ride"}))
+    bus._receive(_remote("events", "u1", seq=58, data={"event": "wallet"}))
+
+    assert bus.stats()["gaps"] == 0
+    assert [data["event"] for _, data in messages] == ["ride", "wallet"]
+
+
+def test_redis_publishes_keep_sequence_order():
+    class SlowRedis:
+        def __init__(self):
+            self.published = []
+
+        async def publish(self, channel, data):
+            # Connexions du pool plus ou moins lentes
+            await asyncio.sleep(random.random() / 1000)
+            self.published.append(json.loads(data)["seq"])
+
+    async def run():
+        client = SlowRedis()
+        bus = RedisInvalidationBus(client)
+        bus._listen = lambda: asyncio.sleep(0)
+        await bus.start()
+        for i in range(50):
+            bus.send("events", f"u{i}", {"event": "ride"})
+        await bus.stop()
+        return client.published
+
+    published = asyncio.run(run())
+    assert published == sorted(published)
+    assert len(published) == 50
+
+
+def test_unix_bus_drops_instead_of_blocking_on_a_full_peer(tmp_path):
+    peer = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+    peer.bind(str(tmp_path / "bus_1.sock"))
+
+    async def run():
+        bus = UnixSocketBus(str(tmp_path))
+        await bus.start()
+        started = time.monotonic()
+        for _ in range(2000):
+            bus.send("events", "u1", {"event": "ride", "data": {"pad": "x" * 512}})
+        elapsed = time.monotonic() - started
+        await bus.stop()
+        return bus, elapsed
+
+    try:
+        bus, elapsed = asyncio.run(run())
+    finally:
+        peer.close()
+    assert bus.stats()["dropped"] > 0
+    assert bus.stats()["send_errors"] == 0
+    assert elapsed < 1.0
@@ -0,0 +1,87 @@
+import asyncio
+
+from services.rate_limit import MemoryRateLimitBackend, RateLimiter, RateLimitRule, _buffer_body
+
+RULE = RateLimitRule("otp_send", "/api/otp/send", per_ip=(3, 60), per_identifier=(2, 60), identifier_fields=("phone",))
+
+
+def _scope(ip="10.0.0.1"):
+    return {"type": "http", "method": "POST", "path": "/api/otp/send", "headers": [], "client": (ip, 1234)}
+
+
+def _receive_from(messages, reads):
+    async def receive():
+        reads.append(1)
+        return messages.pop(0) if messages else {"type": "http.disconnect"}
+    return receive
+
+
+def _check(limiter, body, ip="10.0.0.1"):
+    reads = []
+    receive = _receive_from([{"type": "http.request", "body": body, "more_body": False}], reads)
+    retry_after, _ = asyncio.run(limiter.check(_scope(ip), receive))
+    return retry_after, reads
+
+
+def test_identifier_limit_applies_across_ips():
+    limiter = RateLimiter([RULE], backend=MemoryRateLimitBackend(), enabled=True, trust_proxy=0)
+    body = b'{"phone": "+50937000000"}'
+
+    assert _check(limiter, body, "10.0.0.1")[0] == 0
+    assert _check(limiter, body, "10.0.0.2")[0] == 0
+    retry_after, _ = _check(limiter, body, "10.0.0.3")
+
+    assert retry_after > 0
+    assert limiter.stats()["rejected"] == {"otp_send": 1}
+
+
+def test_blocked_ip_body_is_not_read():
+    limiter = RateLimiter([RULE], backend=MemoryRateLimitBackend(), enabled=True, trust_proxy=0)
+    for i in range(3):
+        _check(limiter, f'{{"phone": "+5093700000{i}"}}'.encode())
+
+    retry_after, reads = _check(limiter, b'{"phone": "+50937999999"}')
+
+    assert retry_after > 0
+    assert reads == []
+
+
+def test_large_body_is_not_buffered_but_replayed():
+    chunks = [b"x" * 40_000, b"y" * 40_000, b"z" * 40_000]
+    messages = [{"type": "http.request", "body": c, "more_body": i < 2} for i, c in enumerate(chunks)]
+    reads = []
+
+    async def run():
+        body, receive = await _buffer_body(_receive_from(messages, reads), max_size=64 * 1024)
+        replayed = []
+        while True:
+            message = await receive()
+            replayed.append(message["body"])
+            if not message.get("more_body"):
+                return body, replayed
+
+    body, replayed = asyncio.run(run())
+
+    assert body is None
+    assert b"".join(replayed) == b"".join(chunks)
+    # Lecture arrêtée après le dépassement: le dernier morceau vient de l'application
+    assert len(reads) == 3
+
+
+def test_memory_backend_evicts_least_recently_used_keys_only():
+    backend = MemoryRateLimitBackend(max_keys=100)
+
+    async def run():
+        for _ in range(2):
+            await backend.hit("otp:id:victim", 2, 60)
+        # Avalanche d'identifiants distincts
+        for i in range(1000):
+            await backend.hit(f"otp:id:{i}", 2, 60)
+            await backend.hit("otp:id:victim", 2, 60)
+        return await backend.hit("otp:id:victim", 2, 60)
+
+    allowed, retry_after = asyncio.run(run())
+
+    assert not allowed and retry_after > 0
+    assert backend.stats()["keys"] <= 100
+    assert backend.stats()["evicted"] > 0
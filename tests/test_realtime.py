@@ -0,0 +1,39 @@
+from services.realtime import EventBroker, parse_last_event_id
+
+
+def _fill(broker, user_id, count, noise=3):
+    ids = []
+    for i in range(count):
+        for _ in range(noise):
+            broker.publish("someone-else", "ride", {})
+        ids.append(broker.publish(user_id, "notification", {"n": i}))
+    return ids
+
+
+def test_last_event_just_evicted_is_not_a_gap():
+    broker = EventBroker(buffer_size=3)
+    ids = _fill(broker, "u1", 5)
+
+    events, gap = broker.events_since("u1", ids[1])
+
+    assert not gap
+    assert [e[0] for e in events] == ids[2:]
+
+
+def test_lost_events_are_a_gap():
+    broker = EventBroker(buffer_size=3)
+    ids = _fill(broker, "u1", 5)
+
+    events, gap = broker.events_since("u1", ids[0])
+
+    assert gap
+    assert [e[0] for e in events] == ids[2:]
+
+
+def test_id_from_another_epoch_requires_resync():
+    broker = EventBroker()
+    seq = broker.publish("u1", "wallet", {})
+
+    assert broker.resolve(parse_last_event_id(broker.format_id(seq))) == (seq, False)
+    assert broker.resolve(parse_last_event_id(f"other.1:{seq}")) == (None, True)
+    assert broker.resolve(parse_last_event_id(str(seq))) == (None, True)